@@ -0,0 +1,231 @@
+"""
+Статистика рынка по городам: квантили цены за сутки по месяцам и число
+доступных объявлений по неделям.
+
+Сводки хранятся между запусками и обновляются только на разницу: вклад
+объявления добавляется, когда оно появляется, и пересчитывается, если
+изменились его цена, город или даты. Истекшие объявления остаются в статистике
+(они были на рынке), но перестают отслеживаться, поэтому стоимость запуска
+зависит от числа актуальных и изменившихся объявлений, а не от всей истории
+"""
+
+import json
+import logging
+import math
+import os
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from scripts.models import Listing
+
+logger = logging.getLogger(__name__)
+
+# Версия формата состояния; при изменении правил вклада состояние строится заново
+AGGREGATES_VERSION = 2
+
+# Относительная точность оценки квантилей
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+# Длинные периоды учитываются в доступности не дальше этого числа недель
+MAX_AVAILABILITY_WEEKS = 26
+
+class QuantileSketch:
+    """
+    Скетч квантилей с логарифмическими корзинами (как DDSketch): значение x
+    попадает в корзину ceil(log_gamma(x)), и оценка любого квантиля отличается
+    от истинной не больше чем на RELATIVE_ACCURACY. Скетчи складываются
+    поэлементно, значения можно удалять
+    """
+
+    def __init__(self, bins: Optional[Dict[int, int]] = None):
+        self.bins: Dict[int, int] = bins or {}
+
+    @property
+    def count(self) -> int:
+        return sum(self.bins.values())
+
+    def add(self, value: float, weight: int = 1):
+        key = math.ceil(math.log(value) / LOG_GAMMA)
+        count = self.bins.get(key, 0) + weight
+        if count > 0:
+            self.bins[key] = count
+        else:
+            self.bins.pop(key, None)
+
+    def remove(self, value: float):
+        self.add(value, -1)
+
+    def merge(self, other: 'QuantileSketch'):
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Оценка квантиля q (0..1); None для пустого скетча
+        """
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return 2 * GAMMA ** key / (GAMMA + 1)
+        return 2 * GAMMA ** max(self.bins) / (GAMMA + 1)
+
+    def to_dict(self) -> Dict[str, int]:
+        return {str(key): count for key, count in self.bins.items()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, int]) -> 'QuantileSketch':
+        return cls({int(key): count for key, count in data.items()})
+
+def week_key(day: date) -> str:
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+def listing_contribution(listing: Listing) -> Optional[Dict[str, Any]]:
+    """
+    Вклад объявления в статистику: город, месяц и цена за сутки, недели доступности.
+    Месяц - начало первого периода аренды (или дата публикации).
+    Периоды без одной из дат в доступности не учитываются
+    """
+    if not listing.city_key:
+        return None
+    starts = [period.start for period in listing.rental_periods if period.start]
+    month = (min(starts) if starts else listing.date.date()).strftime('%Y-%m')
+    weeks = set()
+    for period in listing.rental_periods:
+        if not period.start or not period.end or period.end < period.start:
+            continue
+        monday = period.start - timedelta(days=period.start.weekday())
+        for offset in range(MAX_AVAILABILITY_WEEKS):
+            day = monday + timedelta(weeks=offset)
+            if day > period.end:
+                break
+            weeks.add(week_key(day))
+    # price_eur уже указана за сутки
+    if not listing.price_eur and not weeks:
+        return None
+    return {'city': listing.city_key, 'month': month, 'price': listing.price_eur or None, 'weeks': sorted(weeks)}
+
+class MarketAggregates:
+    """
+    Сводки по городам с состоянием в state_file: скетчи цен по (город, месяц),
+    счетчики доступности по (город, неделя) и вклад отслеживаемых объявлений
+    """
+
+    def __init__(self, state_file: str):
+        self.state_file = state_file
+        state = self._load()
+        self.prices = {
+            city: {month: QuantileSketch.from_dict(bins) for month, bins in months.items()}
+            for city, months in state.get('prices', {}).items()
+        }
+        self.availability: Dict[str, Dict[str, int]] = state.get('availability', {})
+        self.names: Dict[str, str] = state.get('names', {})
+        self.tracked: Dict[str, Dict[str, Any]] = state.get('tracked', {})
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            if os.path.exists(self.state_file):
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get('version') == AGGREGATES_VERSION:
+                    return state
+        except Exception as e:
+            logger.error(f"Error loading aggregates state {self.state_file}: {e}")
+        return {}
+
+    def save(self):
+        """
+        Сохраняет состояние (атомарно, через временный файл)
+        """
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': AGGREGATES_VERSION,
+                'prices': {
+                    city: {month: sketch.to_dict() for month, sketch in months.items()}
+                    for city, months in self.prices.items()
+                },
+                'availability': self.availability,
+                'names': self.names,
+                'tracked': self.tracked
+            }, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.state_file)
+
+    def _apply(self, contribution: Dict[str, Any], sign: int):
+        city = contribution['city']
+        if contribution['price']:
+            months = self.prices.setdefault(city, {})
+            sketch = months.setdefault(contribution['month'], QuantileSketch())
+            sketch.add(contribution['price'], sign)
+            if not sketch.bins:
+                del months[contribution['month']]
+        weeks = self.availability.setdefault(city, {})
+        for week in contribution['weeks']:
+            count = weeks.get(week, 0) + sign
+            if count > 0:
+                weeks[week] = count
+            else:
+                weeks.pop(week, None)
+
+    def update(self, listings: List[Listing]) -> Dict[str, int]:
+        """
+        Приводит сводки к актуальным объявлениям: добавляет вклад новых,
+        пересчитывает изменившиеся. Возвращает статистику изменений
+        """
+        current = {}
+        stats = {'added': 0, 'changed': 0, 'released': 0}
+        for listing in listings:
+            contribution = listing_contribution(listing)
+            if contribution is None:
+                continue
+            listing_id = str(listing.id)
+            current[listing_id] = contribution
+            self.names[contribution['city']] = listing.city or contribution['city']
+            previous = self.tracked.get(listing_id)
+            if previous == contribution:
+                continue
+            if previous is not None:
+                self._apply(previous, -1)
+                stats['changed'] += 1
+            else:
+                stats['added'] += 1
+            self._apply(contribution, 1)
+        stats['released'] = len(set(self.tracked) - set(current))
+        self.tracked = current
+        return stats
+
+    def summary(self, today: date, weeks_ahead: int = 12) -> Dict[str, Any]:
+        """
+        Сводка для страницы и stats.json: по каждому городу квантили цены за сутки
+        по месяцам и доступность по неделям (для страницы - начиная с текущей)
+        """
+        cities = {}
+        for city in sorted(set(self.prices) | set(self.availability)):
+            months = self.prices.get(city, {})
+            prices = {
+                month: {
+                    'count': sketch.count,
+                    **{f"p{round(q * 100)}": round(sketch.quantile(q), 2) for q in QUANTILES}
+                }
+                for month, sketch in sorted(months.items())
+            }
+            availability = dict(sorted(self.availability.get(city, {}).items()))
+            upcoming = [week_key(today + timedelta(weeks=offset)) for offset in range(weeks_ahead)]
+            cities[city] = {
+                'name': self.names.get(city, city),
+                'listings': sum(price['count'] for price in prices.values()),
+                'prices': prices,
+                'availability': availability,
+                'upcoming': [(week, availability.get(week, 0)) for week in upcoming]
+            }
+        return cities
@@ -0,0 +1,336 @@
+"""
+Пост-обработка сгенерированного сайта: минификация HTML/CSS/JS и
+предварительно сжатые .gz/.br копии текстовых файлов
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен, без него создаются только .gz
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Текстовые файлы, для которых создаются сжатые копии
+TEXT_EXTENSIONS = ('.html', '.css', '.js', '.json', '.xml', '.svg')
+SIDECAR_EXTENSIONS = ('.gz', '.br')
+
+_PROTECTED_RE = re.compile(
+    r'(<(script|style|pre|textarea)\b[^>]*>)(.*?)(</\2\s*>)',
+    re.S | re.I
+)
+_JS_TYPE_RE = re.compile(r'\btype\s*=\s*["\']?([^"\'\s>]+)', re.I)
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+
+def minify_css(css: str) -> str:
+    """
+    Удаляет комментарии и лишние пробелы из CSS
+    """
+    css = _CSS_COMMENT_RE.sub('', css)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    css = css.replace(';}', '}')
+    return css.strip()
+
+def _scan_js_line(line: str, stack: List[str]) -> List[str]:
+    """
+    Обновляет стек контекстов JS после строки: ` - шаблонная строка, ${ и { -
+    выражение внутри нее, /* - многострочный комментарий, ' и " - строка,
+    продолженная обратной косой чертой. Пустой стек - обычный код.
+    Литералы регулярных выражений не распознаются
+    """
+    position = 0
+    while position < len(line):
+        top = stack[-1] if stack else None
+        char = line[position]
+        if top == '/*':
+            end = line.find('*/', position)
+            if end == -1:
+                return stack
+            stack.pop()
+            position = end + 2
+            continue
+        if top in ('`', "'", '"'):
+            if char == '\\':
+                position += 2
+                continue
+            if char == top:
+                stack.pop()
+            elif top == '`' and line.startswith('${', position):
+                stack.append('${')
+                position += 2
+                continue
+            position += 1
+            continue
+        if line.startswith('//', position):
+            break
+        if line.startswith('/*', position):
+            stack.append('/*')
+            position += 2
+            continue
+        if char in '`\'"':
+            stack.append(char)
+        elif char == '{' and top in ('${', '{'):
+            stack.append('{')
+        elif char == '}' and top in ('${', '{'):
+            stack.pop()
+        position += 1
+    # Незакрытая кавычка без продолжения строки - скорее всего часть регулярного выражения
+    if stack and stack[-1] in ("'", '"') and not line.endswith('\\'):
+        stack.pop()
+    return stack
+
+def minify_js(js: str) -> str:
+    """
+    Консервативная минификация JS: убирает отступы, пустые строки и строки,
+    состоящие только из комментария. Переводы строк сохраняются, чтобы не
+    зависеть от автоматической расстановки точек с запятой. Строки внутри
+    шаблонных и многострочных строковых литералов остаются без изменений
+    """
+    lines = []
+    stack: List[str] = []
+    for line in js.splitlines():
+        in_literal = bool(stack) and stack[-1] in ('`', "'", '"')
+        stack = _scan_js_line(line, stack)
+        if in_literal:
+            lines.append(line)
+            continue
+        # Пробелы в конце строки значимы, если литерал продолжается на следующей
+        line = line.lstrip() if stack and stack[-1] in ('`', "'", '"') else line.strip()
+        if not line or line.startswith('//'):
+            continue
+        lines.append(line)
+    return '\n'.join(lines)
+
+def _is_javascript(open_tag: str) -> bool:
+    match = _JS_TYPE_RE.search(open_tag)
+    return not match or match.group(1).lower() in ('text/javascript', 'application/javascript', 'module')
+
+def _collapse_whitespace(fragment: str) -> str:
+    # Схлопываем только пробелы между тегами, текст внутри элементов не трогаем
+    fragment = re.sub(r'>\s+<', '> <', fragment)
+    # Отступы в начале и конце строк не влияют на отображение (кроме <pre>)
+    fragment = re.sub(r'\n[ \t]+', '\n', fragment)
+    fragment = re.sub(r'[ \t]+\n', '\n', fragment)
+    fragment = re.sub(r'^\s+', ' ', fragment)
+    return re.sub(r'\s+$', ' ', fragment)
+
+def minify_html(html: str) -> str:
+    """
+    Минифицирует HTML, включая встроенные <style> и <script>.
+    Содержимое <pre> и <textarea> остается без изменений
+    """
+    parts = []
+    position = 0
+    for match in _PROTECTED_RE.finditer(html):
+        parts.append(_collapse_whitespace(html[position:match.start()]))
+        open_tag, tag, body, close_tag = match.groups()
+        tag = tag.lower()
+        if tag == 'style':
+            body = minify_css(body)
+        elif tag == 'script' and _is_javascript(open_tag):
+            body = minify_js(body)
+        parts.append(open_tag + body + close_tag)
+        position = match.end()
+    parts.append(_collapse_whitespace(html[position:]))
+    return ''.join(parts).strip()
+
+MINIFIERS = {
+    '.html': minify_html,
+    '.css': minify_css,
+    '.js': minify_js,
+}
+
+# Заголовки для хостингов, поддерживающих файл _headers (Netlify, Cloudflare Pages):
+# файлы с хэшем в имени никогда не меняются и кэшируются навсегда
+IMMUTABLE_HEADERS = """/css/bundle.*
+  Cache-Control: public, max-age=31536000, immutable
+/js/bundle.*
+  Cache-Control: public, max-age=31536000, immutable
+"""
+
+# Ленты меняются только с новыми объявлениями: короткий кэш и проверка по ETag
+FEED_HEADERS = """/feeds/*
+  Cache-Control: public, max-age=600, must-revalidate
+"""
+
+def _read_text(path: str) -> str:
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def _write_fingerprinted(output_dir: str, subdir: str, name: str, ext: str, content: str) -> str:
+    """
+    Записывает файл с хэшем содержимого в имени и удаляет предыдущие версии.
+    Возвращает путь относительно корня сайта
+    """
+    data = content.encode('utf-8')
+    filename = f"{name}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+    directory = os.path.join(output_dir, subdir)
+    os.makedirs(directory, exist_ok=True)
+
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    pattern = re.compile(rf'^{re.escape(name)}\.[0-9a-f]{{10}}{re.escape(ext)}$')
+    for file in os.listdir(directory):
+        if file != filename and pattern.match(file):
+            os.remove(os.path.join(directory, file))
+
+    return f"{subdir}/{filename}"
+
+def build_asset_bundle(output_dir: str, vendor_dir: str,
+                       vendor_css: Sequence[Tuple[str, str]], vendor_js: Sequence[Tuple[str, str]],
+                       vendor_fonts: Sequence[Tuple[str, str]],
+                       local_css: Sequence[str], local_js: Sequence[str]) -> Dict[str, Any]:
+    """
+    Склеивает локальные копии сторонних зависимостей и собственные CSS/JS сайта
+    в два бандла с хэшем содержимого в имени (css/bundle.<hash>.css и
+    js/bundle.<hash>.js). Зависимости без локальной копии (см.
+    scripts/vendor_assets.py) подключаются с CDN, как раньше
+    """
+    assets = {'css': None, 'js': None, 'external_css': [], 'external_js': []}
+
+    for kind, vendor, local, separator in (
+        ('css', vendor_css, local_css, '\n'),
+        ('js', vendor_js, local_js, '\n;\n')
+    ):
+        # Порядок подключения важен (плагины после библиотек), поэтому если хотя бы
+        # одной локальной копии нет, все зависимости этого типа берутся с CDN
+        missing = [rel_path for rel_path, _ in vendor if not os.path.exists(os.path.join(vendor_dir, rel_path))]
+        parts = []
+        if missing:
+            logger.warning(f"Vendor assets not found: {', '.join(missing)}; loading {kind} dependencies from CDN "
+                           f"(run scripts/vendor_assets.py to download them)")
+            assets[f'external_{kind}'] = [url for _, url in vendor]
+        else:
+            parts.extend(_read_text(os.path.join(vendor_dir, rel_path)) for rel_path, _ in vendor)
+        parts.extend(_read_text(path) for path in local if os.path.exists(path))
+        assets[kind] = _write_fingerprinted(output_dir, kind, 'bundle', f'.{kind}', separator.join(parts))
+
+    # Шрифты иконок лежат рядом с CSS бандлом, пути в bootstrap-icons.css относительные
+    for rel_path, _ in vendor_fonts:
+        src = os.path.join(vendor_dir, rel_path)
+        dst = os.path.join(output_dir, 'css', rel_path)
+        if os.path.exists(src) and (not os.path.exists(dst) or os.path.getsize(src) != os.path.getsize(dst)):
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(src, dst)
+
+    with open(os.path.join(output_dir, '_headers'), 'w', encoding='utf-8') as f:
+        f.write(IMMUTABLE_HEADERS + FEED_HEADERS)
+
+    return assets
+
+def _compress(path: str, data: bytes) -> Dict[str, int]:
+    """
+    Записывает сжатые копии файла и возвращает их размеры
+    """
+    sizes = {}
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    with open(f"{path}.gz", 'wb') as f:
+        f.write(compressed)
+    sizes['gzip'] = len(compressed)
+
+    if brotli is not None:
+        compressed = brotli.compress(data, quality=11)
+        with open(f"{path}.br", 'wb') as f:
+            f.write(compressed)
+        sizes['brotli'] = len(compressed)
+    return sizes
+
+def _sidecars_exist(path: str) -> bool:
+    if not os.path.exists(f"{path}.gz"):
+        return False
+    return brotli is None or os.path.exists(f"{path}.br")
+
+def _load_manifest(manifest_file: str) -> Dict[str, Any]:
+    try:
+        if os.path.exists(manifest_file):
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading assets manifest {manifest_file}: {e}")
+    return {}
+
+def _save_manifest(manifest_file: str, manifest: Dict[str, Any]):
+    os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+    with open(manifest_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+def _remove_stale_sidecars(output_dir: str):
+    for root, _, files in os.walk(output_dir):
+        for file in files:
+            if file.endswith(SIDECAR_EXTENSIONS) and not os.path.exists(os.path.join(root, file[:-3])):
+                os.remove(os.path.join(root, file))
+
+def optimize_output(output_dir: str, manifest_file: str, minify: bool = True,
+                    precompress: bool = True, max_workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Минифицирует текстовые файлы сайта и создает для них .gz/.br копии.
+
+    Сжимаются только файлы, содержимое которых изменилось с прошлого запуска
+    (по хэшу из манифеста). Сжатие выполняется параллельно: zlib и brotli
+    отпускают GIL. Возвращает отчет о размерах для каждого файла
+    """
+    previous = _load_manifest(manifest_file)
+    manifest = {}
+    pending = []
+
+    for root, _, files in os.walk(output_dir):
+        for file in sorted(files):
+            if not file.endswith(TEXT_EXTENSIONS):
+                continue
+            path = os.path.join(root, file)
+            rel_path = os.path.relpath(path, output_dir)
+
+            with open(path, 'rb') as f:
+                data = f.read()
+            original_size = len(data)
+
+            minifier = MINIFIERS.get(os.path.splitext(file)[1])
+            if minify and minifier:
+                minified = minifier(data.decode('utf-8')).encode('utf-8')
+                if minified != data:
+                    data = minified
+                    with open(path, 'wb') as f:
+                        f.write(data)
+
+            entry = {
+                'sha256': hashlib.sha256(data).hexdigest(),
+                'original': original_size,
+                'size': len(data),
+            }
+            old_entry = previous.get(rel_path, {})
+            if precompress:
+                if old_entry.get('sha256') == entry['sha256'] and _sidecars_exist(path):
+                    entry.update({key: old_entry[key] for key in ('gzip', 'brotli') if key in old_entry})
+                else:
+                    pending.append((rel_path, path, data))
+            manifest[rel_path] = entry
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(lambda item: _compress(item[1], item[2]), pending)
+            for (rel_path, _, _), sizes in zip(pending, results):
+                manifest[rel_path].update(sizes)
+
+    if precompress:
+        _remove_stale_sidecars(output_dir)
+        if brotli is None:
+            logger.info("brotli is not installed, only .gz files are created")
+
+    _save_manifest(manifest_file, manifest)
+    logger.info(f"Optimized {len(manifest)} files, compressed {len(pending)} changed files")
+
+    return [dict(path=rel_path, **entry) for rel_path, entry in sorted(manifest.items())]
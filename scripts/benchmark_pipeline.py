@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк этапов обновления сайта на синтетическом чате.
+Telegram и OpenAI заменены офлайн-заглушками, все файлы пишутся во временную директорию
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import logging
+import resource
+import tempfile
+import contextlib
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Добавляем путь к корню проекта
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import DATA_DIR
+from scripts.models import Listing
+from scripts.synthetic_corpus import generate_chat, CITIES
+from scripts.render_cache import RenderCache
+from scripts.gazetteer import ReviewQueue
+from scripts import data_collector, enrich_data, generate_site
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+PIPELINE_RESULTS_FILE = os.path.join(DATA_DIR, 'benchmarks', 'pipeline.json')
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+# Страниц объявлений и фотографий больше этого числа не создаем: для 1M сообщений
+# это заняло бы часы и десятки гигабайт, поэтому скорость считается по выборке
+MAX_LISTING_PAGES = 5000
+MAX_MEDIA_FILES = 20000
+FILTER_QUERIES = 1000
+
+class StageTimer:
+    """
+    Замеряет длительность этапов и пропускную способность
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str, items: int):
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        self.stages[name] = {
+            'seconds': round(seconds, 4),
+            'items': items,
+            'items_per_second': round(items / seconds, 1) if seconds > 0 else None
+        }
+        logger.info(f"  {name:<24} {seconds:>9.3f} s  ({items} items)")
+
+def use_workdir(workdir: str):
+    """
+    Перенаправляет пути скриптов во временную директорию бенчмарка
+    """
+    data_dir = os.path.join(workdir, 'data')
+    output_dir = os.path.join(workdir, 'docs')
+    media_dir = os.path.join(data_dir, 'media')
+    os.makedirs(media_dir, exist_ok=True)
+
+    data_collector.LISTINGS_FILE = enrich_data.LISTINGS_FILE = os.path.join(data_dir, 'listings.json')
+    data_collector.MEDIA_DIR = generate_site.MEDIA_DIR = media_dir
+    data_collector.LISTINGS_ENRICHED_FILE = enrich_data.LISTINGS_ENRICHED_FILE = \
+        generate_site.LISTINGS_ENRICHED_FILE = os.path.join(data_dir, 'listings_enriched.json')
+    enrich_data.LISTINGS_ARCHIVE_FILE = os.path.join(data_dir, 'listings_archive.jsonl')
+    enrich_data.LEGACY_LISTINGS_ARCHIVE_FILE = os.path.join(data_dir, 'listings_archive.json')
+    enrich_data.review_queue = ReviewQueue(os.path.join(data_dir, 'city_review.json'))
+    generate_site.OUTPUT_DIR = output_dir
+    generate_site.ASSETS_MANIFEST_FILE = os.path.join(data_dir, 'assets_manifest.json')
+    generate_site.SEARCH_INDEX_STATE_FILE = os.path.join(data_dir, 'search_index_state.json')
+    generate_site.AGGREGATES_STATE_FILE = os.path.join(data_dir, 'aggregates_state.json')
+    generate_site.render_cache = RenderCache(
+        os.path.join(data_dir, 'render_cache.json'), generate_site.get_renderer_version
+    )
+    return data_dir, output_dir, media_dir
+
+def run_filter_queries(listings: List[Listing], queries: int, seed: int) -> int:
+    """
+    Повторяет логику фильтра на странице: пересечение с выбранным периодом через
+    индекс дат и фильтр по городу. Возвращает суммарное число найденных карточек
+    """
+    index = generate_site.build_date_index(listings)
+    rng = random.Random(seed)
+    day_numbers = [start for start in index.starts if start is not None] or [0]
+    cities = [city for city, _, _, _ in CITIES]
+    found = 0
+    for _ in range(queries):
+        start = rng.choice(day_numbers)
+        matches = index.query(start, start + rng.randint(7, 60))
+        city = rng.choice(cities + [None])
+        found += sum(
+            1 for position in matches
+            if city is None or listings[position].city == city
+        )
+    return found
+
+def benchmark_size(size: int, seed: int, workdir: str) -> Dict:
+    """
+    Прогоняет все этапы для чата из size сообщений
+    """
+    logger.info(f"Benchmarking {size} messages")
+    timer = StageTimer()
+    data_dir, output_dir, media_dir = use_workdir(workdir)
+
+    corpus = list(generate_chat(size, seed=seed))
+    answers = {message['text']: extracted for message, extracted in corpus}
+
+    # Сбор: сообщения из заглушки Telegram добавляются в хранилище
+    raw_data = {'listings': []}
+    with timer.stage('collect_bookkeeping', size):
+        data_collector.add_new_messages(
+            raw_data, (Listing.from_dict(message) for message, _ in corpus)
+        )
+
+    with timer.stage('raw_save', size):
+        data_collector.save_data(raw_data)
+    with timer.stage('raw_load', size):
+        raw_data = data_collector.load_existing_data()
+
+    # Обогащение: вместо OpenAI ответ берется из сгенерированного корпуса
+    original_extract = enrich_data.extract_info_from_text
+    enrich_data.extract_info_from_text = lambda text: answers[text]
+    try:
+        empty = {'listings': []}
+        with timer.stage('enrich_find_new', size):
+            new_listings = enrich_data.find_new_listings(raw_data, empty, set())
+        with timer.stage('enrich_listings', len(new_listings)):
+            newly_enriched = [enrich_data.enrich_listing(listing) for listing in new_listings]
+        with timer.stage('enrich_merge', len(newly_enriched)):
+            enriched_data, archived_data = enrich_data.merge_enriched(empty, newly_enriched)
+    finally:
+        enrich_data.extract_info_from_text = original_extract
+    del new_listings, newly_enriched
+
+    with timer.stage('enriched_save', len(enriched_data['listings'])):
+        enrich_data.save_results(enriched_data, archived_data)
+    with timer.stage('enriched_load', len(enriched_data['listings'])):
+        enriched_data = enrich_data.load_json_file(enrich_data.LISTINGS_ENRICHED_FILE)
+
+    # Загрузка объявлений для сайта (разбор дат входит в Listing.from_dict)
+    with timer.stage('load_listings', len(enriched_data['listings'])):
+        listings_by_type, last_data_update, all_listings = generate_site.load_listings(enriched_data)
+
+    # Рендеринг
+    env = generate_site.create_environment()
+    last_updated = generate_site.get_formatted_now()
+    on_pages = sum(len(listings) for listings in listings_by_type.values())
+    with timer.stage('render_category_pages', on_pages):
+        generate_site.render_category_pages(env, listings_by_type, last_updated, last_data_update)
+
+    with timer.stage('match_listings', len(all_listings)):
+        matches = generate_site.find_listing_matches(all_listings)
+
+    sample = [listing for listing in all_listings if not listing.photo_paths][:MAX_LISTING_PAGES]
+    with timer.stage('render_listing_pages', len(sample)):
+        for listing in sample:
+            generate_site.render_listing(env, listing, last_updated, last_data_update, matches.get(listing.id))
+
+    # Синхронизация медиа: пустые файлы вместо фотографий
+    photos = [
+        os.path.basename(path)
+        for listing in all_listings for path in (listing.photo_paths or [])
+    ][:MAX_MEDIA_FILES]
+    for filename in photos:
+        open(os.path.join(media_dir, filename), 'wb').close()
+    with timer.stage('media_sync', len(photos)):
+        generate_site.copy_media()
+    with timer.stage('media_sync_unchanged', len(photos)):
+        generate_site.copy_media()
+
+    with timer.stage('finalize_site', on_pages + len(sample)):
+        generate_site.finalize_site()
+
+    # Клиентский фильтр: индекс дат и запросы по случайным периодам
+    renting = listings_by_type.get('renting_out', [])
+    with timer.stage('filter_build_index', len(renting)):
+        generate_site.build_date_index(renting)
+    with timer.stage('filter_queries', FILTER_QUERIES):
+        run_filter_queries(renting, FILTER_QUERIES, seed)
+
+    sizes = {
+        'raw_json_bytes': os.path.getsize(data_collector.LISTINGS_FILE),
+        'enriched_json_bytes': os.path.getsize(enrich_data.LISTINGS_ENRICHED_FILE),
+        'output_bytes': sum(
+            os.path.getsize(os.path.join(root, file))
+            for root, _, files in os.walk(output_dir) for file in files
+        )
+    }
+    return {
+        'messages': size,
+        'stages': timer.stages,
+        'files': sizes,
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+def compare_with_baseline(current: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """
+    Возвращает список этапов, замедлившихся относительно базового замера
+    """
+    regressions = []
+    for size, result in current['sizes'].items():
+        base = baseline.get('sizes', {}).get(size)
+        if not base:
+            continue
+        for stage, timing in result['stages'].items():
+            base_timing = base['stages'].get(stage)
+            # Очень короткие этапы слишком шумные для сравнения
+            if not base_timing or base_timing['seconds'] < 0.05:
+                continue
+            ratio = timing['seconds'] / base_timing['seconds']
+            if ratio > 1 + max_regression:
+                regressions.append(
+                    f"{size} messages, {stage}: {base_timing['seconds']:.3f} s -> "
+                    f"{timing['seconds']:.3f} s (+{(ratio - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+def print_report(results: Dict, baseline: Optional[Dict]):
+    """
+    Печатает таблицу результатов по размерам чата
+    """
+    for size, result in results['sizes'].items():
+        base = (baseline or {}).get('sizes', {}).get(size, {}).get('stages', {})
+        print(f"\n{size} messages (peak RSS {result['peak_rss_mb']} MB)")
+        print(f"{'stage':<24} {'seconds':>9} {'items/s':>12} {'baseline, s':>12}")
+        for stage, timing in result['stages'].items():
+            base_seconds = f"{base[stage]['seconds']:.3f}" if stage in base else '-'
+            rate = f"{timing['items_per_second']:.0f}" if timing['items_per_second'] else '-'
+            print(f"{stage:<24} {timing['seconds']:>9.3f} {rate:>12} {base_seconds:>12}")
+
+def main():
+    """
+    Точка входа в скрипт: при регрессии относительно базового замера завершается с кодом 1
+    """
+    parser = argparse.ArgumentParser(description='Бенчмарк этапов обработки на синтетическом чате')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Размеры чата в сообщениях (например, 1000 10000 100000 1000000)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed генератора сообщений')
+    parser.add_argument('--output', default=PIPELINE_RESULTS_FILE, help='Куда сохранить результаты в JSON')
+    parser.add_argument('--baseline', help='Результаты прошлого запуска в JSON для сравнения')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Допустимое относительное замедление этапа по сравнению с базовым замером (0.2 = 20%%)')
+    parser.add_argument('--keep', action='store_true', help='Не удалять временную рабочую директорию')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = {
+        'timestamp': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'seed': args.seed,
+        'sizes': {}
+    }
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp(prefix=f'sublet-bench-{size}-')
+        try:
+            results['sizes'][str(size)] = benchmark_size(size, args.seed, workdir)
+        finally:
+            if args.keep:
+                logger.info(f"Working directory kept at {workdir}")
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results, baseline)
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+    logger.info(f"Saved pipeline benchmark results to {args.output}")
+
+    if baseline:
+        regressions = compare_with_baseline(results, baseline, args.max_regression)
+        if regressions:
+            for regression in regressions:
+                logger.error(f"Pipeline regression: {regression}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
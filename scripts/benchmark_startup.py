@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк времени холодного старта скриптов по данным `python -X importtime`
+"""
+
+import os
+import sys
+import json
+import argparse
+import logging
+import statistics
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Добавляем путь к корню проекта
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import DATA_DIR
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_RESULTS_FILE = os.path.join(DATA_DIR, 'benchmarks', 'startup.json')
+
+# Модули, время импорта которых измеряется
+STARTUP_MODULES = [
+    'scripts.update_site',
+    'scripts.data_collector',
+    'scripts.enrich_data',
+    'scripts.generate_site',
+]
+
+# Тяжелые зависимости, которые должны загружаться только при запуске своего этапа
+HEAVY_PACKAGES = ['telethon', 'openai', 'jinja2', 'markdown2']
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """
+    Разбирает вывод -X importtime: строки вида
+    "import time:  self [us] | cumulative | imported package"
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            # Строка заголовка
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append({
+            'module': name.strip(),
+            'self_us': self_us,
+            'cumulative_us': cumulative_us,
+            'depth': depth
+        })
+    return imports
+
+def measure_module(module: str) -> Dict:
+    """
+    Импортирует модуль в новом процессе и возвращает результаты importtime
+    """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=PROJECT_ROOT,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Import of {module} failed:\n{result.stderr[-2000:]}")
+
+    imports = parse_importtime(result.stderr)
+    total_us = sum(item['self_us'] for item in imports)
+    # Модули верхнего уровня (depth 1) с наибольшим суммарным временем
+    top_level = sorted(
+        (item for item in imports if item['depth'] == 1),
+        key=lambda item: item['cumulative_us'],
+        reverse=True
+    )
+    loaded = {item['module'] for item in imports}
+    return {
+        'total_ms': total_us / 1000,
+        'top_imports': [
+            {'module': item['module'], 'cumulative_ms': item['cumulative_us'] / 1000}
+            for item in top_level[:10]
+        ],
+        'heavy_loaded': [package for package in HEAVY_PACKAGES if package in loaded]
+    }
+
+def run_benchmark(modules: List[str], repeat: int) -> Dict:
+    """
+    Замеряет каждый модуль несколько раз и берет медиану
+    """
+    results = {}
+    for module in modules:
+        runs = [measure_module(module) for _ in range(repeat)]
+        median_ms = statistics.median(run['total_ms'] for run in runs)
+        best = min(runs, key=lambda run: abs(run['total_ms'] - median_ms))
+        results[module] = {
+            'median_ms': round(median_ms, 2),
+            'min_ms': round(min(run['total_ms'] for run in runs), 2),
+            'top_imports': best['top_imports'],
+            'heavy_loaded': best['heavy_loaded']
+        }
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'repeat': repeat,
+        'modules': results
+    }
+
+def compare_with_baseline(current: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """
+    Возвращает список регрессий относительно базового замера
+    """
+    regressions = []
+    for module, result in current['modules'].items():
+        base = baseline.get('modules', {}).get(module)
+        if not base:
+            continue
+        ratio = result['median_ms'] / base['median_ms'] if base['median_ms'] else 1.0
+        if ratio > 1 + max_regression:
+            regressions.append(
+                f"{module}: {base['median_ms']:.1f} ms -> {result['median_ms']:.1f} ms (+{(ratio - 1) * 100:.0f}%)"
+            )
+        new_heavy = set(result['heavy_loaded']) - set(base.get('heavy_loaded', []))
+        if new_heavy:
+            regressions.append(f"{module}: now imports {', '.join(sorted(new_heavy))} at startup")
+    return regressions
+
+def print_report(results: Dict, baseline: Optional[Dict]):
+    """
+    Печатает таблицу результатов
+    """
+    print(f"{'module':<26} {'median, ms':>11} {'min, ms':>9} {'baseline, ms':>13}  heavy imports")
+    for module, result in results['modules'].items():
+        base = (baseline or {}).get('modules', {}).get(module)
+        base_ms = f"{base['median_ms']:.1f}" if base else '-'
+        heavy = ', '.join(result['heavy_loaded']) or '-'
+        print(f"{module:<26} {result['median_ms']:>11.1f} {result['min_ms']:>9.1f} {base_ms:>13}  {heavy}")
+        for item in result['top_imports'][:3]:
+            print(f"    {item['module']:<36} {item['cumulative_ms']:>8.1f} ms")
+
+def main():
+    """
+    Точка входа в скрипт: при регрессии относительно базового замера завершается с кодом 1
+    """
+    parser = argparse.ArgumentParser(description='Бенчмарк времени холодного старта скриптов')
+    parser.add_argument('--modules', nargs='+', default=STARTUP_MODULES, help='Импортируемые модули')
+    parser.add_argument('--repeat', type=int, default=5, help='Сколько раз импортировать каждый модуль в новом процессе')
+    parser.add_argument('--output', default=STARTUP_RESULTS_FILE, help='Куда сохранить результаты в JSON')
+    parser.add_argument('--baseline', help='Результаты прошлого запуска в JSON для сравнения')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Допустимое относительное замедление по сравнению с базовым замером (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = run_benchmark(args.modules, args.repeat)
+    print_report(results, baseline)
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+    logger.info(f"Saved startup benchmark results to {args.output}")
+
+    if baseline:
+        regressions = compare_with_baseline(results, baseline, args.max_regression)
+        if regressions:
+            for regression in regressions:
+                logger.error(f"Startup regression: {regression}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
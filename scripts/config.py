@@ -12,20 +12,77 @@ TELEGRAM_API_ID = os.getenv('TELEGRAM_API_ID')
 TELEGRAM_API_HASH = os.getenv('TELEGRAM_API_HASH')
 TELEGRAM_PHONE = os.getenv('TELEGRAM_PHONE')
 TELEGRAM_CHAT_NAME = os.getenv('TELEGRAM_CHAT_NAME')
+# Все собираемые чаты (id каналов через запятую); по умолчанию только TELEGRAM_CHAT_NAME.
+# Объявления без префикса чата в id собраны до поддержки нескольких чатов и относятся к TELEGRAM_CHAT_NAME
+TELEGRAM_CHATS = [chat.strip() for chat in os.getenv('TELEGRAM_CHATS', TELEGRAM_CHAT_NAME or '').split(',') if chat.strip()]
+TELEGRAM_REQUESTS_PER_SECOND = float(os.getenv('TELEGRAM_REQUESTS_PER_SECOND', '3'))  # Общий лимит запросов на все чаты
+CHECK_BATCH_SIZE = 100  # Сколько сохраненных сообщений проверяется на правки и удаление одним запросом
+CHECK_INTERVAL_HOURS = float(os.getenv('CHECK_INTERVAL_HOURS', '6'))  # Как часто объявления на сайте проверяются на правки и удаление
 
 # OpenAI configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# Каскад моделей обогащения, от дешевой к сильной: ответ следующей модели запрашивается,
+# только если предыдущая вернула некорректный ответ или низкую уверенность
+ENRICH_MODELS = [model.strip() for model in os.getenv('ENRICH_MODELS', 'gpt-4o-mini,gpt-4o').split(',') if model.strip()]
+ENRICH_MIN_CONFIDENCE = float(os.getenv('ENRICH_MIN_CONFIDENCE', '0.8'))  # Ниже - ответ перепроверяется следующей моделью
 
 # Data storage configuration
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
 LISTINGS_FILE = os.path.join(DATA_DIR, 'listings.json')
 LISTINGS_ENRICHED_FILE = os.path.join(DATA_DIR, 'listings_enriched.json')
+LISTINGS_ARCHIVE_FILE = os.path.join(DATA_DIR, 'listings_archive.jsonl')  # Истекшие объявления, JSON Lines, только дописывается
+LEGACY_LISTINGS_ARCHIVE_FILE = os.path.join(DATA_DIR, 'listings_archive.json')  # Архив старого формата, переводится в JSON Lines
 SESSION_FILE = os.path.join(DATA_DIR, 'telegram_session')
 MEDIA_DIR = os.path.join(DATA_DIR, 'media')  # Директория для хранения медиафайлов
+RENDER_CACHE_FILE = os.path.join(DATA_DIR, 'render_cache.json')  # Кэш рендеринга текста объявлений
+RENDER_CACHE_MAX_AGE_DAYS = 30  # Записи кэша рендеринга, не использованные дольше, удаляются
+ASSETS_MANIFEST_FILE = os.path.join(DATA_DIR, 'assets_manifest.json')  # Хэши и размеры файлов сайта
+TRACES_DIR = os.path.join(DATA_DIR, 'traces')  # Трассировки и профили запусков update_site
+RUN_STATE_FILE = os.path.join(DATA_DIR, 'run_state.json')  # Курсор сборщика и отпечатки входов этапов
+RUN_LOCK_FILE = os.path.join(DATA_DIR, 'update_site.lock')  # Блокировка от параллельных запусков
+SEARCH_INDEX_STATE_FILE = os.path.join(DATA_DIR, 'search_index_state.json')  # Термы объявлений для инкрементального поискового индекса
+CITY_REVIEW_FILE = os.path.join(DATA_DIR, 'city_review.json')  # Неизвестные справочнику названия городов
+AGGREGATES_STATE_FILE = os.path.join(DATA_DIR, 'aggregates_state.json')  # Сводки цен и доступности для страницы статистики
+GAZETTEER_FILE = os.path.join(os.path.dirname(__file__), 'gazetteer.json')  # Справочник городов и стран с алиасами
 
 # Website configuration
-TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'templates')
+SITE_URL = os.getenv('SITE_URL', 'https://akhvorov.github.io/sublet')  # Адрес сайта для абсолютных ссылок в лентах
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static')
+TEMPLATES_DIR = os.path.join(STATIC_DIR, 'templates')
+VENDOR_DIR = os.path.join(STATIC_DIR, 'vendor')  # Локальные копии сторонних front-end зависимостей
 OUTPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'docs')  # GitHub Pages uses /docs by default
+MINIFY_OUTPUT = os.getenv('MINIFY_OUTPUT', '1') == '1'  # Минифицировать HTML/CSS/JS
+PRECOMPRESS_OUTPUT = os.getenv('PRECOMPRESS_OUTPUT', '1') == '1'  # Создавать .gz/.br копии файлов
+# Публикация сайта: если задана ветка, содержимое OUTPUT_DIR коммитится в ее корень
+# (а не в docs/ текущей ветки), и история ветки обрезается до PUBLISH_HISTORY_DEPTH коммитов
+PUBLISH_BRANCH = os.getenv('PUBLISH_BRANCH')
+PUBLISH_HISTORY_DEPTH = int(os.getenv('PUBLISH_HISTORY_DEPTH', '10'))
+PUBLISH_REMOTE = os.getenv('PUBLISH_REMOTE', 'origin')  # Пустое значение - без пуша
+DEV_SERVER_PORT = int(os.getenv('DEV_SERVER_PORT', '8000'))  # Порт локального сервера scripts/dev_server.py
+DEV_WATCH_INTERVAL = 0.2  # Как часто сервер разработки проверяет изменения файлов (секунды)
+DEV_DIR = os.path.join(DATA_DIR, 'dev')  # Сайт и состояние сборки сервера разработки (не публикуются)
+FEED_SIZE = 50  # Сколько последних объявлений в каждой ленте Atom/JSON
+MATCHES_PER_LISTING = 5  # Сколько возможных совпадений показывать на странице объявления
+MATCH_PRICE_TOLERANCE = 0.2  # Насколько цена предложения может превышать бюджет ищущего (0.2 = 20%)
 
 # Time configuration
-TIMEZONE = 'Europe/Berlin'  # Центральноевропейское время 
+TIMEZONE = 'Europe/Berlin'  # Центральноевропейское время
+
+# Front-end assets configuration
+# Сторонние зависимости: путь внутри VENDOR_DIR и исходный URL (для scripts/vendor_assets.py).
+# Порядок важен: файлы склеиваются в бандл в этом порядке
+VENDOR_CSS = [
+    ('bootstrap.min.css', 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css'),
+    ('bootstrap-icons.css', 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/bootstrap-icons.css'),
+    ('litepicker.css', 'https://cdn.jsdelivr.net/npm/litepicker@2.0.12/dist/css/litepicker.css'),
+]
+VENDOR_JS = [
+    ('bootstrap.bundle.min.js', 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js'),
+    ('litepicker.js', 'https://cdn.jsdelivr.net/npm/litepicker@2.0.12/dist/litepicker.js'),
+    ('plugins/ranges.js', 'https://cdn.jsdelivr.net/npm/litepicker@2.0.12/dist/plugins/ranges.js'),
+]
+# Шрифты иконок, на которые ссылается bootstrap-icons.css (относительно CSS файла)
+VENDOR_FONTS = [
+    ('fonts/bootstrap-icons.woff2', 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/fonts/bootstrap-icons.woff2'),
+    ('fonts/bootstrap-icons.woff', 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/fonts/bootstrap-icons.woff'),
+]
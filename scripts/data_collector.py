@@ -3,13 +3,9 @@
 Скрипт для сбора данных из Telegram чата через пользовательский аккаунт
 """
 
-import json
 import logging
 from datetime import datetime, timedelta
 import asyncio
-from telethon import TelegramClient
-from telethon.errors import SessionPasswordNeededError, FloodWaitError
-from telethon.tl.types import PeerChannel, MessageMediaPhoto
 import pytz
 import sys
 import os
@@ -21,11 +17,27 @@ from scripts.config import (
     TELEGRAM_API_HASH,
     TELEGRAM_PHONE,
     TELEGRAM_CHAT_NAME,
+    TELEGRAM_CHATS,
+    TELEGRAM_REQUESTS_PER_SECOND,
+    CHECK_BATCH_SIZE,
     LISTINGS_FILE,
+    LISTINGS_ENRICHED_FILE,
     SESSION_FILE,
     TIMEZONE,
     MEDIA_DIR
 )
+from scripts.profiling import tracer, traced
+from scripts.models import (
+    Listing,
+    make_listing_id,
+    get_listing_chat,
+    get_message_id,
+    get_text_hash,
+    hash_text,
+    namespace_legacy_ids
+)
+from scripts.rate_limit import RateBudget
+from scripts.listing_store import iter_listings, load_document, write_listings
 
 # Настройка логирования
 logging.basicConfig(
@@ -34,14 +46,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Сколько сообщений истории запрашивается одним запросом (максимум Telegram)
+HISTORY_BATCH_SIZE = 100
+
 def load_existing_data():
     """
     Загрузка существующих данных из файла
     """
     try:
         if os.path.exists(LISTINGS_FILE):
-            with open(LISTINGS_FILE, 'r') as f:
-                return json.load(f)
+            data = load_document(LISTINGS_FILE)
+            # Сообщения, собранные до поддержки нескольких чатов, получают префикс чата
+            namespace_legacy_ids(data['listings'], TELEGRAM_CHAT_NAME)
+            return data
         return {"listings": []}
     except Exception as e:
         logger.error(f"Error loading existing data: {e}")
@@ -49,13 +66,32 @@ def load_existing_data():
 
 def save_data(data):
     """
-    Сохранение данных в JSON файл
+    Сохранение данных в JSON файл (по одному сообщению на строку)
+    """
+    metadata = {key: value for key, value in data.items() if key != 'listings'}
+    write_listings(LISTINGS_FILE, data['listings'], metadata)
+
+def get_message_link(chat_id, message_id):
+    """
+    Ссылка на сообщение канала
+    """
+    return f"https://t.me/c/{int(chat_id)}/{message_id}"
+
+def get_photo_path(chat_id, message_id, number):
+    """
+    Путь к фото объявления в MEDIA_DIR: имя строится из ID чата, ID сообщения
+    с текстом и порядкового номера сообщения в группе медиа
+    """
+    return os.path.join(MEDIA_DIR, f"photo_{chat_id}_{message_id}_{number}.jpg")
+
+def get_media_relpath(photo_path):
+    """
+    Путь к медиафайлу относительно корня репозитория (так он хранится в photo_paths)
     """
-    os.makedirs(os.path.dirname(LISTINGS_FILE), exist_ok=True)
-    with open(LISTINGS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    return os.path.relpath(photo_path, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-async def get_media_group(client, message):
+@traced()
+async def get_media_group(client, message, budget):
     """
     Получение всех сообщений из группы медиа
     """
@@ -63,6 +99,7 @@ async def get_media_group(client, message):
         return [message]
     
     try:
+        await budget.acquire()
         # Получаем все сообщения из группы
         messages = await client.get_messages(
             message.peer_id,
@@ -76,10 +113,14 @@ async def get_media_group(client, message):
         logger.error(f"Error getting media group for message {message.id}: {e}")
         return [message]
 
-async def download_photos(client, message, message_id):
+@traced()
+async def download_photos(client, message, chat_id, budget):
     """
     Скачивание всех фотографий из сообщения
     """
+    message_id = message.id
+    from telethon.tl.types import MessageMediaPhoto
+
     try:
         photo_paths = []
         
@@ -87,26 +128,23 @@ async def download_photos(client, message, message_id):
         os.makedirs(MEDIA_DIR, exist_ok=True)
 
         # Получаем все медиа из сообщения
-        message_media = await get_media_group(client, message)
+        message_media = await get_media_group(client, message, budget)
         
         for i, media_message in enumerate(message_media):
             if not media_message or not media_message.media or not isinstance(media_message.media, MessageMediaPhoto):
                 continue
 
-            # Генерируем имя файла на основе ID сообщения и порядкового номера фото
-            photo_filename = f"photo_{message_id}_{i+1}.jpg"
-            photo_path = os.path.join(MEDIA_DIR, photo_filename)
+            photo_path = get_photo_path(chat_id, message_id, i + 1)
 
             # Если файл уже существует, добавляем его путь
             if os.path.exists(photo_path):
-                rel_path = os.path.relpath(photo_path, os.path.dirname(os.path.dirname(__file__)))
-                photo_paths.append(rel_path)
+                photo_paths.append(get_media_relpath(photo_path))
                 continue
 
             # Скачиваем фото
+            await budget.acquire()
             await client.download_media(media_message.media, photo_path)
-            rel_path = os.path.relpath(photo_path, os.path.dirname(os.path.dirname(__file__)))
-            photo_paths.append(rel_path)
+            photo_paths.append(get_media_relpath(photo_path))
             logger.info(f"Downloaded photo {i+1} for message {message_id}")
 
         return photo_paths if photo_paths else None
@@ -115,17 +153,51 @@ async def download_photos(client, message, message_id):
         logger.error(f"Error downloading photos from message {message_id}: {e}")
         return None
 
-async def collect_messages(client, chat, since_date):
+def get_edit_date(message):
     """
-    Сбор сообщений из Telegram чата
+    Время последнего редактирования сообщения в TIMEZONE (None, если не редактировалось)
+    """
+    return message.edit_date.astimezone(pytz.timezone(TIMEZONE)) if message.edit_date else None
+
+async def iter_history(client, chat, budget):
+    """
+    История чата от новых сообщений к старым. Каждый пакет запрашивается
+    отдельным запросом после получения разрешения общего бюджета
+    """
+    from telethon.errors import FloodWaitError
+
+    offset_id = 0
+    while True:
+        await budget.acquire()
+        try:
+            batch = await client.get_messages(chat, limit=HISTORY_BATCH_SIZE, offset_id=offset_id)
+        except FloodWaitError as e:
+            # Пауза общая для всех чатов; пакет запрашивается заново после нее
+            logger.warning(f"Hit rate limit while fetching history, waiting {e.seconds} seconds")
+            budget.pause(e.seconds)
+            continue
+        for message in batch:
+            yield message
+        if len(batch) < HISTORY_BATCH_SIZE:
+            return
+        offset_id = batch[-1].id
+
+async def iter_messages(client, chat_id, since_date, budget):
+    """
+    Асинхронный генератор сообщений из Telegram чата, начиная с самых новых
     """
-    messages = []
+    from telethon.errors import FloodWaitError
+    from telethon.tl.types import MessageMediaPhoto
+
+    chat = get_chat(chat_id)
     processed_count = 0
-    batch_size = 100  # Размер пакета сообщений для обработки
+    batch_size = 100  # Как часто сообщать о прогрессе
     processed_groups = set()  # Множество для отслеживания обработанных групп
     
     try:
-        async for message in client.iter_messages(chat, limit=None):
+        # Паузы между запросами истории задает общий бюджет, а не telethon
+        messages = iter_history(client, chat, budget)
+        async for message in tracer.iterate(messages, 'telegram_fetch'):
             message_date = message.date.astimezone(pytz.timezone(TIMEZONE))
             if message_date < since_date:
                 break
@@ -145,24 +217,26 @@ async def collect_messages(client, chat, since_date):
             
             if message.text or (message.media and isinstance(message.media, MessageMediaPhoto)):
                 # Создаем ссылку на сообщение
-                message_link = f"https://t.me/c/{str(chat.channel_id)}/{message.id}"
+                message_link = get_message_link(chat.channel_id, message.id)
 
                 try:
                     # Скачиваем фото, если они есть
-                    photo_paths = await download_photos(client, message, message.id) if message.media else None
-
-                    messages.append({
-                        "id": message.id,
-                        "text": message.text or "",
-                        "date": message_date.isoformat(),
-                        "from_user": message.sender.username if message.sender else None,
-                        "media": bool(message.media),
-                        "photo_paths": photo_paths,
-                        "link": message_link
-                    })
+                    photo_paths = await download_photos(client, message, chat_id, budget) if message.media else None
+
+                    yield Listing(
+                        id=make_listing_id(chat_id, message.id),
+                        text=message.text or "",
+                        date=message_date,
+                        from_user=message.sender.username if message.sender else None,
+                        media=bool(message.media),
+                        photo_paths=photo_paths,
+                        link=message_link,
+                        edit_date=get_edit_date(message),
+                        text_hash=hash_text(message.text or "")
+                    )
                     
                     if photo_paths:
-                        logger.info(f"Downloaded {len(photo_paths)} photos for message {message.id}")
+                        logger.info(f"Downloaded {len(photo_paths)} photos for message {chat_id}:{message.id}")
 
                     # Если это групповое сообщение, помечаем группу как обработанную
                     if message.grouped_id:
@@ -170,33 +244,34 @@ async def collect_messages(client, chat, since_date):
 
                     processed_count += 1
                     if processed_count % batch_size == 0:
-                        logger.info(f"Processed {processed_count} messages")
+                        logger.info(f"Processed {processed_count} messages from chat {chat_id}")
 
                 except FloodWaitError as e:
+                    # Пауза общая для всех чатов, которые собираются этим клиентом
                     logger.warning(f"Hit rate limit, waiting {e.seconds} seconds")
-                    await asyncio.sleep(e.seconds)
+                    budget.pause(e.seconds)
                     continue
 
     except Exception as e:
-        logger.error(f"Error collecting messages: {e}")
+        logger.error(f"Error collecting messages from chat {chat_id}: {e}")
     
-    logger.info(f"Total messages processed: {processed_count}")
-    return messages
+    logger.info(f"Total messages processed from chat {chat_id}: {processed_count}")
 
-async def main():
+@traced()
+async def collect_messages(client, chat_id, since_date, budget):
     """
-    Основная функция для сбора данных
+    Сбор сообщений из Telegram чата
     """
-    parser = argparse.ArgumentParser(description='Сбор данных из Telegram чата')
-    parser.add_argument('--days', type=int, default=9, help='За сколько последних дней собирать данные')
-    args = parser.parse_args()
+    return [message async for message in iter_messages(client, chat_id, since_date, budget)]
 
-    if not all([TELEGRAM_API_ID, TELEGRAM_API_HASH, TELEGRAM_PHONE, TELEGRAM_CHAT_NAME]):
-        logger.error("Missing Telegram credentials")
-        return
+async def connect_client():
+    """
+    Создание клиента Telegram и авторизация
+    """
+    # telethon импортируется только когда этап сбора действительно запускается
+    from telethon import TelegramClient
+    from telethon.errors import SessionPasswordNeededError
 
-    logger.info("Starting data collection...")
-    
     # Создаем клиент и подключаемся
     client = TelegramClient(SESSION_FILE, TELEGRAM_API_ID, TELEGRAM_API_HASH)
     await client.start()
@@ -209,56 +284,262 @@ async def main():
         except SessionPasswordNeededError:
             await client.sign_in(password=input('Password: '))
     
+    return client
+
+def has_credentials():
+    """
+    Проверка наличия настроек Telegram
+    """
+    if not all([TELEGRAM_API_ID, TELEGRAM_API_HASH, TELEGRAM_PHONE, TELEGRAM_CHATS]):
+        logger.error("Missing Telegram credentials")
+        return False
+    return True
+
+def get_chat(chat_id):
+    """
+    PeerChannel для доступа к каналу
+    """
+    from telethon.tl.types import PeerChannel
+
+    return PeerChannel(int(chat_id))
+
+def create_budget():
+    """
+    Общий бюджет запросов для всех чатов одного клиента
+    """
+    return RateBudget(TELEGRAM_REQUESTS_PER_SECOND)
+
+def get_since_date(data, days, chat_id=None):
+    """
+    Определяет, с какой даты начинать сбор данных (по сообщениям указанного чата)
+    """
+    tz = pytz.timezone(TIMEZONE)
+    now = datetime.now(tz)
+    start_date = now - timedelta(days=days)
+    
+    listings = [
+        listing for listing in data["listings"]
+        if chat_id is None or get_listing_chat(listing["id"], TELEGRAM_CHAT_NAME) == str(chat_id)
+    ]
+    if listings:
+        try:
+            # Находим самое новое сообщение в существующих данных
+            newest_message_date = datetime.fromisoformat(max(
+                listing["date"] for listing in listings
+            ))
+            # Окно ограничено последними days днями (в них проверяются правки), но если
+            # сбор давно не запускался, начинаем с последнего сохраненного сообщения,
+            # чтобы не пропустить промежуток. Старые сообщения повторно не запрашиваются
+            return min(newest_message_date, start_date)
+        except ValueError:
+            return start_date
+    return start_date
+
+def update_message(record, message):
+    """
+    Обновляет сохраненную запись по свежей версии сообщения.
+    Возвращает True, если изменился текст (объявление нужно обогатить заново)
+    """
+    if message.edit_date:
+        record["edit_date"] = message.edit_date.isoformat()
+    text_hash = message.text_hash or hash_text(message.text)
+    if text_hash == get_text_hash(record):
+        record["text_hash"] = text_hash
+        return False
+    record["text"] = message.text
+    record["text_hash"] = text_hash
+    return True
+
+def add_new_messages(data, new_messages):
+    """
+    Добавляет в данные сообщения, которых там еще нет, и обновляет текст
+    отредактированных. Возвращает добавленные и отредактированные сообщения
+    """
+    records = {listing["id"]: listing for listing in data["listings"]}
+    added = []
+    edited = []
+    for message in new_messages:
+        record = records.get(message.id)
+        if record is None:
+            record = message.to_dict()
+            data["listings"].append(record)
+            records[message.id] = record
+            added.append(message)
+        elif update_message(record, message):
+            edited.append(message)
+    return added, edited
+
+def load_active_ids():
+    """
+    ID объявлений, которые сейчас на сайте (обогащенные и не истекшие).
+    Файл читается потоком, в памяти остаются только id
+    """
+    active_ids = set()
+    for listing in iter_listings(LISTINGS_ENRICHED_FILE):
+        namespace_legacy_ids([listing], TELEGRAM_CHAT_NAME)
+        active_ids.add(listing["id"])
+    return active_ids
+
+async def check_chat(client, chat_id, records, budget):
+    """
+    Проверяет сохраненные сообщения чата пакетами по CHECK_BATCH_SIZE id:
+    отредактированные записи получают новый текст, удаленные - отметку deleted_at.
+    Записи меняются на месте. Возвращает записи с новым текстом и id удаленных
+    """
+    from telethon.errors import FloodWaitError
+
+    chat = get_chat(chat_id)
+    now = datetime.now(pytz.timezone(TIMEZONE)).isoformat()
+    edited = []
+    deleted = []
+    for start in range(0, len(records), CHECK_BATCH_SIZE):
+        batch = records[start:start + CHECK_BATCH_SIZE]
+        await budget.acquire()
+        try:
+            # Для удаленных сообщений telethon возвращает None на их месте
+            messages = await client.get_messages(chat, ids=[get_message_id(record["id"]) for record in batch])
+        except FloodWaitError as e:
+            # Остальные пакеты проверятся при следующем запуске
+            logger.warning(f"Hit rate limit while checking chat {chat_id}, waiting {e.seconds} seconds")
+            budget.pause(e.seconds)
+            break
+        for record, message in zip(batch, messages):
+            if message is None:
+                record["deleted_at"] = now
+                deleted.append(record["id"])
+                continue
+            text = message.text or ""
+            fresh = Listing(
+                id=record["id"],
+                date=message.date,
+                text=text,
+                edit_date=get_edit_date(message),
+                text_hash=hash_text(text)
+            )
+            if update_message(record, fresh):
+                edited.append(record)
+    logger.info(f"Checked {len(records)} messages in chat {chat_id}: {len(edited)} edited, {len(deleted)} deleted")
+    return edited, deleted
+
+async def check_chats(client, data, skip_ids, budget):
+    """
+    Проверяет на правки и удаление объявления, которые сейчас на сайте,
+    кроме skip_ids (уже полученных в этом запуске). Чаты проверяются конкурентно.
+    Возвращает записи с новым текстом и id удаленных сообщений
+    """
+    active_ids = load_active_ids() - set(skip_ids)
+    records_by_chat = {chat_id: [] for chat_id in TELEGRAM_CHATS}
+    for record in data["listings"]:
+        if record["id"] in active_ids and not record.get("deleted_at"):
+            chat_records = records_by_chat.get(get_listing_chat(record["id"], TELEGRAM_CHAT_NAME))
+            if chat_records is not None:
+                chat_records.append(record)
+
+    results = await asyncio.gather(
+        *(check_chat(client, chat_id, records, budget) for chat_id, records in records_by_chat.items() if records),
+        return_exceptions=True
+    )
+    edited = []
+    deleted = []
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Error checking messages: {result}")
+            continue
+        edited.extend(result[0])
+        deleted.extend(result[1])
+    return edited, deleted
+
+async def get_latest_message_id(client, chat_id, budget):
+    """
+    ID самого нового сообщения в чате (курсор сборщика)
+    """
+    await budget.acquire()
+    messages = await client.get_messages(get_chat(chat_id), limit=1)
+    return messages[0].id if messages else None
+
+async def collect_chat(client, chat_id, data, days, cursor, budget):
+    """
+    Сбор одного чата. Возвращает новый курсор чата и собранные сообщения;
+    если с прошлого сбора в чате ничего не появилось, сообщения не запрашиваются
+    """
+    latest_id = await get_latest_message_id(client, chat_id, budget)
+    if cursor is not None and latest_id == cursor:
+        logger.info(f"No new messages in chat {chat_id} since the last run, skipping")
+        return cursor, []
+
+    # Определяем, с какой даты начинать сбор данных
+    since_date = get_since_date(data, days, chat_id)
+    logger.info(f"Collecting chat {chat_id} since: {since_date.strftime('%Y-%m-%d %H:%M:%S')}")
+
+    with tracer.span(f"chat {chat_id}", 'chat'):
+        messages = await collect_messages(client, chat_id, since_date, budget)
+    return latest_id, messages
+
+async def main(days: int = 9, cursors: dict = None, check: bool = True):
+    """
+    Основная функция для сбора данных.
+    Все чаты из TELEGRAM_CHATS собираются конкурентно одним клиентом с общим
+    бюджетом запросов. cursors - ID самых новых сообщений чатов на момент
+    прошлого сбора; чаты без новых сообщений пропускаются. Объявления на сайте
+    проверяются на правки и удаление, только если check.
+    Возвращает новые курсоры (None при ошибке подключения)
+    """
+    if not has_credentials():
+        return None
+
+    logger.info(f"Starting data collection from {len(TELEGRAM_CHATS)} chats...")
+    cursors = dict(cursors or {})
+    
+    client = await connect_client()
+    
     try:
-        # Создаем PeerChannel для доступа к каналу
-        channel_id = int(TELEGRAM_CHAT_NAME)
-        chat = PeerChannel(channel_id)
-        
         # Загружаем существующие данные
         data = load_existing_data()
+        budget = create_budget()
 
-        tz = pytz.timezone(TIMEZONE)
-        now = datetime.now(tz)
-        start_date = now - timedelta(days=args.days)
-        
-        # Определяем, с какой даты начинать сбор данных
-        last_message_date = None
-        if data["listings"]:
-            try:
-                # Находим самое старое сообщение в существующих данных
-                oldest_message_date = datetime.fromisoformat(min(
-                    listing["date"] for listing in data["listings"]
-                ))
-                # Если самое старое сообщение новее чем start_date, начинаем сбор с start_date
-                last_message_date = min(oldest_message_date, start_date)
-            except ValueError:
-                last_message_date = start_date
-        else:
-            last_message_date = start_date
-
-        logger.info(f"Collecting messages since: {last_message_date.strftime('%Y-%m-%d %H:%M:%S')}")
-
-        # Собираем новые сообщения
-        new_messages = await collect_messages(client, chat, last_message_date)
-        
-        # Обновляем существующие данные
-        existing_ids = {listing["id"] for listing in data["listings"]}
-        added_count = 0
-        for message in new_messages:
-            if message["id"] not in existing_ids:
-                data["listings"].append(message)
-                added_count += 1
+        results = await asyncio.gather(
+            *(collect_chat(client, chat_id, data, days, cursors.get(chat_id), budget) for chat_id in TELEGRAM_CHATS),
+            return_exceptions=True
+        )
+
+        # Обновляем существующие данные; курсор чата с ошибкой не меняется
+        added = []
+        edited = []
+        fetched_ids = set()
+        for chat_id, result in zip(TELEGRAM_CHATS, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error processing chat {chat_id}: {result}")
+                continue
+            cursors[chat_id], new_messages = result
+            chat_added, chat_edited = add_new_messages(data, new_messages)
+            added.extend(chat_added)
+            edited.extend(chat_edited)
+            fetched_ids.update(message.id for message in new_messages)
+
+        # Объявления на сайте, которые не попали в окно сбора, проверяются пакетами
+        checked_edited, deleted = [], []
+        if check:
+            checked_edited, deleted = await check_chats(client, data, fetched_ids, budget)
         
         # Сохраняем обновленные данные
         save_data(data)
-        logger.info(f"Added {added_count} new messages to the database")
+        logger.info(
+            f"Added {len(added)} new messages, updated {len(edited) + len(checked_edited)} edited, "
+            f"marked {len(deleted)} deleted ({budget.requests} Telegram requests)"
+        )
         logger.info(f"Total messages in database: {len(data['listings'])}")
+        return cursors
     
     except Exception as e:
-        logger.error(f"Error processing chat: {e}")
+        logger.error(f"Error collecting chats: {e}")
+        return None
     
     finally:
         await client.disconnect()
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Сбор данных из Telegram чата')
+    parser.add_argument('--days', type=int, default=9, help='За сколько последних дней собирать данные')
+    args = parser.parse_args()
+
+    asyncio.run(main(args.days))
@@ -0,0 +1,160 @@
+"""
+Индекс интервалов дат аренды для быстрого поиска пересечений с выбранным периодом
+"""
+
+from datetime import date, datetime
+from typing import Any, Dict, Hashable, List, Optional, Union
+
+DateLike = Union[date, datetime, str, int, None]
+
+EPOCH = date(1970, 1, 1)
+
+def to_day_number(value: DateLike) -> Optional[int]:
+    """
+    Приводит дату к номеру дня от 01.01.1970 (нормализованная форма для индекса)
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, str):
+        try:
+            value = datetime.strptime(value, "%d.%m.%Y").date()
+        except ValueError:
+            try:
+                value = date.fromisoformat(value)
+            except ValueError:
+                return None
+    return (value - EPOCH).days
+
+def from_day_number(day_number: int) -> date:
+    """
+    Обратное преобразование номера дня в дату
+    """
+    return date.fromordinal(EPOCH.toordinal() + day_number)
+
+def month_key(day_number: int) -> int:
+    """
+    Номер месяца (год * 12 + месяц - 1) для корзины индекса
+    """
+    day = from_day_number(day_number)
+    return day.year * 12 + day.month - 1
+
+def overlap_days(start1: int, end1: int, start2: int, end2: int) -> int:
+    """
+    Количество дней пересечения двух закрытых интервалов (0, если не пересекаются)
+    """
+    overlap_start = max(start1, start2)
+    overlap_end = min(end1, end2)
+    if overlap_end < overlap_start:
+        return 0
+    return overlap_end - overlap_start + 1
+
+class DateIntervalIndex:
+    """
+    Индекс интервалов аренды с разбиением по месяцам.
+
+    Интервалы с обеими датами раскладываются по корзинам месяцев, которые они
+    покрывают, поэтому запрос проверяет только объявления из месяцев выбранного
+    периода. Интервалы без начала или конца хранятся отдельно и считаются
+    бесконечными в соответствующую сторону, как и раньше в hasDateOverlap.
+    Ключ может повторяться: у одного объявления бывает несколько периодов.
+    """
+
+    def __init__(self):
+        self.keys: List[Hashable] = []
+        self.starts: List[Optional[int]] = []
+        self.ends: List[Optional[int]] = []
+        self.buckets: Dict[int, List[int]] = {}
+        self.open: List[int] = []
+
+    def add(self, key: Hashable, start: DateLike, end: DateLike):
+        """
+        Добавляет интервал аренды для ключа
+        """
+        self.keys.append(key)
+        self.starts.append(to_day_number(start))
+        self.ends.append(to_day_number(end))
+
+    def build(self) -> 'DateIntervalIndex':
+        """
+        Сортирует интервалы по дате начала и раскладывает их по корзинам месяцев
+        """
+        order = sorted(
+            range(len(self.keys)),
+            key=lambda i: (self.starts[i] is not None, self.starts[i] or 0)
+        )
+        self.keys = [self.keys[i] for i in order]
+        self.starts = [self.starts[i] for i in order]
+        self.ends = [self.ends[i] for i in order]
+
+        self.buckets = {}
+        self.open = []
+        for position, (start, end) in enumerate(zip(self.starts, self.ends)):
+            if start is None or end is None or end < start:
+                self.open.append(position)
+                continue
+            for month in range(month_key(start), month_key(end) + 1):
+                self.buckets.setdefault(month, []).append(position)
+        return self
+
+    def _candidates(self, start: int, end: int):
+        seen = set()
+        for month in range(month_key(start), month_key(end) + 1):
+            for position in self.buckets.get(month, ()):
+                if position not in seen:
+                    seen.add(position)
+                    yield position
+        yield from self.open
+
+    def query(self, start: DateLike, end: DateLike) -> Dict[Hashable, int]:
+        """
+        Возвращает ключи, пересекающиеся с периодом, и длину пересечения в днях.
+
+        Для интервалов без одной из дат длина равна -1 (минимальный приоритет при
+        сортировке «по совпадению дат»). Для ключей с несколькими интервалами
+        берется наибольшее пересечение.
+        """
+        start, end = to_day_number(start), to_day_number(end)
+        if start is None or end is None:
+            return {}
+
+        result: Dict[Hashable, int] = {}
+        for position in self._candidates(start, end):
+            item_start, item_end = self.starts[position], self.ends[position]
+            if (item_start is None or item_start <= end) and (item_end is None or start <= item_end):
+                if item_start is None or item_end is None:
+                    score = -1
+                else:
+                    score = overlap_days(start, end, item_start, item_end)
+                key = self.keys[position]
+                if score > result.get(key, -2):
+                    result[key] = score
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Компактное представление для встраивания в страницу
+        """
+        return {
+            'keys': self.keys,
+            'starts': self.starts,
+            'ends': self.ends,
+            'buckets': {str(month): positions for month, positions in self.buckets.items()},
+            'open': self.open
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'DateIntervalIndex':
+        """
+        Восстанавливает индекс из компактного представления
+        """
+        index = cls()
+        index.keys = list(data.get('keys', []))
+        index.starts = list(data.get('starts', []))
+        index.ends = list(data.get('ends', []))
+        index.buckets = {int(month): positions for month, positions in data.get('buckets', {}).items()}
+        index.open = list(data.get('open', []))
+        return index
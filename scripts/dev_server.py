@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Локальный сервер для работы над шаблонами и стилями сайта.
+
+Собирает сайт в собственной директории (по умолчанию DEV_DIR), а не в публикуемом
+OUTPUT_DIR, раздает его, следит за шаблонами, CSS/JS и файлом обогащенных данных
+и после изменения перерисовывает только затронутые страницы: правка listing.html
+затрагивает только страницы объявлений, index.html - страницы категорий,
+base.html - все страницы. Открытые в браузере страницы перезагружаются сами.
+
+Окружение Jinja2 и объявления держатся в памяти между пересборками.
+Затронутые страницы помечаются устаревшими: страница, которую запросил браузер,
+рендерится сразу при запросе, остальные дописываются в фоне,
+поэтому правка шаблона видна после перезагрузки даже на большой базе.
+Минификация и сжатие в режиме разработки не выполняются
+"""
+
+import argparse
+import html
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Set
+from urllib.parse import urlsplit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import (
+    LISTINGS_ENRICHED_FILE,
+    TEMPLATES_DIR,
+    STATIC_DIR,
+    OUTPUT_DIR,
+    TELEGRAM_CHAT_NAME,
+    DEV_SERVER_PORT,
+    DEV_WATCH_INTERVAL,
+    DEV_DIR
+)
+from scripts import generate_site
+from scripts.generate_site import (
+    CATEGORY_PAGES,
+    build_assets,
+    create_environment,
+    find_listing_matches,
+    format_last_data_update,
+    generate_page,
+    get_formatted_now,
+    get_listing_page_path,
+    load_listings,
+    prune_output,
+    render_cache,
+    render_feeds,
+    render_listing,
+    render_stats_page,
+    write_search_index
+)
+from scripts.listing_store import load_document
+from scripts.models import ListingType, namespace_legacy_ids
+from scripts.run_state import fingerprint
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+LIVE_RELOAD_PATH = '/__livereload'
+LIVE_RELOAD_SCRIPT = f"<script>new EventSource('{LIVE_RELOAD_PATH}').onmessage = () => location.reload();</script>"
+# Как часто отправлять пустое событие, чтобы заметить закрытые вкладки (секунды)
+HEARTBEAT_INTERVAL = 15
+# Отслеживаемые файлы: каталог -> расширения
+WATCHED_DIRS = {
+    TEMPLATES_DIR: ('.html',),
+    os.path.join(STATIC_DIR, 'css'): ('.css',),
+    os.path.join(STATIC_DIR, 'js'): ('.js',)
+}
+
+def use_workdir(workdir: str):
+    """
+    Перенаправляет сборку сайта в рабочую директорию сервера: страницы без минификации
+    не должны попасть в публикуемый OUTPUT_DIR, а состояние инкрементальной сборки
+    поискового индекса и статистики - в файлы, с которыми работает update_site
+    """
+    global OUTPUT_DIR
+    OUTPUT_DIR = generate_site.OUTPUT_DIR = os.path.join(workdir, 'docs')
+    generate_site.ASSETS_MANIFEST_FILE = os.path.join(workdir, 'assets_manifest.json')
+    generate_site.SEARCH_INDEX_STATE_FILE = os.path.join(workdir, 'search_index_state.json')
+    generate_site.AGGREGATES_STATE_FILE = os.path.join(workdir, 'aggregates_state.json')
+
+def snapshot_files() -> Dict[str, tuple]:
+    """
+    Время изменения и размер отслеживаемых файлов
+    """
+    files = {}
+    paths = [LISTINGS_ENRICHED_FILE]
+    for directory, extensions in WATCHED_DIRS.items():
+        for root, _, filenames in os.walk(directory):
+            paths.extend(os.path.join(root, filename) for filename in filenames if filename.endswith(extensions))
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files[os.path.abspath(path)] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+def inject_live_reload(page: str) -> str:
+    """
+    Добавляет в страницу скрипт перезагрузки (только в ответе сервера, не в файле)
+    """
+    position = page.rfind('</body>')
+    if position == -1:
+        return page + LIVE_RELOAD_SCRIPT
+    return page[:position] + LIVE_RELOAD_SCRIPT + page[position:]
+
+class LiveReload:
+    """
+    Счетчик пересборок, изменения которого ждут открытые страницы
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.condition = threading.Condition()
+
+    def notify(self):
+        with self.condition:
+            self.version += 1
+            self.condition.notify_all()
+
+    def wait(self, version: int, timeout: float) -> int:
+        """
+        Ждет пересборки после version (не дольше timeout) и возвращает текущую версию
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+class DevSite:
+    """
+    Состояние сайта между пересборками. Устаревшие страницы лежат в pending
+    (путь файла -> функция рендеринга) и рендерятся по запросу или в фоне
+    """
+
+    # Шаблоны страниц: шаблон -> метод, помечающий его страницы устаревшими
+    PAGE_TEMPLATES = {
+        'index.html': 'mark_category_pages',
+        'stats.html': 'mark_stats_page',
+        'listing.html': 'mark_listing_pages'
+    }
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.has_pending = threading.Condition(self.lock)
+        self.pending: Dict[str, Callable[[], None]] = {}
+        # Фоновый рендеринг остановлен после ошибки до следующего изменения
+        self.paused = False
+        self.env = create_environment()
+        self.dependencies: Dict[str, Set[str]] = {}
+        self.listings_by_type = {}
+        self.listings = []
+        self.matches = {}
+        self.page_fingerprints: Dict[str, str] = {}
+        self.last_data_update = None
+        self.now = get_formatted_now()
+
+    def template_dependencies(self, name: str) -> Set[str]:
+        """
+        Шаблон и все шаблоны, которые он расширяет или подключает. Если шаблон
+        сейчас не разбирается (сохранен с ошибкой), остаются прежние зависимости
+        """
+        from jinja2 import meta
+
+        seen = set()
+        stack = [name]
+        try:
+            while stack:
+                current = stack.pop()
+                if current in seen:
+                    continue
+                seen.add(current)
+                source, _, _ = self.env.loader.get_source(self.env, current)
+                stack.extend(ref for ref in meta.find_referenced_templates(self.env.parse(source)) if ref)
+        except Exception as e:
+            logger.error(f"Error parsing template {current}: {e}")
+            return self.dependencies.get(name, {name}) | seen
+        self.dependencies[name] = seen
+        return seen
+
+    def _mark(self, path: str, render: Callable[[], None]):
+        with self.has_pending:
+            self.pending[os.path.abspath(path)] = render
+            self.has_pending.notify()
+
+    def mark_category_pages(self):
+        for listing_type, (filename, _, _) in CATEGORY_PAGES.items():
+            self._mark(
+                os.path.join(OUTPUT_DIR, filename),
+                lambda listing_type=listing_type, filename=filename: generate_page(
+                    env=self.env,
+                    template=self.env.get_template('index.html'),
+                    listings=self.listings_by_type.get(listing_type, []),
+                    last_updated=self.now,
+                    last_data_update=self.last_data_update,
+                    page_type=listing_type,
+                    output_file=os.path.join(OUTPUT_DIR, filename)
+                )
+            )
+
+    def mark_stats_page(self):
+        self._mark(
+            os.path.join(OUTPUT_DIR, 'stats.html'),
+            lambda: render_stats_page(
+                self.env, self.listings_by_type.get('renting_out', []), self.now, self.last_data_update
+            )
+        )
+
+    def mark_listing_pages(self, listings=None):
+        for listing in self.listings if listings is None else listings:
+            if listing.type == ListingType.NOT_LISTING:
+                continue
+            self._mark(
+                get_listing_page_path(listing.id),
+                lambda listing=listing: render_listing(
+                    self.env, listing, self.now, self.last_data_update, self.matches.get(listing.id)
+                )
+            )
+
+    def mark_all(self):
+        self.mark_category_pages()
+        self.mark_stats_page()
+        self.mark_listing_pages()
+
+    def load_data(self):
+        """
+        Перечитывает обогащенные данные. Поисковый индекс и ленты обновляются
+        сразу (инкрементально), устаревшими помечаются страницы категорий
+        и статистики и страницы объявлений, у которых изменились данные или совпадения
+        """
+        try:
+            data = load_document(LISTINGS_ENRICHED_FILE)
+        except Exception as e:
+            # Файл мог быть прочитан во время записи: его следующее изменение перечитает данные
+            logger.error(f"Error loading {LISTINGS_ENRICHED_FILE}, keeping previous listings: {e}")
+            return
+        namespace_legacy_ids(data.get('listings', []), TELEGRAM_CHAT_NAME)
+        self.listings_by_type, last_data_update, self.listings = load_listings(data)
+        self.last_data_update = format_last_data_update(last_data_update)
+        self.matches = find_listing_matches(self.listings)
+        write_search_index([
+            listing for listing_type in CATEGORY_PAGES for listing in self.listings_by_type.get(listing_type, [])
+        ])
+        render_feeds(self.listings_by_type)
+        prune_output(self.listings)
+
+        page_fingerprints = {}
+        changed = []
+        for listing in self.listings:
+            page_fingerprint = fingerprint(
+                listing.to_dict(),
+                listing.is_new,
+                [(match.listing.to_dict(), match.overlap) for match in self.matches.get(listing.id, [])]
+            )
+            page_fingerprints[listing.id] = page_fingerprint
+            if self.page_fingerprints.get(listing.id) != page_fingerprint:
+                changed.append(listing)
+        self.page_fingerprints = page_fingerprints
+
+        self.mark_category_pages()
+        self.mark_stats_page()
+        self.mark_listing_pages(changed)
+        logger.info(f"Loaded {len(self.listings)} listings, {len(changed)} listing pages changed")
+
+    def apply_changes(self, paths: Set[str]):
+        """
+        Помечает устаревшими страницы, затронутые изменившимися файлами
+        """
+        with self.lock:
+            self.now = get_formatted_now()
+            self.paused = False
+            if os.path.abspath(LISTINGS_ENRICHED_FILE) in paths:
+                self.load_data()
+
+            # Имя бандла содержит хэш, поэтому после правки CSS/JS устаревают все страницы
+            if any(path.endswith(('.css', '.js')) for path in paths):
+                self.env.globals['assets'] = build_assets()
+                self.mark_all()
+                return
+
+            templates = {
+                os.path.relpath(path, TEMPLATES_DIR).replace(os.sep, '/')
+                for path in paths if path.startswith(os.path.abspath(TEMPLATES_DIR) + os.sep)
+            }
+            for template_name, mark in self.PAGE_TEMPLATES.items():
+                if templates & self.template_dependencies(template_name):
+                    getattr(self, mark)()
+
+    def render(self, path: str):
+        """
+        Рендерит страницу path, если она устарела
+        """
+        with self.lock:
+            render = self.pending.pop(os.path.abspath(path), None)
+            if render is None:
+                return
+            try:
+                render()
+            except Exception:
+                # Страница остается устаревшей до следующей правки
+                self.pending[os.path.abspath(path)] = render
+                raise
+
+    def render_pending(self):
+        """
+        Фоновая дорисовка устаревших страниц по одной, чтобы запросы браузера не ждали
+        """
+        while True:
+            with self.has_pending:
+                self.has_pending.wait_for(lambda: self.pending and not self.paused)
+                path = next(iter(self.pending))
+                render = self.pending.pop(path)
+                try:
+                    render()
+                except Exception as e:
+                    # Скорее всего ошибка в шаблоне: остальные страницы ждут следующей правки
+                    logger.error(f"Error rendering {os.path.relpath(path, OUTPUT_DIR)}: {e}")
+                    self.pending[path] = render
+                    self.paused = True
+                    continue
+                if not self.pending:
+                    logger.info("All pages are up to date")
+
+def make_handler(site: DevSite, live_reload: LiveReload):
+    """
+    Обработчик запросов: HTML отдается после рендеринга устаревшей страницы
+    и со скриптом перезагрузки, остальные файлы - как есть
+    """
+
+    class DevRequestHandler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=OUTPUT_DIR, **kwargs)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def end_headers(self):
+            self.send_header('Cache-Control', 'no-store')
+            super().end_headers()
+
+        def do_GET(self):
+            path = urlsplit(self.path).path
+            if path == LIVE_RELOAD_PATH:
+                self.stream_reload()
+                return
+            file_path = self.translate_path(self.path)
+            if os.path.isdir(file_path) and path.endswith('/'):
+                file_path = os.path.join(file_path, 'index.html')
+            if file_path.endswith('.html'):
+                self.send_page(file_path)
+                return
+            super().do_GET()
+
+        def send_page(self, file_path: str):
+            try:
+                site.render(file_path)
+            except Exception:
+                logger.exception(f"Error rendering {self.path}")
+                self.send_body(500, f"<pre>{html.escape(traceback.format_exc())}</pre>")
+                return
+            if not os.path.isfile(file_path):
+                self.send_error(404)
+                return
+            with open(file_path, 'r', encoding='utf-8') as f:
+                self.send_body(200, f.read())
+
+        def send_body(self, status: int, page: str):
+            body = inject_live_reload(page).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def stream_reload(self):
+            """
+            Server-Sent Events: событие после каждой пересборки
+            """
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.end_headers()
+            version = live_reload.version
+            try:
+                while True:
+                    current = live_reload.wait(version, HEARTBEAT_INTERVAL)
+                    self.wfile.write(b'data: reload\n\n' if current != version else b': ping\n\n')
+                    self.wfile.flush()
+                    version = current
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return DevRequestHandler
+
+def watch(site: DevSite, live_reload: LiveReload):
+    """
+    Опрашивает отслеживаемые файлы и после изменения пересобирает затронутые страницы
+    """
+    files = snapshot_files()
+    while True:
+        time.sleep(DEV_WATCH_INTERVAL)
+        current = snapshot_files()
+        changed = {path for path in files.keys() | current.keys() if files.get(path) != current.get(path)}
+        files = current
+        if not changed:
+            continue
+        started = time.perf_counter()
+        try:
+            site.apply_changes(changed)
+        except Exception as e:
+            logger.error(f"Error rebuilding site: {e}")
+            continue
+        logger.info(f"Changed {', '.join(sorted(os.path.basename(path) for path in changed))}: "
+                    f"{len(site.pending)} pages to render, rebuilt in {time.perf_counter() - started:.2f}s")
+        live_reload.notify()
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальный сервер сайта с пересборкой при изменениях')
+    parser.add_argument('--host', default='127.0.0.1', help='Адрес сервера')
+    parser.add_argument('--port', type=int, default=DEV_SERVER_PORT, help='Порт сервера')
+    parser.add_argument('--workdir', default=DEV_DIR, help='Директория для сайта и состояния сборки')
+    args = parser.parse_args()
+
+    use_workdir(args.workdir)
+    site = DevSite()
+    site.load_data()
+    live_reload = LiveReload()
+
+    threading.Thread(target=site.render_pending, daemon=True).start()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(site, live_reload))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving {OUTPUT_DIR} at http://{args.host}:{args.port}/renting.html")
+
+    try:
+        watch(site, live_reload)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        with site.lock:
+            render_cache.save()
+
+if __name__ == "__main__":
+    main()
@@ -5,16 +5,44 @@
 
 import json
 import logging
+import re
 import sys
 import os
+import threading
+from collections import Counter
 from datetime import datetime, timedelta
 import pytz
-from openai import OpenAI
-from typing import Dict, Any, List, Set
-from enum import Enum
+from typing import Dict, Any, List, Optional, Set
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from scripts.config import LISTINGS_FILE, TIMEZONE, OPENAI_API_KEY
+from scripts.config import (
+    LISTINGS_FILE,
+    LISTINGS_ENRICHED_FILE,
+    LISTINGS_ARCHIVE_FILE,
+    LEGACY_LISTINGS_ARCHIVE_FILE,
+    TIMEZONE,
+    OPENAI_API_KEY,
+    ENRICH_MODELS,
+    ENRICH_MIN_CONFIDENCE,
+    TELEGRAM_CHAT_NAME,
+    GAZETTEER_FILE,
+    CITY_REVIEW_FILE
+)
+from scripts.profiling import traced
+from scripts.gazetteer import Gazetteer, ReviewQueue
+from scripts.listing_store import append_listings, iter_listings, load_document, migrate_to_jsonl, write_listings
+from scripts.models import (
+    Listing,
+    ListingId,
+    ListingType,
+    get_text_hash,
+    make_period,
+    merge_listing_variants,
+    namespace_legacy_ids,
+    parse_listing_type,
+    parse_price,
+    resolve_period
+)
 
 # Настройка логирования
 logging.basicConfig(
@@ -23,35 +51,52 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class ListingType(str, Enum):
-    RENTING_OUT = "renting_out"  # Сдает квартиру
-    LOOKING_FOR = "looking_for"  # Ищет квартиру
-    EXCHANGE = "exchange"        # Обмен квартирами
-    NOT_LISTING = "not_listing"  # Не объявление
+# OpenAI клиент создается при первом запросе, чтобы запуски без новых объявлений его не создавали
+client = None
 
-# Установка API ключа в переменную окружения
-os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
+def get_client():
+    """
+    Возвращает OpenAI клиент, создавая его при первом вызове.
+    Пакет openai тяжелый, поэтому импортируется только здесь
+    """
+    global client
+    if client is None:
+        try:
+            from openai import OpenAI
+            client = OpenAI(api_key=OPENAI_API_KEY)
+        except Exception as e:
+            logger.error(f"Failed to initialize OpenAI client: {e}")
+            raise
+    return client
 
-# Инициализация OpenAI клиента
-try:
-    client = OpenAI()
-except Exception as e:
-    logger.error(f"Failed to initialize OpenAI client: {e}")
-    raise
+# Справочник городов загружается при первом обращении
+gazetteer = None
+
+# Неизвестные справочнику города, сохраняются вместе с результатами
+review_queue = ReviewQueue(CITY_REVIEW_FILE)
+
+def get_gazetteer() -> Gazetteer:
+    """
+    Возвращает справочник городов и стран, загружая его при первом вызове
+    """
+    global gazetteer
+    if gazetteer is None:
+        gazetteer = Gazetteer.load(GAZETTEER_FILE)
+    return gazetteer
 
 SYSTEM_PROMPT = """
 You are a helpful assistant that extracts structured information from rental listings.
 Your task is to extract the following information:
-- City where the property is located (ALWAYS translate to Russian, e.g., "Berlin" -> "Берлин", "Munich" -> "Мюнхен")
-- Country where the property is located (ALWAYS translate to Russian, e.g., "Germany" -> "Германия", "France" -> "Франция")
+- City where the property is located (as written in the text, in the nominative case, no translation)
+- Country where the property is located (as written in the text, no translation; null if not mentioned)
 - All rental periods mentioned in the text (only day and month, no year)
 - Price per day in EUR
 - Type of listing
 
 The text may be in English or Russian. Always respond in the following JSON format:
 {
-    "city": string or null (in Russian),
-    "country": string or null (in Russian),
+    "city": string or null,
+    "country": string or null,
     "date_ranges": [
         {
             "start_date": "DD.MM" or "MM",
@@ -59,7 +104,8 @@ The text may be in English or Russian. Always respond in the following JSON form
         }
     ],
     "price_eur": number or null,
-    "type": "renting_out" | "looking_for" | "exchange" | "not_listing"
+    "type": "renting_out" | "looking_for" | "exchange" | "not_listing",
+    "confidence": number
 }
 
 For the type field:
@@ -75,25 +121,48 @@ For dates:
 - If day is mentioned, use "DD.MM" format
 - Extract ALL date ranges mentioned in the text, even if there are multiple
 For prices, convert any mentioned price to EUR using approximate conversion rates if needed.
+For confidence, give a number from 0 to 1: how sure you are that all fields are extracted correctly.
+Use a low value if the text is ambiguous, mentions several places or prices, or the dates are unclear.
 """
 
-def get_full_date(date_str: str, is_start: bool = True) -> str:
+# Схема ответа для structured outputs: модель не может вернуть поля не того типа
+# или пропустить поле. Ограничения, которые схема не выражает, проверяет validate_extraction
+EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "city": {"type": ["string", "null"]},
+        "country": {"type": ["string", "null"]},
+        "date_ranges": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "start_date": {"type": ["string", "null"]},
+                    "end_date": {"type": ["string", "null"]}
+                },
+                "required": ["start_date", "end_date"],
+                "additionalProperties": False
+            }
+        },
+        "price_eur": {"type": ["number", "null"]},
+        "type": {"type": "string", "enum": [listing_type.value for listing_type in ListingType]},
+        "confidence": {"type": "number"}
+    },
+    "required": ["city", "country", "date_ranges", "price_eur", "type", "confidence"],
+    "additionalProperties": False
+}
+
+# Дата без года: DD.MM или MM
+_DAY_MONTH_RE = re.compile(r'^(?:(\d{1,2})\.)?(\d{1,2})$')
+
+class ExtractionError(ValueError):
     """
-    Преобразует дату в формате MM в полный диапазон дат месяца
+    Ни одна модель каскада не вернула корректный ответ
     """
-    if len(date_str) == 2:  # Формат MM
-        if is_start:
-            return f"01.{date_str}"
-        else:
-            # Определяем последний день месяца
-            month = int(date_str)
-            if month in [4, 6, 9, 11]:
-                return f"30.{date_str}"
-            elif month == 2:
-                return f"28.{date_str}"  # Упрощенно берем 28 для февраля
-            else:
-                return f"31.{date_str}"
-    return date_str
+
+# Исходы запросов по моделям каскада (запросы идут из нескольких потоков)
+tier_stats: Dict[str, Counter] = {}
+_tier_stats_lock = threading.Lock()
 
 def is_recent(post_date: str, days: int = 2) -> bool:
     """
@@ -106,231 +175,400 @@ def is_recent(post_date: str, days: int = 2) -> bool:
     except Exception:
         return False
 
-def extract_info_from_text(text: str) -> List[Dict[str, Any]]:
+def count_tier_outcome(model: str, outcome: str):
     """
-    Извлекает структурированную информацию из текста объявления используя OpenAI API
+    Учитывает исход запроса к модели: accepted, low_confidence, invalid, error или fallback
     """
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": text}
-            ],
-            temperature=0,
-            response_format={"type": "json_object"}
+    with _tier_stats_lock:
+        tier_stats.setdefault(model, Counter())[outcome] += 1
+
+def log_tier_stats():
+    """
+    Выводит долю ответов, принятых на каждой ступени каскада
+    """
+    with _tier_stats_lock:
+        stats = {model: Counter(counts) for model, counts in tier_stats.items()}
+    for model in ENRICH_MODELS:
+        counts = stats.get(model)
+        if not counts:
+            continue
+        # fallback - не отдельный запрос, а принятый позже ответ с низкой уверенностью
+        requests = sum(counts.values()) - counts['fallback']
+        accepted = counts['accepted'] + counts['fallback']
+        logger.info(
+            f"Model {model}: accepted {accepted}/{requests} ({accepted / requests:.0%}), "
+            f"escalated on low confidence {counts['low_confidence']}, "
+            f"invalid {counts['invalid']}, errors {counts['error']}"
         )
-        
-        # Извлекаем JSON из ответа
-        result = json.loads(response.choices[0].message.content)
-        
-        # Создаем отдельное объявление для каждого диапазона дат
-        listings = []
-        date_ranges = result.get('date_ranges', [])
-        
-        # Если нет диапазонов дат, создаем одно объявление
-        if not date_ranges:
-            return [{
-                'city': result.get('city'),
-                'country': result.get('country'),
-                'rental_start': None,
-                'rental_end': None,
-                'price_eur': result.get('price_eur'),
-                'type': result.get('type', 'not_listing')
-            }]
-        
-        # Создаем объявление для каждого диапазона дат
-        for date_range in date_ranges:
-            start_date = date_range.get('start_date')
-            end_date = date_range.get('end_date')
-            
-            # Преобразуем даты месяцев в полные диапазоны
-            if start_date:
-                start_date = get_full_date(start_date, is_start=True)
-            if end_date:
-                end_date = get_full_date(end_date, is_start=False)
-
-            listings.append({
-                'city': result.get('city'),
-                'country': result.get('country'),
-                'rental_start': start_date,
-                'rental_end': end_date,
-                'price_eur': result.get('price_eur'),
-                'type': result.get('type', 'not_listing')
-            })
-        
-        return listings
-        
-    except Exception as e:
-        logger.error(f"Error extracting info from text: {e}")
-        return [{
-            'city': None,
-            'country': None,
-            'rental_start': None,
-            'rental_end': None,
-            'price_eur': None,
-            'type': 'not_listing'
-        }]
 
-def enrich_listing(listing: Dict[str, Any]) -> List[Dict[str, Any]]:
+def is_day_month(value: Optional[str]) -> bool:
     """
-    Обогащает одно объявление дополнительной информацией
+    Дата в формате DD.MM или MM с допустимыми днем и месяцем
+    """
+    if value is None:
+        return True
+    match = _DAY_MONTH_RE.match(value.strip())
+    if not match:
+        return False
+    day, month = match.groups()
+    return 1 <= int(month) <= 12 and (day is None or 1 <= int(day) <= 31)
+
+def validate_extraction(result: Dict[str, Any]) -> Optional[str]:
+    """
+    Проверяет ответ модели. Возвращает описание ошибки или None, если ответ корректен
+    """
+    if set(result) != set(EXTRACTION_SCHEMA['required']):
+        return f"unexpected fields {sorted(result)}"
+    try:
+        ListingType(result['type'])
+    except ValueError:
+        return f"unknown type {result['type']!r}"
+    confidence = result['confidence']
+    if isinstance(confidence, bool) or not isinstance(confidence, (int, float)) or not 0 <= confidence <= 1:
+        return f"confidence out of range: {confidence!r}"
+    price = result['price_eur']
+    if price is not None and (isinstance(price, bool) or not isinstance(price, (int, float)) or price < 0):
+        return f"invalid price {price!r}"
+    for date_range in result['date_ranges']:
+        for key in ('start_date', 'end_date'):
+            if not is_day_month(date_range.get(key)):
+                return f"invalid {key} {date_range.get(key)!r}"
+    return None
+
+def request_extraction(model: str, text: str) -> Dict[str, Any]:
+    """
+    Запрашивает у модели ответ по схеме EXTRACTION_SCHEMA
+    """
+    response = get_client().chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": text}
+        ],
+        temperature=0,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "listing", "strict": True, "schema": EXTRACTION_SCHEMA}
+        }
+    )
+    message = response.choices[0].message
+    if getattr(message, 'refusal', None):
+        raise ValueError(f"model refused: {message.refusal}")
+    return json.loads(message.content)
+
+def to_extracted_info(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Приводит проверенный ответ модели к формату extract_info_from_text
+    """
+    # Собираем все диапазоны дат в список периодов одного объявления
+    # (даты в формате DD.MM или MM, год определяется в enrich_listing)
+    rental_periods = []
+    for date_range in result['date_ranges']:
+        start_date = date_range.get('start_date')
+        end_date = date_range.get('end_date')
+        if start_date or end_date:
+            rental_periods.append(make_period(start_date, end_date))
+
+    return {
+        'city': result['city'],
+        'country': result['country'],
+        'rental_periods': rental_periods,
+        'price_eur': result['price_eur'],
+        'type': result['type']
+    }
+
+@traced()
+def extract_info_from_text(text: str) -> Dict[str, Any]:
+    """
+    Извлекает структурированную информацию из текста объявления каскадом моделей
+    ENRICH_MODELS. Ответ принимается, если он проходит проверку и уверенность
+    модели не ниже ENRICH_MIN_CONFIDENCE; иначе запрос уходит следующей модели.
+    Если сильнейшая модель не ответила корректно, берется лучший корректный ответ
+    с низкой уверенностью, а при его отсутствии - ExtractionError: объявление
+    остается необработанным и будет повторено при следующем запуске
+    """
+    fallback = None
+    last_error = None
+    for model in ENRICH_MODELS:
+        try:
+            result = request_extraction(model, text)
+        except Exception as e:
+            count_tier_outcome(model, 'error')
+            last_error = f"{model}: {e}"
+            logger.warning(f"Error extracting info with {model}: {e}")
+            continue
+
+        error = validate_extraction(result)
+        if error:
+            count_tier_outcome(model, 'invalid')
+            last_error = f"{model}: {error}"
+            logger.warning(f"Invalid output from {model}: {error}")
+            continue
+
+        if result['confidence'] < ENRICH_MIN_CONFIDENCE and model != ENRICH_MODELS[-1]:
+            count_tier_outcome(model, 'low_confidence')
+            if fallback is None or result['confidence'] > fallback[1]['confidence']:
+                fallback = (model, result)
+            continue
+
+        count_tier_outcome(model, 'accepted')
+        return to_extracted_info(result)
+
+    if fallback is not None:
+        model, result = fallback
+        count_tier_outcome(model, 'fallback')
+        return to_extracted_info(result)
+    raise ExtractionError(f"No valid output from {', '.join(ENRICH_MODELS)} ({last_error})")
+
+def normalize_location(listing: Listing) -> Listing:
+    """
+    Приводит город и страну к каноническим id и названиям из справочника.
+    Неизвестные города остаются как есть, попадают в очередь на проверку
+    и помечаются версией справочника, в которой их нет
+    """
+    gazetteer = get_gazetteer()
+    location = gazetteer.resolve(listing.city, listing.country)
+    listing.city, listing.country = location.city, location.country
+    listing.city_id, listing.country_id = location.city_id, location.country_id
+    listing.gazetteer_version = gazetteer.version if location.unknown else None
+    if location.unknown:
+        review_queue.add(location.city, location.country, listing.id)
+    return listing
+
+def enrich_listing(listing: Listing) -> Listing:
+    """
+    Обогащает одно объявление дополнительной информацией.
+    Даты аренды сразу получают год относительно даты публикации
     """
-    text = listing.get('text', '')
-    
     # Извлекаем информацию через LLM
-    extracted_infos = extract_info_from_text(text)
+    extracted_info = extract_info_from_text(listing.text)
     
-    # Обогащаем каждый вариант объявления
-    enriched_listings = []
-    for info in extracted_infos:
-        enriched = listing.copy()
-        enriched.update(info)
-        enriched['enriched_at'] = datetime.now(pytz.timezone(TIMEZONE)).isoformat()
-        enriched_listings.append(enriched)
+    enriched = listing.copy()
+    enriched.city = extracted_info['city']
+    enriched.country = extracted_info['country']
+    enriched.price_eur = parse_price(extracted_info['price_eur'])
+    enriched.type = parse_listing_type(extracted_info['type'])
+    enriched.rental_periods = [
+        resolve_period(period['start'], period['end'], listing.date)
+        for period in extracted_info['rental_periods']
+    ]
+    enriched.enriched_at = datetime.now(pytz.timezone(TIMEZONE))
     
-    return enriched_listings
-
-# Путь к файлу с архивными объявлениями
-LISTINGS_ARCHIVE_FILE = os.path.join(os.path.dirname(LISTINGS_FILE), 'listings_archive.json')
+    return normalize_location(enriched)
 
 def load_json_file(filepath: str, default: Dict = None) -> Dict:
     """
-    Загружает JSON файл или возвращает значение по умолчанию
+    Загружает файл объявлений (разбирая его потоком) или возвращает значение по умолчанию.
+    Id объявлений, собранных до поддержки нескольких чатов, получают префикс чата
     """
     try:
         if os.path.exists(filepath):
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            data = load_document(filepath)
+            namespace_legacy_ids(data['listings'], TELEGRAM_CHAT_NAME)
+            return data
     except Exception as e:
         logger.error(f"Error loading {filepath}: {e}")
     return default or {"listings": [], "processed_at": None}
 
 def save_json_file(filepath: str, data: Dict):
     """
-    Сохраняет данные в JSON файл
+    Сохраняет данные: метаданные и объявления по одному на строку
     """
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    metadata = {key: value for key, value in data.items() if key != 'listings'}
+    write_listings(filepath, data.get('listings', []), metadata)
 
-def is_listing_expired(listing: Dict[str, Any]) -> bool:
+def load_archived_ids() -> Set[ListingId]:
     """
-    Проверяет, истек ли срок актуальности объявления
+    ID архивных объявлений. Архив читается потоком, в памяти остаются только id
     """
-    try:
-        # Если нет даты окончания, считаем актуальным
-        if not listing.get('rental_end'):
-            return False
-            
-        # Парсим дату окончания
-        end_date = datetime.strptime(listing['rental_end'], "%d.%m.%Y")
-        current_date = datetime.now(pytz.timezone(TIMEZONE)).replace(
-            hour=0, minute=0, second=0, microsecond=0
-        ).astimezone(pytz.UTC)
-        
-        return end_date.replace(tzinfo=pytz.UTC) < current_date
-    except Exception:
-        return False
+    migrate_to_jsonl(LEGACY_LISTINGS_ARCHIVE_FILE, LISTINGS_ARCHIVE_FILE)
+    archived_ids = set()
+    for listing in iter_listings(LISTINGS_ARCHIVE_FILE):
+        namespace_legacy_ids([listing], TELEGRAM_CHAT_NAME)
+        archived_ids.add(listing['id'])
+    return archived_ids
+
+def is_listing_expired(listing: Listing) -> bool:
+    """
+    Проверяет, истек ли срок актуальности объявления (по текущей дате в TIMEZONE)
+    """
+    return listing.is_expired(datetime.now(pytz.timezone(TIMEZONE)).date())
 
-def get_processed_listings() -> Set[int]:
+def get_processed_listings(enriched_data: Dict = None, archived_ids: Set[ListingId] = None) -> Set[ListingId]:
     """
     Получает множество ID уже обработанных объявлений
     """
     processed_ids = set()
     
     # Загружаем актуальные обработанные объявления
-    enriched_data = load_json_file(os.path.join(os.path.dirname(LISTINGS_FILE), 'listings_enriched.json'))
+    if enriched_data is None:
+        enriched_data = load_json_file(LISTINGS_ENRICHED_FILE)
     processed_ids.update(listing['id'] for listing in enriched_data['listings'])
     
-    # Загружаем архивные объявления
-    archive_data = load_json_file(LISTINGS_ARCHIVE_FILE)
-    processed_ids.update(listing['id'] for listing in archive_data['listings'])
+    # Добавляем архивные объявления
+    if archived_ids is None:
+        archived_ids = load_archived_ids()
+    processed_ids.update(archived_ids)
     
     return processed_ids
 
-def process_data():
+def find_new_listings(raw_data: Dict, enriched_data: Dict, archived_ids: Set[ListingId] = None) -> List[Listing]:
     """
-    Основная функция для обработки данных
+    Находит объявления, которые еще не были обработаны, и актуальные объявления,
+    текст которых изменился после обогащения. Удаленные сообщения пропускаются
+    """
+    processed_ids = get_processed_listings(enriched_data, archived_ids)
+    enriched_hashes = {listing['id']: get_text_hash(listing) for listing in enriched_data['listings']}
+    new_listings = []
+    for listing in raw_data.get('listings', []):
+        if listing.get('deleted_at'):
+            continue
+        enriched_hash = enriched_hashes.get(listing['id'])
+        if enriched_hash is not None:
+            if get_text_hash(listing) == enriched_hash:
+                continue
+        elif listing['id'] in processed_ids:
+            continue
+        new_listings.append(Listing.from_dict(listing))
+    return new_listings
+
+def get_deleted_ids(raw_data: Dict) -> Dict[ListingId, str]:
+    """
+    Удаленные из чата сообщения: id -> время, когда удаление обнаружено
+    """
+    return {
+        listing['id']: listing['deleted_at']
+        for listing in raw_data.get('listings', [])
+        if listing.get('deleted_at')
+    }
+
+def get_pending_ids() -> Set[ListingId]:
+    """
+    Множество ID объявлений, которые нужно обработать: новых, измененных
+    и удаленных из чата, но еще не снятых с сайта
+    """
+    raw_data = load_json_file(LISTINGS_FILE)
+    enriched_data = load_json_file(LISTINGS_ENRICHED_FILE)
+    pending_ids = {listing.id for listing in find_new_listings(raw_data, enriched_data)}
+    enriched_ids = {listing['id'] for listing in enriched_data['listings']}
+    pending_ids.update(listing_id for listing_id in get_deleted_ids(raw_data) if listing_id in enriched_ids)
+    return pending_ids
+
+def merge_enriched(enriched_data: Dict, newly_enriched: List[Listing], deleted: Dict[ListingId, str] = None,
+                   processed_at: Optional[datetime] = None):
+    """
+    Добавляет новые обогащенные объявления (заново обогащенные заменяют прежние
+    версии) и отделяет истекшие и удаленные из чата (deleted из get_deleted_ids).
+    processed_at - время обработки данных (по умолчанию текущее).
+    Возвращает итоговые данные актуальных объявлений и объявления,
+    которые нужно дописать в архив
+    """
+    current_time = processed_at or datetime.now(pytz.timezone(TIMEZONE))
+    
+    # Обрабатываем существующие обогащенные объявления
+    # (записи старого формата с одинаковым id объединяются в одну, даты DD.MM получают год)
+    # Сообщение, отредактированное дважды за запуск, остается в последней версии
+    newly_enriched = list({listing.id: listing for listing in newly_enriched}.values())
+    newly_enriched_ids = {listing.id for listing in newly_enriched}
+    existing_enriched = [
+        Listing.from_dict(listing)
+        for listing in merge_listing_variants(enriched_data.get('listings', []))
+        if listing['id'] not in newly_enriched_ids
+    ]
+    # Города, сохраненные до появления справочника или не найденные в его прежней версии,
+    # приводятся к каноническому виду (неизвестные - один раз на версию справочника)
+    for listing in existing_enriched:
+        if listing.city and not listing.city_id and listing.gazetteer_version != get_gazetteer().version:
+            normalize_location(listing)
+    
+    # Разделяем объявления на актуальные и архивные
+    active_listings = []
+    archived_listings = []
+    
+    deleted = deleted or {}
+    deleted_count = 0
+    
+    # Обрабатываем существующие и новые объявления
+    for listing in existing_enriched + newly_enriched:
+        if listing.id in deleted:
+            listing.deleted_at = datetime.fromisoformat(deleted[listing.id])
+            archived_listings.append(listing)
+            deleted_count += 1
+        elif is_listing_expired(listing):
+            archived_listings.append(listing)
+        else:
+            active_listings.append(listing)
+    
+    # Формируем финальные данные
+    final_enriched_data = {
+        'listings': [listing.to_dict() for listing in active_listings],
+        'processed_at': current_time.isoformat()
+    }
+    
+    archived_data = {
+        'listings': [listing.to_dict() for listing in archived_listings]
+    }
+    
+    logger.info(f"Archived {len(archived_listings) - deleted_count} expired and {deleted_count} deleted listings")
+    return final_enriched_data, archived_data
+
+def save_results(final_enriched_data: Dict, archived_data: Dict):
+    """
+    Сохраняет актуальные объявления и дописывает истекшие в конец архива.
+    Архив дописывается первым: при сбое между записями объявление окажется
+    в архиве дважды, но не потеряется
+    """
+    migrate_to_jsonl(LEGACY_LISTINGS_ARCHIVE_FILE, LISTINGS_ARCHIVE_FILE)
+    append_listings(LISTINGS_ARCHIVE_FILE, archived_data['listings'])
+    save_json_file(LISTINGS_ENRICHED_FILE, final_enriched_data)
+    review_queue.save()
+    
+    logger.info(f"Saved {len(final_enriched_data['listings'])} active listings")
+    logger.info(f"Appended {len(archived_data['listings'])} listings to the archive")
+
+def process_data() -> bool:
+    """
+    Основная функция для обработки данных.
+    Возвращает True, если все объявления обработаны без ошибок
     """
     try:
         # Проверяем наличие API ключа
-        if not os.getenv('OPENAI_API_KEY'):
+        if not OPENAI_API_KEY:
             logger.error("OpenAI API key not found in environment variables")
-            return
+            return False
             
         # Загружаем все необходимые данные
         raw_data = load_json_file(LISTINGS_FILE)
-        enriched_data = load_json_file(os.path.join(os.path.dirname(LISTINGS_FILE), 'listings_enriched.json'))
-        archive_data = load_json_file(LISTINGS_ARCHIVE_FILE)
-        
-        # Получаем множество уже обработанных ID
-        processed_ids = get_processed_listings()
+        enriched_data = load_json_file(LISTINGS_ENRICHED_FILE)
         
-        # Находим новые объявления для обработки
-        new_listings = [
-            listing for listing in raw_data.get('listings', [])
-            if listing['id'] not in processed_ids
-        ]
+        # Находим новые объявления для обработки (архив читается потоком, только id)
+        new_listings = find_new_listings(raw_data, enriched_data)
         
-        logger.info(f"Found {len(new_listings)} new listings to process")
+        logger.info(f"Found {len(new_listings)} new or edited listings to process")
         
         # Обогащаем новые объявления
         newly_enriched = []
+        failed_count = 0
         for i, listing in enumerate(new_listings, 1):
             try:
                 enriched = enrich_listing(listing)
-                newly_enriched.extend(enriched)
+                newly_enriched.append(enriched)
                 if i % 10 == 0:
                     logger.info(f"Processed {i}/{len(new_listings)} new listings")
             except Exception as e:
-                logger.error(f"Error processing listing {listing.get('id')}: {e}")
-        
-        # Обновляем списки актуальных и архивных объявлений
-        current_time = datetime.now(pytz.timezone(TIMEZONE))
-        
-        # Обрабатываем существующие обогащенные объявления
-        existing_enriched = enriched_data.get('listings', [])
-        
-        # Разделяем объявления на актуальные и архивные
-        active_listings = []
-        archived_listings = []
-        
-        # Обрабатываем существующие объявления
-        for listing in existing_enriched:
-            if is_listing_expired(listing):
-                archived_listings.append(listing)
-            else:
-                active_listings.append(listing)
+                logger.error(f"Error processing listing {listing.id}: {e}")
+                failed_count += 1
         
-        # Добавляем новые объявления
-        for listing in newly_enriched:
-            if is_listing_expired(listing):
-                archived_listings.append(listing)
-            else:
-                active_listings.append(listing)
+        log_tier_stats()
         
-        # Формируем финальные данные
-        final_enriched_data = {
-            'listings': active_listings,
-            'processed_at': current_time.isoformat()
-        }
-        
-        final_archive_data = {
-            'listings': archived_listings + archive_data.get('listings', []),
-            'updated_at': current_time.isoformat()
-        }
-        
-        # Сохраняем результаты
-        save_json_file(os.path.join(os.path.dirname(LISTINGS_FILE), 'listings_enriched.json'), final_enriched_data)
-        save_json_file(LISTINGS_ARCHIVE_FILE, final_archive_data)
-        
-        logger.info(f"Saved {len(active_listings)} active listings")
-        logger.info(f"Archived {len(archived_listings)} expired listings")
-        logger.info(f"Total archive size: {len(final_archive_data['listings'])} listings")
+        # Обновляем списки актуальных и архивных объявлений и сохраняем результаты
+        final_enriched_data, archived_data = merge_enriched(enriched_data, newly_enriched, get_deleted_ids(raw_data))
+        save_results(final_enriched_data, archived_data)
+        return failed_count == 0
         
     except Exception as e:
         logger.error(f"Error processing data: {e}")
+        return False
 
 if __name__ == "__main__":
     process_data() 
\ No newline at end of file
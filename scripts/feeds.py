@@ -0,0 +1,129 @@
+"""
+Ленты Atom и JSON Feed с новыми объявлениями по типам и городам.
+
+Лента содержит только последние объявления, id записей - постоянные адреса
+страниц объявлений, а время обновления ленты - время самой новой записи.
+Поэтому содержимое ленты зависит только от ее записей: файл перезаписывается,
+только если записи изменились, и неизмененные ленты отдаются клиентам
+с прежними ETag/Last-Modified
+"""
+
+import json
+import logging
+import os
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import Dict, List, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+ATOM_NS = 'http://www.w3.org/2005/Atom'
+JSON_FEED_VERSION = 'https://jsonfeed.org/version/1.1'
+FEED_EXTENSIONS = ('.xml', '.json')
+
+class FeedItem(NamedTuple):
+    id: str
+    url: str
+    title: str
+    content_html: str
+    published: datetime
+    updated: datetime
+
+class Feed(NamedTuple):
+    # Имя файлов ленты без расширения (renting, renting-berlin)
+    name: str
+    title: str
+    # Страница сайта, которую повторяет лента
+    page_url: str
+    items: List[FeedItem]
+
+def feed_updated(feed: Feed) -> str:
+    """
+    Время обновления ленты: самая новая запись (пустая лента - начало эпохи)
+    """
+    if not feed.items:
+        return '1970-01-01T00:00:00+00:00'
+    return max(item.updated for item in feed.items).isoformat()
+
+def render_atom(feed: Feed, feed_url: str) -> str:
+    """
+    Лента в формате Atom
+    """
+    ET.register_namespace('', ATOM_NS)
+    root = ET.Element(f'{{{ATOM_NS}}}feed')
+    ET.SubElement(root, f'{{{ATOM_NS}}}id').text = feed_url
+    ET.SubElement(root, f'{{{ATOM_NS}}}title').text = feed.title
+    ET.SubElement(root, f'{{{ATOM_NS}}}updated').text = feed_updated(feed)
+    ET.SubElement(root, f'{{{ATOM_NS}}}link', rel='self', href=feed_url)
+    ET.SubElement(root, f'{{{ATOM_NS}}}link', rel='alternate', href=feed.page_url)
+    for item in feed.items:
+        entry = ET.SubElement(root, f'{{{ATOM_NS}}}entry')
+        ET.SubElement(entry, f'{{{ATOM_NS}}}id').text = item.id
+        ET.SubElement(entry, f'{{{ATOM_NS}}}title').text = item.title
+        ET.SubElement(entry, f'{{{ATOM_NS}}}link', rel='alternate', href=item.url)
+        ET.SubElement(entry, f'{{{ATOM_NS}}}published').text = item.published.isoformat()
+        ET.SubElement(entry, f'{{{ATOM_NS}}}updated').text = item.updated.isoformat()
+        ET.SubElement(entry, f'{{{ATOM_NS}}}content', type='html').text = item.content_html
+    return "<?xml version='1.0' encoding='utf-8'?>\n" + ET.tostring(root, encoding='unicode') + '\n'
+
+def render_json_feed(feed: Feed, feed_url: str) -> str:
+    """
+    Лента в формате JSON Feed 1.1
+    """
+    return json.dumps({
+        'version': JSON_FEED_VERSION,
+        'title': feed.title,
+        'home_page_url': feed.page_url,
+        'feed_url': feed_url,
+        'language': 'ru',
+        'items': [
+            {
+                'id': item.id,
+                'url': item.url,
+                'title': item.title,
+                'content_html': item.content_html,
+                'date_published': item.published.isoformat(),
+                'date_modified': item.updated.isoformat()
+            }
+            for item in feed.items
+        ]
+    }, ensure_ascii=False, separators=(',', ':'))
+
+def _write_if_changed(path: str, content: str) -> bool:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == content:
+                return False
+    except OSError:
+        pass
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return True
+
+def write_feeds(output_dir: str, feeds: List[Feed], base_url: str) -> Dict[str, int]:
+    """
+    Записывает ленты в output_dir (Atom в .xml и JSON Feed в .json). Файлы
+    с неизменным содержимым не трогаются, ленты, которых больше нет, удаляются
+    (вместе со сжатыми копиями). Возвращает статистику записи
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    written = 0
+    expected = set()
+    for feed in feeds:
+        for extension, render in (('.xml', render_atom), ('.json', render_json_feed)):
+            filename = f"{feed.name}{extension}"
+            expected.add(filename)
+            if _write_if_changed(os.path.join(output_dir, filename), render(feed, f"{base_url}/{filename}")):
+                written += 1
+
+    removed = 0
+    for filename in os.listdir(output_dir):
+        base = filename
+        for sidecar in ('.gz', '.br'):
+            if base.endswith(sidecar):
+                base = base[:-len(sidecar)]
+        if base.endswith(FEED_EXTENSIONS) and base not in expected:
+            os.remove(os.path.join(output_dir, filename))
+            removed += 1
+
+    return {'feeds': len(feeds), 'written': written, 'removed': removed}
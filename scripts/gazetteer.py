@@ -0,0 +1,204 @@
+"""
+Справочник городов и стран: приведение названий, которые вернула модель,
+к каноническим id и отображаемым названиям, и очередь неизвестных названий на проверку
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from scripts.search_index import normalize_token
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD_RE = re.compile(r'[^0-9a-zа-я]+')
+# Предлоги, с которыми модель иногда возвращает город ("в Берлине")
+PREPOSITIONS = {'в', 'во', 'in'}
+
+def normalize_name(name: str) -> str:
+    """
+    Ключ названия: нижний регистр, без диакритики и знаков препинания
+    ("München" -> "munchen", "Нови-Сад" -> "нови сад")
+    """
+    text = unicodedata.normalize('NFKD', name.lower().replace('ё', 'е'))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _NON_WORD_RE.sub(' ', text).strip()
+
+def stem_name(key: str) -> str:
+    """
+    Ключ без окончаний слов, чтобы падежные формы ("в Берлине") находили город
+    """
+    return ' '.join(normalize_token(word) for word in key.split())
+
+class Location(NamedTuple):
+    city_id: Optional[str]
+    country_id: Optional[str]
+    city: Optional[str]
+    country: Optional[str]
+    # Город указан, но не найден в справочнике
+    unknown: bool
+
+class Gazetteer:
+    """
+    Справочник с поиском по словарям алиасов: сначала по точному ключу,
+    затем по ключу без окончаний. Результаты кэшируются по исходным строкам
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self.cities: Dict[str, Dict[str, Any]] = data.get('cities', {})
+        self.countries: Dict[str, Dict[str, Any]] = data.get('countries', {})
+        self._city_index = self._build_index(self.cities)
+        self._country_index = self._build_index(self.countries)
+        self._cache: Dict[Tuple[Optional[str], Optional[str]], Location] = {}
+        # Версия содержимого: после правки справочника неизвестные города проверяются заново
+        self.version = hashlib.sha256(
+            json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        ).hexdigest()[:16]
+
+    @classmethod
+    def load(cls, filepath: str) -> 'Gazetteer':
+        """
+        Загружает справочник из JSON файла
+        """
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def _build_index(entries: Dict[str, Dict[str, Any]]) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+        exact: Dict[str, List[str]] = {}
+        stems: Dict[str, List[str]] = {}
+        for entry_id, entry in entries.items():
+            for name in [entry['name'], entry_id] + entry.get('aliases', []):
+                key = normalize_name(name)
+                if not key:
+                    continue
+                ids = exact.setdefault(key, [])
+                if entry_id not in ids:
+                    ids.append(entry_id)
+                ids = stems.setdefault(stem_name(key), [])
+                if entry_id not in ids:
+                    ids.append(entry_id)
+        return exact, stems
+
+    @staticmethod
+    def _lookup(index, name: Optional[str]) -> List[str]:
+        if not name:
+            return []
+        exact, stems = index
+        key = normalize_name(name)
+        if not key:
+            return []
+        return exact.get(key) or stems.get(stem_name(key)) or []
+
+    def _lookup_city(self, name: str) -> List[str]:
+        candidates = self._lookup(self._city_index, name)
+        if not candidates:
+            # "Берлин, Митте" или "Берлин (центр)" - ищем по первой части
+            head = re.split(r'[,(/]', name, maxsplit=1)[0]
+            if head != name:
+                candidates = self._lookup(self._city_index, head)
+        if not candidates:
+            words = normalize_name(name).split()
+            if len(words) > 1 and words[0] in PREPOSITIONS:
+                candidates = self._lookup(self._city_index, ' '.join(words[1:]))
+        return candidates
+
+    def resolve(self, city: Optional[str], country: Optional[str]) -> Location:
+        """
+        Приводит город и страну к каноническому виду. Если город известен,
+        страна берется из справочника; неизвестные названия остаются как есть
+        """
+        cache_key = (city, country)
+        location = self._cache.get(cache_key)
+        if location is not None:
+            return location
+
+        countries = self._lookup(self._country_index, country)
+        country_id = countries[0] if countries else None
+
+        city_id = None
+        candidates = self._lookup_city(city) if city else []
+        if candidates:
+            # Одинаковые алиасы в разных странах различаем по стране из объявления
+            city_id = next(
+                (candidate for candidate in candidates if self.cities[candidate]['country'] == country_id),
+                candidates[0]
+            )
+            country_id = self.cities[city_id]['country']
+
+        location = Location(
+            city_id=city_id,
+            country_id=country_id,
+            city=self.cities[city_id]['name'] if city_id else (city.strip() if city else None),
+            country=self.countries[country_id]['name'] if country_id in self.countries else (
+                country.strip() if country else None
+            ),
+            unknown=bool(city and city.strip()) and city_id is None
+        )
+        self._cache[cache_key] = location
+        return location
+
+class ReviewQueue:
+    """
+    Очередь неизвестных названий городов: после проверки название добавляется
+    в алиасы справочника. Записи хранят id объявлений, поэтому повторная
+    обработка того же объявления не увеличивает счетчик
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._changed = False
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            self._entries = {}
+            try:
+                if os.path.exists(self.filepath):
+                    with open(self.filepath, 'r', encoding='utf-8') as f:
+                        self._entries = json.load(f)
+            except Exception as e:
+                logger.error(f"Error loading city review queue {self.filepath}: {e}")
+        return self._entries
+
+    def add(self, city: str, country: Optional[str], listing_id: Any):
+        """
+        Добавляет неизвестное название в очередь
+        """
+        key = f"{normalize_name(city)}|{normalize_name(country) if country else ''}"
+        with self._lock:
+            entries = self._load()
+            entry = entries.setdefault(key, {
+                'city': city,
+                'country': country,
+                'count': 0,
+                'first_seen': datetime.now().isoformat(),
+                'listings': []
+            })
+            listing_id = str(listing_id)
+            if listing_id in entry['listings']:
+                return
+            entry['listings'].append(listing_id)
+            entry['count'] = len(entry['listings'])
+            self._changed = True
+
+    def save(self):
+        """
+        Сохраняет очередь, если в ней появились новые записи
+        """
+        with self._lock:
+            if not self._changed:
+                return
+            entries = dict(sorted(self._load().items(), key=lambda item: -item[1]['count']))
+            os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+            with open(self.filepath, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, indent=4, ensure_ascii=False)
+            self._changed = False
+            logger.info(f"City review queue: {len(entries)} unknown names in {self.filepath}")
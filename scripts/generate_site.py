@@ -8,8 +8,6 @@ import os
 import shutil
 from datetime import datetime, timedelta
 import pytz
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-import markdown2
 import sys
 import re
 
@@ -17,34 +15,72 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from scripts.config import (
     LISTINGS_ENRICHED_FILE,
     TEMPLATES_DIR,
+    STATIC_DIR,
+    VENDOR_DIR,
+    VENDOR_CSS,
+    VENDOR_JS,
+    VENDOR_FONTS,
     OUTPUT_DIR,
     TIMEZONE,
-    MEDIA_DIR
+    TELEGRAM_CHAT_NAME,
+    MEDIA_DIR,
+    RENDER_CACHE_FILE,
+    RENDER_CACHE_MAX_AGE_DAYS,
+    ASSETS_MANIFEST_FILE,
+    SEARCH_INDEX_STATE_FILE,
+    AGGREGATES_STATE_FILE,
+    MINIFY_OUTPUT,
+    PRECOMPRESS_OUTPUT,
+    MATCHES_PER_LISTING,
+    MATCH_PRICE_TOLERANCE,
+    SITE_URL,
+    FEED_SIZE
 )
+from scripts.date_index import DateIntervalIndex
+from scripts.render_cache import RenderCache
+from scripts.models import Listing, ListingType, get_listing_slug, merge_listing_variants, namespace_legacy_ids
+from scripts.assets import build_asset_bundle, optimize_output
+from scripts.search_index import SearchIndexBuilder
+from scripts.listing_store import load_document
+from scripts.matching import find_matches
+from scripts.aggregates import MarketAggregates
+from scripts.feeds import Feed, FeedItem, write_feeds
+from scripts.profiling import traced
 
-def format_date(date_str):
+# Версия правил форматирования текста; увеличить при изменении format_text
+FORMAT_TEXT_VERSION = 1
+
+def get_renderer_version():
+    """
+    Версия рендерера для ключей кэша: версия markdown2 и правил форматирования
+    """
+    import markdown2
+    return f"{markdown2.__version__}:{FORMAT_TEXT_VERSION}"
+
+render_cache = RenderCache(RENDER_CACHE_FILE, get_renderer_version, RENDER_CACHE_MAX_AGE_DAYS)
+
+# Страницы категорий: тип объявлений -> (файл страницы, имя ленты, заголовок)
+CATEGORY_PAGES = {
+    'renting_out': ('renting.html', 'renting', 'Сдают квартиру'),
+    'looking_for': ('looking.html', 'looking', 'Ищут квартиру'),
+    'exchange': ('exchange.html', 'exchange', 'Обмен квартирами')
+}
+
+def format_date(value):
     """
     Форматирование даты для отображения
     """
-    if not date_str:
-        return None
-    try:
-        date = datetime.strptime(date_str, "%d.%m.%Y")
-        return date.strftime("%d.%m.%Y")
-    except (ValueError, TypeError):
+    if not value:
         return None
+    return value.strftime("%d.%m.%Y")
 
-def format_datetime(date_str):
+def format_datetime(value):
     """
     Форматирование даты и времени для отображения
     """
-    if not date_str:
-        return None
-    try:
-        date = datetime.fromisoformat(date_str)
-        return date.strftime("%d.%m.%Y %H:%M")
-    except (ValueError, TypeError):
+    if not value:
         return None
+    return value.strftime("%d.%m.%Y %H:%M")
 
 def format_price(price):
     """
@@ -57,13 +93,13 @@ def format_price(price):
     except (ValueError, TypeError):
         return None
 
-def format_text(text):
+@traced()
+def render_markdown(text):
     """
-    Форматирование текста с поддержкой Markdown
+    Рендеринг текста объявления из Markdown в HTML
     """
-    if not text:
-        return ""
-    
+    import markdown2
+
     # Заменяем <br> на переносы строк
     text = text.replace('<br>', '\n')
     
@@ -78,118 +114,85 @@ def format_text(text):
     
     return html
 
-def adjust_rental_dates(listing):
+def format_text(text):
     """
-    Корректирует даты аренды относительно даты публикации объявления
+    Форматирование текста с поддержкой Markdown (с кэшированием результата)
     """
-    if not listing.get('date'):
-        return listing
-
-    post_date = datetime.fromisoformat(listing['date'])
-    post_year = post_date.year
-    post_month = post_date.month
-
-    # Обрабатываем дату начала аренды
-    if listing.get('rental_start'):
-        try:
-            # Проверяем формат даты
-            if '.' in listing['rental_start']:
-                parts = listing['rental_start'].split('.')
-                if len(parts) == 2:  # Формат DD.MM
-                    day, month = parts
-                    rental_start = datetime(post_year, int(month), int(day))
-                    
-                    # Если месяц аренды меньше месяца публикации, значит это следующий год
-                    if int(month) < post_month:
-                        rental_start = rental_start.replace(year=post_year + 1)
-                    
-                    listing['rental_start'] = rental_start.strftime("%d.%m.%Y")
-                elif len(parts) == 3:  # Формат DD.MM.YYYY
-                    listing['rental_start'] = listing['rental_start']  # Оставляем как есть
-            
-        except (ValueError, TypeError):
-            listing['rental_start'] = None
+    if not text:
+        return ""
+    
+    return render_cache.get_or_render(text, render_markdown)
 
-    # Обрабатываем дату окончания аренды
-    if listing.get('rental_end'):
-        try:
-            # Проверяем формат даты
-            if '.' in listing['rental_end']:
-                parts = listing['rental_end'].split('.')
-                if len(parts) == 2:  # Формат DD.MM
-                    day, month = parts
-                    rental_end = datetime(post_year, int(month), int(day))
-                    
-                    # Если есть дата начала и дата конца меньше даты начала, значит это следующий год
-                    if listing.get('rental_start'):
-                        rental_start_date = datetime.strptime(listing['rental_start'], "%d.%m.%Y")
-                        if rental_end < rental_start_date:
-                            rental_end = rental_end.replace(year=rental_end.year + 1)
-                    # Если нет даты начала, но месяц меньше месяца публикации
-                    elif int(month) < post_month:
-                        rental_end = rental_end.replace(year=post_year + 1)
-                    
-                    listing['rental_end'] = rental_end.strftime("%d.%m.%Y")
-                elif len(parts) == 3:  # Формат DD.MM.YYYY
-                    listing['rental_end'] = listing['rental_end']  # Оставляем как есть
-            
-        except (ValueError, TypeError):
-            listing['rental_end'] = None
+def is_recent(post_date: datetime, days: int = 2) -> bool:
+    """
+    Проверяет, было ли объявление опубликовано за последние n дней
+    """
+    now = datetime.now(post_date.tzinfo)
+    return (now - post_date) <= timedelta(days=days)
 
+def prepare_listing(listing: Listing) -> Listing:
+    """
+    Подготовка объявления к отображению: отметка новых и пути к фото.
+    Меняет переданное объявление, поэтому для общих объектов нужно передавать копию
+    """
+    listing.is_new = is_recent(listing.date)
+    if listing.photo_paths:
+        listing.photo_paths = [
+            f"media/{os.path.basename(path)}" 
+            for path in listing.photo_paths
+        ]
     return listing
 
-def is_recent(post_date: str, days: int = 2) -> bool:
+def group_listings_by_type(listings):
     """
-    Проверяет, было ли объявление опубликовано за последние n дней
+    Группировка объявлений по типу
     """
-    try:
-        post_datetime = datetime.fromisoformat(post_date)
-        now = datetime.now(post_datetime.tzinfo)
-        return (now - post_datetime) <= timedelta(days=days)
-    except Exception:
-        return False
+    return {
+        'renting_out': [l for l in listings if l.type == ListingType.RENTING_OUT],
+        'looking_for': [l for l in listings if l.type == ListingType.LOOKING_FOR],
+        'exchange': [l for l in listings if l.type == ListingType.EXCHANGE]
+    }
 
-def load_listings():
+def load_listings(data=None):
     """
-    Загрузка объявлений из JSON файла
+    Загрузка объявлений из JSON файла (или из уже загруженных в память данных)
     """
     try:
-        with open(LISTINGS_ENRICHED_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            
-            # Получаем время последнего обновления данных
-            last_data_update = data.get('processed_at', None)
-            
-            # Сортируем по дате, новые сверху
-            listings = sorted(
-                data.get('listings', []),
-                key=lambda x: x['date'],
-                reverse=True
-            )
+        if data is None:
+            data = load_document(LISTINGS_ENRICHED_FILE)
+            namespace_legacy_ids(data.get('listings', []), TELEGRAM_CHAT_NAME)
             
-            # Помечаем новые объявления и обновляем пути к фото
-            for listing in listings:
-                listing['is_new'] = is_recent(listing['date'])
-                if listing.get('photo_paths'):
-                    listing['photo_paths'] = [
-                        f"media/{os.path.basename(path)}" 
-                        for path in listing['photo_paths']
-                    ]
-                # Корректируем даты аренды
-                listing = adjust_rental_dates(listing)
-            
-            # Группируем объявления по типу
-            listings_by_type = {
-                'renting_out': [l for l in listings if l.get('type') == 'renting_out'],
-                'looking_for': [l for l in listings if l.get('type') == 'looking_for'],
-                'exchange': [l for l in listings if l.get('type') == 'exchange']
-            }
-            
-            return listings_by_type, last_data_update, listings
+        # Получаем время последнего обновления данных
+        last_data_update = data.get('processed_at', None)
+        
+        # Сортируем по дате, новые сверху (по одной записи на сообщение)
+        listings = sorted(
+            (Listing.from_dict(listing) for listing in merge_listing_variants(data.get('listings', []))),
+            key=lambda x: x.date,
+            reverse=True
+        )
+        
+        # Помечаем новые объявления и обновляем пути к фото
+        listings = [prepare_listing(listing) for listing in listings]
+        
+        return group_listings_by_type(listings), last_data_update, listings
     except Exception as e:
         print(f"Error loading listings: {e}")
         return {}, None, []
 
+def build_date_index(listings):
+    """
+    Строит индекс периодов аренды для страницы; ключ - позиция карточки на странице
+    """
+    index = DateIntervalIndex()
+    for position, listing in enumerate(listings):
+        if not listing.rental_periods:
+            # Объявление без дат подходит под любой период
+            index.add(position, None, None)
+        for period in listing.rental_periods:
+            index.add(position, period.start, period.end)
+    return index.build()
+
 def ensure_output_directory():
     """
     Подготовка директории для генерации сайта
@@ -197,10 +200,6 @@ def ensure_output_directory():
     # Создаем директорию, если её нет
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     
-    # Создаем директорию для CSS
-    css_dir = os.path.join(OUTPUT_DIR, 'css')
-    os.makedirs(css_dir, exist_ok=True)
-    
     # Создаем директорию для медиафайлов
     media_output_dir = os.path.join(OUTPUT_DIR, 'media')
     os.makedirs(media_output_dir, exist_ok=True)
@@ -209,30 +208,32 @@ def ensure_output_directory():
     listings_dir = os.path.join(OUTPUT_DIR, 'listings')
     os.makedirs(listings_dir, exist_ok=True)
     
-    # Путь к исходному CSS файлу в директории проекта
-    css_source = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'css', 'styles.css')
-    css_dest = os.path.join(css_dir, 'styles.css')
-    
-    # Копируем CSS файл
-    if os.path.exists(css_source):
-        shutil.copy2(css_source, css_dest)
-    else:
-        print(f"CSS файл не найден: {css_source}")
-
-    # Копируем медиафайлы
-    if os.path.exists(MEDIA_DIR):
-        for file in os.listdir(MEDIA_DIR):
-            if file.endswith('.jpg'):
-                src = os.path.join(MEDIA_DIR, file)
-                dst = os.path.join(media_output_dir, file)
+@traced()
+def copy_media(filenames=None):
+    """
+    Копирование медиафайлов в директорию сайта (всех или только указанных)
+    """
+    if not os.path.exists(MEDIA_DIR):
+        return
+    media_output_dir = os.path.join(OUTPUT_DIR, 'media')
+    if filenames is None:
+        filenames = os.listdir(MEDIA_DIR)
+    for file in filenames:
+        src = os.path.join(MEDIA_DIR, file)
+        if file.endswith('.jpg') and os.path.exists(src):
+            dst = os.path.join(media_output_dir, file)
+            # Не копируем повторно файлы, которые уже есть на сайте
+            if not os.path.exists(dst) or os.path.getmtime(dst) < os.path.getmtime(src):
                 shutil.copy2(src, dst)
 
+@traced()
 def generate_page(env, template, listings, last_updated, last_data_update, page_type, output_file):
     """
     Генерация отдельной страницы сайта
     """
     html = template.render(
         listings=listings,
+        date_index=build_date_index(listings).to_dict(),
         last_updated=last_updated,
         last_data_update=last_data_update,
         page_type=page_type,
@@ -242,13 +243,15 @@ def generate_page(env, template, listings, last_updated, last_data_update, page_
     with open(output_file, 'w', encoding='utf-8') as f:
         f.write(html)
 
-def generate_listing_page(env, listing, last_updated, last_data_update, output_file):
+@traced()
+def generate_listing_page(env, listing, last_updated, last_data_update, output_file, matches=None):
     """
-    Генерация страницы отдельного объявления
+    Генерация страницы отдельного объявления (с возможными совпадениями)
     """
     template = env.get_template('listing.html')
     html = template.render(
         listing=listing,
+        matches=matches or [],
         last_updated=last_updated,
         last_data_update=last_data_update,
         root_path="../"  # Для страниц листингов нужно подняться на уровень выше
@@ -257,10 +260,45 @@ def generate_listing_page(env, listing, last_updated, last_data_update, output_f
     with open(output_file, 'w', encoding='utf-8') as f:
         f.write(html)
 
-def generate_site():
+# Каталоги с множеством мелких файлов, которые выводятся в отчете одной строкой
+SIZE_REPORT_GROUPS = ('search', 'feeds')
+
+def print_size_report(report):
+    """
+    Вывод размеров страниц: исходный, после минификации и в сжатом виде.
+    Каждая страница (*.html) выводится отдельно, шарды поиска и ленты - итогом по каталогу
+    """
+    def kb(size):
+        return f"{size / 1024:.1f} KB" if size is not None else "-"
+
+    def total(entries, key):
+        return sum(entry[key] for entry in entries if key in entry) if any(key in entry for entry in entries) else None
+
+    def print_row(name, entries):
+        print(f"{name:<32} {kb(total(entries, 'original')):>10} {kb(total(entries, 'size')):>10} "
+              f"{kb(total(entries, 'gzip')):>10} {kb(total(entries, 'brotli')):>10}")
+
+    print(f"{'file':<32} {'original':>10} {'minified':>10} {'gzip':>10} {'brotli':>10}")
+    groups = {group: [] for group in SIZE_REPORT_GROUPS}
+    for entry in report:
+        group = entry['path'].split(os.sep, 1)[0]
+        if group in groups and os.sep in entry['path']:
+            groups[group].append(entry)
+        else:
+            print_row(entry['path'], [entry])
+    for group, entries in groups.items():
+        if entries:
+            print_row(f"{group}/ ({len(entries)} files)", entries)
+
+    print_row(f"total ({len(report)} files)", report)
+
+def create_environment():
     """
-    Генерация статического сайта
+    Подготовка директории сайта и окружения Jinja2 с фильтрами и бандлами ресурсов
     """
+    # jinja2 нужен только для рендеринга, поэтому импортируется здесь
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+
     # Настраиваем окружение Jinja2
     env = Environment(
         loader=FileSystemLoader(TEMPLATES_DIR),
@@ -274,59 +312,261 @@ def generate_site():
     env.filters['format_text'] = format_text
     env.filters['nl2br'] = lambda text: text.replace('\n', '<br>')
     
-    # Загружаем шаблон
-    template = env.get_template('index.html')
-    
-    # Загружаем объявления и время последнего обновления данных
-    listings_by_type, last_data_update, all_listings = load_listings()
-    
     # Подготавливаем директорию
     ensure_output_directory()
+
+    # Собираем CSS/JS бандлы с хэшем в имени и делаем их доступными в шаблонах
+    env.globals['assets'] = build_assets()
     
-    # Получаем текущее время в нужном часовом поясе
+    return env
+
+def build_assets():
+    """
+    Сборка CSS/JS бандлов сайта с хэшем в имени
+    """
+    return build_asset_bundle(
+        output_dir=OUTPUT_DIR,
+        vendor_dir=VENDOR_DIR,
+        vendor_css=VENDOR_CSS,
+        vendor_js=VENDOR_JS,
+        vendor_fonts=VENDOR_FONTS,
+        local_css=[os.path.join(STATIC_DIR, 'css', 'styles.css')],
+        local_js=[
+            os.path.join(STATIC_DIR, 'js', 'search.js'),
+            os.path.join(STATIC_DIR, 'js', 'listings.js')
+        ]
+    )
+
+def get_formatted_now():
+    """
+    Текущее время в нужном часовом поясе для подвала страниц
+    """
     tz = pytz.timezone(TIMEZONE)
-    now = datetime.now(tz)
-    formatted_now = now.strftime("%d.%m.%Y %H:%M")
-    
-    # Форматируем время последнего обновления данных
+    return datetime.now(tz).strftime("%d.%m.%Y %H:%M")
+
+def format_last_data_update(last_data_update):
+    """
+    Форматирование времени последнего обновления данных
+    """
     if last_data_update:
         try:
             last_data_update = datetime.fromisoformat(last_data_update)
-            last_data_update = last_data_update.strftime("%d.%m.%Y %H:%M")
+            return last_data_update.strftime("%d.%m.%Y %H:%M")
         except (ValueError, TypeError):
-            last_data_update = None
+            pass
+    return None
 
-    # Генерируем страницы для каждого типа
-    pages = {
-        'renting_out': ('renting.html', 'Сдают квартиру'),
-        'looking_for': ('looking.html', 'Ищут квартиру'),
-        'exchange': ('exchange.html', 'Обмен квартирами')
-    }
+def get_listing_page_path(listing_id):
+    """
+    Путь к странице объявления в OUTPUT_DIR
+    """
+    return os.path.join(OUTPUT_DIR, 'listings', f"{get_listing_slug(listing_id, TELEGRAM_CHAT_NAME)}.html")
+
+def remove_listing_pages(listing_ids):
+    """
+    Снимает с сайта страницы объявлений (сжатые копии удаляет optimize_output).
+    Возвращает число удаленных страниц
+    """
+    removed = 0
+    for listing_id in listing_ids:
+        path = get_listing_page_path(listing_id)
+        if os.path.exists(path):
+            os.remove(path)
+            removed += 1
+    return removed
+
+def _remove_unlisted(directory, keep):
+    """
+    Удаляет из directory файлы, которых нет в keep (сжатые копии - вместе с исходным файлом)
+    """
+    removed = 0
+    if not os.path.exists(directory):
+        return removed
+    for filename in os.listdir(directory):
+        base = filename
+        for sidecar in ('.gz', '.br'):
+            if base.endswith(sidecar):
+                base = base[:-len(sidecar)]
+        if base not in keep:
+            os.remove(os.path.join(directory, filename))
+            if base == filename:
+                removed += 1
+    return removed
+
+@traced()
+def prune_output(listings):
+    """
+    Удаляет с сайта страницы объявлений, которых больше нет среди актуальных
+    (истекшие и удаленные из чата),
+    и фото, на которые не ссылается ни одно актуальное объявление
+    """
+    published = [listing for listing in listings if listing.type != ListingType.NOT_LISTING]
+    pages = {f"{listing.slug}.html" for listing in published}
+    media = {os.path.basename(path) for listing in published for path in listing.photo_paths or []}
+    removed_pages = _remove_unlisted(os.path.join(OUTPUT_DIR, 'listings'), pages)
+    removed_media = _remove_unlisted(os.path.join(OUTPUT_DIR, 'media'), media)
+    print(f"Pruned {removed_pages} listing pages and {removed_media} media files")
+    return removed_pages, removed_media
+
+def render_listing(env, listing, last_updated, last_data_update, matches=None):
+    """
+    Генерация страницы одного объявления вместе с копированием его фото.
+    Если после правки сообщение перестало быть объявлением, его страница снимается
+    """
+    if listing.type == ListingType.NOT_LISTING:
+        remove_listing_pages([listing.id])
+        return
+    if listing.photo_paths:
+        copy_media([os.path.basename(path) for path in listing.photo_paths])
+    output_file = get_listing_page_path(listing.id)
+    generate_listing_page(
+        env=env,
+        listing=listing,
+        last_updated=last_updated,
+        last_data_update=last_data_update,
+        output_file=output_file,
+        matches=matches
+    )
+
+@traced()
+def find_listing_matches(listings):
+    """
+    Возможные совпадения для страниц объявлений: id объявления -> список Match
+    """
+    matches = find_matches(listings, MATCHES_PER_LISTING, MATCH_PRICE_TOLERANCE)
+    print(f"Matching: {len(matches)} listings have possible matches")
+    return matches
+
+@traced()
+def write_search_index(listings):
+    """
+    Инкрементальное обновление поискового индекса по объявлениям на страницах сайта
+    """
+    builder = SearchIndexBuilder(SEARCH_INDEX_STATE_FILE)
+    builder.update(
+        {'slug': listing.slug, 'text': listing.text, 'city': listing.city, 'country': listing.country}
+        for listing in listings
+    )
+    stats = builder.write(os.path.join(OUTPUT_DIR, 'search'))
+    builder.save()
+    print(f"Search index: {stats['documents']} listings in {stats['shards']} shards, "
+          f"{stats['tokenized']} tokenized, {stats['written']} files written, {stats['removed']} removed")
+
+@traced()
+def render_stats_page(env, listings, last_updated, last_data_update):
+    """
+    Обновление статистики рынка по сдающимся объявлениям, генерация stats.html и stats.json
+    """
+    aggregates = MarketAggregates(AGGREGATES_STATE_FILE)
+    stats = aggregates.update(listings)
+    aggregates.save()
+    now = datetime.now(pytz.timezone(TIMEZONE))
+    cities = aggregates.summary(now.date())
+
+    with open(os.path.join(OUTPUT_DIR, 'stats.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'generated_at': now.isoformat(),
+            'price_unit': 'EUR per day',
+            'cities': {
+                city: {key: summary[key] for key in ('name', 'prices', 'availability')}
+                for city, summary in cities.items()
+            }
+        }, f, ensure_ascii=False, separators=(',', ':'))
+
+    html = env.get_template('stats.html').render(
+        cities=sorted(cities.values(), key=lambda city: -city['listings']),
+        last_updated=last_updated,
+        last_data_update=last_data_update,
+        page_type='stats',
+        root_path=""
+    )
+    with open(os.path.join(OUTPUT_DIR, 'stats.html'), 'w', encoding='utf-8') as f:
+        f.write(html)
+    print(f"Market stats: {len(cities)} cities, {stats['added']} listings added, "
+          f"{stats['changed']} changed, {stats['released']} no longer tracked")
 
-    for listing_type, (filename, title) in pages.items():
+def build_feed_item(listing):
+    """
+    Запись ленты для объявления: id - постоянный адрес страницы объявления
+    """
+    url = f"{SITE_URL}/listings/{listing.slug}.html"
+    title = CATEGORY_PAGES[listing.type.value][2]
+    details = [listing.city, format_price(listing.price_eur)] + [
+        ' '.join(filter(None, [
+            f"с {format_date(period.start)}" if period.start else None,
+            f"по {format_date(period.end)}" if period.end else None
+        ]))
+        for period in listing.rental_periods
+    ]
+    details = [detail for detail in details if detail]
+    if details:
+        title = f"{title}: {', '.join(details)}"
+    return FeedItem(
+        id=url,
+        url=url,
+        title=title,
+        content_html=format_text(listing.text),
+        published=listing.date,
+        updated=listing.edit_date or listing.date
+    )
+
+@traced()
+def render_feeds(listings_by_type):
+    """
+    Ленты Atom и JSON с последними объявлениями каждого типа и каждого города
+    (только для городов из справочника)
+    """
+    feeds = []
+    for listing_type, (filename, name, title) in CATEGORY_PAGES.items():
+        listings = listings_by_type.get(listing_type, [])
+        page_url = f"{SITE_URL}/{filename}"
+        feeds.append(Feed(name, f"{title} - HSE Sublet", page_url, [
+            build_feed_item(listing) for listing in listings[:FEED_SIZE]
+        ]))
+
+        by_city = {}
+        for listing in listings:
+            if listing.city_id:
+                by_city.setdefault(listing.city_id, []).append(listing)
+        for city_id, city_listings in sorted(by_city.items()):
+            feeds.append(Feed(f"{name}-{city_id}", f"{title}: {city_listings[0].city} - HSE Sublet", page_url, [
+                build_feed_item(listing) for listing in city_listings[:FEED_SIZE]
+            ]))
+
+    stats = write_feeds(os.path.join(OUTPUT_DIR, 'feeds'), feeds, f"{SITE_URL}/feeds")
+    print(f"Feeds: {stats['feeds']} feeds, {stats['written']} files written, {stats['removed']} removed")
+
+def render_category_pages(env, listings_by_type, last_updated, last_data_update):
+    """
+    Генерация страниц для каждого типа объявлений, поискового индекса по ним
+    и редиректа с index.html
+    """
+    # Загружаем шаблон
+    template = env.get_template('index.html')
+
+    # Генерируем страницы для каждого типа
+    for listing_type, (filename, _, _) in CATEGORY_PAGES.items():
         output_file = os.path.join(OUTPUT_DIR, filename)
         generate_page(
             env=env,
             template=template,
             listings=listings_by_type.get(listing_type, []),
-            last_updated=formatted_now,
+            last_updated=last_updated,
             last_data_update=last_data_update,
             page_type=listing_type,
             output_file=output_file
         )
 
-    # Генерируем страницы для каждого объявления
-    listings_dir = os.path.join(OUTPUT_DIR, 'listings')
-    for listing in all_listings:
-        if listing.get('type') != 'not_listing':
-            output_file = os.path.join(listings_dir, f"{listing['id']}.html")
-            generate_listing_page(
-                env=env,
-                listing=listing,
-                last_updated=formatted_now,
-                last_data_update=last_data_update,
-                output_file=output_file
-            )
+    # Поисковый индекс строится по тем же объявлениям, что и страницы
+    write_search_index([
+        listing for listing_type in CATEGORY_PAGES for listing in listings_by_type.get(listing_type, [])
+    ])
+
+    # Ленты последних объявлений по типам и городам
+    render_feeds(listings_by_type)
+
+    # Статистика рынка строится по сдающимся объявлениям
+    render_stats_page(env, listings_by_type.get('renting_out', []), last_updated, last_data_update)
 
     # Создаем редирект с index.html на renting.html
     index_html = """
@@ -342,6 +582,53 @@ def generate_site():
     """
     with open(os.path.join(OUTPUT_DIR, 'index.html'), 'w', encoding='utf-8') as f:
         f.write(index_html)
+
+@traced()
+def finalize_site():
+    """
+    Сохранение кэша рендеринга, минификация и сжатие файлов сайта
+    """
+    # Сохраняем кэш рендеринга текста для следующих запусков
+    render_cache.save()
+
+    # Минифицируем файлы и создаем сжатые копии
+    if MINIFY_OUTPUT or PRECOMPRESS_OUTPUT:
+        report = optimize_output(
+            OUTPUT_DIR,
+            ASSETS_MANIFEST_FILE,
+            minify=MINIFY_OUTPUT,
+            precompress=PRECOMPRESS_OUTPUT
+        )
+        print_size_report(report)
+
+@traced()
+def generate_site(data=None):
+    """
+    Генерация статического сайта.
+    data - уже загруженные обогащенные данные; если не переданы, читаются из файла
+    """
+    env = create_environment()
+    
+    # Загружаем объявления и время последнего обновления данных
+    listings_by_type, last_data_update, all_listings = load_listings(data)
+    
+    # Получаем текущее время в нужном часовом поясе
+    formatted_now = get_formatted_now()
+    
+    # Форматируем время последнего обновления данных
+    last_data_update = format_last_data_update(last_data_update)
+
+    render_category_pages(env, listings_by_type, formatted_now, last_data_update)
+
+    # Генерируем страницы для каждого объявления (вместе с копированием их фото)
+    matches = find_listing_matches(all_listings)
+    for listing in all_listings:
+        render_listing(env, listing, formatted_now, last_data_update, matches.get(listing.id))
+
+    # Страницы и фото объявлений, которых больше нет на сайте, удаляются
+    prune_output(all_listings)
+
+    finalize_site()
     
     print(f"Site generated successfully!")
     for listing_type, listings in listings_by_type.items():
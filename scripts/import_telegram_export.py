@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Импорт истории чата из экспорта Telegram Desktop (result.json и папка photos)
+в listings.json без обращения к API.
+
+Экспорт разбирается потоком, по одному сообщению, поэтому память не зависит
+от размера файла. Записи получают те же id, ссылки и photo_paths, что и при
+сборе через API: фото копируются в MEDIA_DIR под теми же именами.
+В экспорте нет grouped_id, поэтому группа медиа восстанавливается по соседним
+сообщениям: подряд идущие id, один отправитель, одно и то же время отправки
+(так Telegram сохраняет альбомы)
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+from datetime import datetime
+from itertools import chain
+
+import pytz
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import LISTINGS_FILE, MEDIA_DIR, TELEGRAM_CHAT_NAME, TIMEZONE
+from scripts.data_collector import get_media_relpath, get_message_link, get_photo_path
+from scripts.listing_store import iter_document, iter_listings, read_metadata, write_listings
+from scripts.models import Listing, hash_text, make_listing_id, namespace_legacy_ids
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+EXPORT_FILE = 'result.json'
+MESSAGES_KEY = 'messages'
+# Больше сообщений в альбоме Telegram не допускает
+MAX_ALBUM_SIZE = 10
+# Ключи сообщения экспорта, означающие вложение
+MEDIA_KEYS = ('photo', 'file', 'media_type', 'poll', 'location_information', 'contact_information')
+# Разметка текста как у message.text в telethon (markdown)
+MARKDOWN_DELIMITERS = {
+    'bold': '**',
+    'italic': '__',
+    'strikethrough': '~~',
+    'code': '`',
+    'pre': '```'
+}
+
+def get_text(message):
+    """
+    Текст сообщения экспорта: строка или список фрагментов с разметкой
+    """
+    text = message.get('text', '')
+    if isinstance(text, str):
+        return text
+    parts = []
+    for part in text:
+        if isinstance(part, str):
+            parts.append(part)
+            continue
+        part_text = part.get('text', '')
+        part_type = part.get('type')
+        if part_type in MARKDOWN_DELIMITERS:
+            delimiter = MARKDOWN_DELIMITERS[part_type]
+            parts.append(f"{delimiter}{part_text}{delimiter}")
+        elif part_type == 'text_link':
+            parts.append(f"[{part_text}]({part.get('href', '')})")
+        elif part_type == 'mention_name':
+            parts.append(f"[{part_text}](tg://user?id={part.get('user_id')})")
+        else:
+            parts.append(part_text)
+    return ''.join(parts)
+
+def get_date(message, key='date'):
+    """
+    Время сообщения (или его редактирования, key='edited') в TIMEZONE.
+    В старых экспортах нет {key}_unixtime, тогда время считается записанным в TIMEZONE
+    """
+    tz = pytz.timezone(TIMEZONE)
+    if message.get(f'{key}_unixtime'):
+        return datetime.fromtimestamp(int(message[f'{key}_unixtime']), tz)
+    if not message.get(key):
+        return None
+    return tz.localize(datetime.fromisoformat(message[key]))
+
+def has_media(message):
+    return any(key in message for key in MEDIA_KEYS)
+
+def is_same_album(album, message):
+    """
+    Продолжает ли сообщение текущую группу медиа
+    """
+    last = album[-1]
+    return (
+        len(album) < MAX_ALBUM_SIZE
+        and has_media(last) and has_media(message)
+        and message['id'] == last['id'] + 1
+        and message.get('from_id') == last.get('from_id')
+        and message.get('date_unixtime', message.get('date')) == last.get('date_unixtime', last.get('date'))
+    )
+
+def iter_export(export_path):
+    """
+    Разбирает result.json потоком. Первым выдает id чата из экспорта
+    (None, если его нет перед списком сообщений), затем сообщения
+    """
+    chat_id = None
+    started = False
+    for key, value in iter_document(export_path, MESSAGES_KEY):
+        if key == 'id':
+            chat_id = value
+            continue
+        if key is not None:
+            continue
+        if not started:
+            started = True
+            yield chat_id
+        if value.get('type') == 'message':
+            yield value
+    if not started:
+        yield chat_id
+
+def iter_albums(messages):
+    """
+    Группирует сообщения в группы медиа; одиночные сообщения - группы из одного
+    """
+    album = []
+    for message in messages:
+        if album and is_same_album(album, message):
+            album.append(message)
+            continue
+        if album:
+            yield album
+        album = [message]
+    if album:
+        yield album
+
+def copy_photos(album, chat_id, message_id, export_dir):
+    """
+    Копирует фото группы в MEDIA_DIR под именами, которые дал бы сборщик.
+    Номер фото - позиция сообщения в группе, как в download_photos
+    """
+    photo_paths = []
+    for i, media_message in enumerate(album):
+        photo = media_message.get('photo')
+        if not photo:
+            continue
+        photo_path = get_photo_path(chat_id, message_id, i + 1)
+        if not os.path.exists(photo_path):
+            source = os.path.join(export_dir, photo)
+            if not os.path.isfile(source):
+                # Экспорт без медиа: вместо пути указано, что файл не сохранен
+                logger.debug(f"Photo {photo} for message {chat_id}:{message_id} is not in the export")
+                continue
+            shutil.copyfile(source, photo_path)
+        photo_paths.append(get_media_relpath(photo_path))
+    return photo_paths if photo_paths else None
+
+def album_listings(album, chat_id, export_dir):
+    """
+    Объявления группы медиа по тем же правилам, что iter_messages: сообщение
+    с текстом получает фото всей группы, группа без текста пропускается,
+    одиночное фото без текста становится объявлением
+    """
+    grouped = len(album) > 1
+    for message in album:
+        text = get_text(message)
+        if not text and (grouped or 'photo' not in message):
+            continue
+        yield Listing(
+            id=make_listing_id(chat_id, message['id']),
+            text=text,
+            date=get_date(message),
+            # В экспорте есть только отображаемое имя отправителя, username нет
+            from_user=None,
+            media=has_media(message),
+            photo_paths=copy_photos(album, chat_id, message['id'], export_dir) if has_media(message) else None,
+            link=get_message_link(chat_id, message['id']),
+            edit_date=get_date(message, 'edited'),
+            text_hash=hash_text(text)
+        )
+
+def iter_export_listings(messages, chat_id, export_dir, existing_ids):
+    """
+    Объявления из сообщений экспорта, которых еще нет в existing_ids
+    """
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+    processed = 0
+    for album in iter_albums(messages):
+        if any(make_listing_id(chat_id, message['id']) in existing_ids for message in album):
+            continue
+        for listing in album_listings(album, chat_id, export_dir):
+            existing_ids.add(listing.id)
+            processed += 1
+            if processed % 1000 == 0:
+                logger.info(f"Imported {processed} messages from chat {chat_id}")
+            yield listing.to_dict()
+
+def iter_existing(listings_file):
+    """
+    Записи listings.json потоком (с префиксом чата у старых id)
+    """
+    for listing in iter_listings(listings_file):
+        namespace_legacy_ids([listing], TELEGRAM_CHAT_NAME)
+        yield listing
+
+def import_export(path, chat_id=None, listings_file=LISTINGS_FILE):
+    """
+    Добавляет сообщения экспорта в listings_file. Существующие записи
+    и экспорт читаются потоком, в памяти держатся только id.
+    Возвращает число добавленных сообщений
+    """
+    export_path = os.path.join(path, EXPORT_FILE) if os.path.isdir(path) else path
+    messages = iter_export(export_path)
+    export_chat_id = next(messages)
+    chat_id = str(chat_id or export_chat_id or '')
+    if not chat_id:
+        logger.error(f"No chat id in {export_path}, pass --chat-id")
+        return 0
+    logger.info(f"Importing chat {chat_id} from {export_path}")
+
+    existing_ids = {listing['id'] for listing in iter_existing(listings_file)}
+    total_before = len(existing_ids)
+
+    imported = iter_export_listings(messages, chat_id, os.path.dirname(export_path), existing_ids)
+    total = write_listings(listings_file, chain(iter_existing(listings_file), imported), read_metadata(listings_file))
+
+    added = total - total_before
+    logger.info(f"Added {added} messages from the export, total messages in database: {total}")
+    return added
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Импорт истории чата из экспорта Telegram Desktop')
+    parser.add_argument('path', help='Папка экспорта или путь к result.json')
+    parser.add_argument('--chat-id', help='ID канала, как в TELEGRAM_CHATS (по умолчанию - id из экспорта)')
+    args = parser.parse_args()
+
+    import_export(args.path, args.chat_id)
@@ -0,0 +1,216 @@
+"""
+Потоковое чтение и запись файлов объявлений.
+
+Файлы вида {"processed_at": ..., "listings": [...]} разбираются по одной записи,
+без загрузки всего документа в память, и записываются так же - по одной записи
+на строку. Архив хранится в формате JSON Lines (одна запись на строку) и только
+дописывается в конец, поэтому его размер не влияет на память обновления
+"""
+
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 16
+LISTINGS_KEY = 'listings'
+
+_decoder = json.JSONDecoder()
+
+class _StreamReader:
+    """
+    Буфер поверх файла: значения JSON декодируются по одному, файл дочитывается
+    блоками по мере необходимости
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        # Прочитанную часть буфера отбрасываем, чтобы он не рос вместе с файлом
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> Optional[str]:
+        """
+        Следующий символ после пробелов (None в конце файла)
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return None
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r}, got {found!r}")
+        self.pos += 1
+
+    def decode(self) -> Any:
+        """
+        Декодирует следующее значение JSON целиком
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                # Число на границе блока могло прочитаться не полностью
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            if not self._fill():
+                value, self.pos = _decoder.raw_decode(self.buffer, self.pos)
+                return value
+
+def iter_document(filepath: str, array_key: str = LISTINGS_KEY,
+                  stop_at_array: bool = False) -> Iterator[Tuple[Optional[str], Any]]:
+    """
+    Разбирает документ {"listings": [...], ...} потоком: для элементов массива
+    array_key выдает (None, элемент), для остальных ключей верхнего уровня - (ключ, значение).
+    С stop_at_array разбор заканчивается на массиве, и его элементы не декодируются
+    """
+    with open(filepath, 'r', encoding='utf-8') as f:
+        reader = _StreamReader(f)
+        reader.expect('{')
+        while True:
+            char = reader.peek()
+            if char == '}':
+                return
+            if char == ',':
+                reader.pos += 1
+                continue
+            key = reader.decode()
+            reader.expect(':')
+            if key != array_key:
+                yield key, reader.decode()
+                continue
+            if stop_at_array:
+                return
+            reader.expect('[')
+            while True:
+                char = reader.peek()
+                if char == ']':
+                    reader.pos += 1
+                    break
+                if char == ',':
+                    reader.pos += 1
+                    continue
+                yield None, reader.decode()
+
+def is_jsonl(filepath: str) -> bool:
+    return filepath.endswith('.jsonl')
+
+def iter_listings(filepath: str) -> Iterator[Dict[str, Any]]:
+    """
+    Объявления из файла по одному (JSON документ или JSON Lines).
+    Отсутствующий файл - пустой список
+    """
+    if not os.path.exists(filepath):
+        return
+    if is_jsonl(filepath):
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    for key, value in iter_document(filepath):
+        if key is None:
+            yield value
+
+def read_metadata(filepath: str) -> Dict[str, Any]:
+    """
+    Ключи документа перед списком объявлений (processed_at и т.п.; write_listings
+    пишет метаданные первыми). Чтение заканчивается на списке, записи не разбираются
+    """
+    if not os.path.exists(filepath) or is_jsonl(filepath):
+        return {}
+    return dict(iter_document(filepath, stop_at_array=True))
+
+def load_document(filepath: str) -> Dict[str, Any]:
+    """
+    Загружает документ целиком в виде {"listings": [...], ...}, разбирая файл потоком
+    """
+    document = {LISTINGS_KEY: []}
+    if not os.path.exists(filepath):
+        return document
+    if is_jsonl(filepath):
+        document[LISTINGS_KEY].extend(iter_listings(filepath))
+        return document
+    for key, value in iter_document(filepath):
+        if key is None:
+            document[LISTINGS_KEY].append(value)
+        else:
+            document[key] = value
+    return document
+
+def _dump_line(listing: Dict[str, Any]) -> str:
+    return json.dumps(listing, ensure_ascii=False, separators=(',', ':'))
+
+def write_listings(filepath: str, listings: Iterable[Dict[str, Any]], metadata: Dict[str, Any] = None) -> int:
+    """
+    Записывает документ по одному объявлению на строку (атомарно, через временный файл).
+    Метаданные пишутся перед списком, чтобы read_metadata не читал файл целиком.
+    Возвращает число записанных объявлений
+    """
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    tmp_path = f"{filepath}.tmp"
+    count = 0
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        if is_jsonl(filepath):
+            for listing in listings:
+                f.write(_dump_line(listing) + '\n')
+                count += 1
+        else:
+            f.write('{\n')
+            for key, value in (metadata or {}).items():
+                f.write(f"{json.dumps(key)}: {json.dumps(value, ensure_ascii=False)},\n")
+            f.write(f'"{LISTINGS_KEY}": [')
+            for listing in listings:
+                f.write(',\n' if count else '\n')
+                f.write(_dump_line(listing))
+                count += 1
+            f.write('\n]}\n')
+    os.replace(tmp_path, filepath)
+    return count
+
+def append_listings(filepath: str, listings: Iterable[Dict[str, Any]]) -> int:
+    """
+    Дописывает объявления в конец файла JSON Lines. Возвращает число записей
+    """
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    count = 0
+    with open(filepath, 'a', encoding='utf-8') as f:
+        for listing in listings:
+            f.write(_dump_line(listing) + '\n')
+            count += 1
+    return count
+
+def migrate_to_jsonl(legacy_path: str, filepath: str) -> int:
+    """
+    Переводит файл старого формата (JSON документ) в JSON Lines потоком
+    и удаляет старый файл. Возвращает число перенесенных записей
+    """
+    if not os.path.exists(legacy_path) or os.path.exists(filepath):
+        return 0
+    count = write_listings(filepath, iter_listings(legacy_path))
+    os.remove(legacy_path)
+    logger.info(f"Migrated {count} listings from {legacy_path} to {filepath}")
+    return count
@@ -0,0 +1,258 @@
+"""
+Подбор возможных совпадений: объявления «ищу» сопоставляются с объявлениями
+«сдаю» и «обмен» в том же городе (по каноническому id) с пересекающимися датами
+и подходящей ценой.
+
+Совпадения ранжируются по длине пересечения периодов в днях, как сортировка
+«по совпадению дат» на странице, и у объявления хранится не больше limit лучших.
+Чтобы не перебирать все пересекающиеся пары (в плотном городе их миллионы),
+лучшие партнеры периода ищутся заметающей прямой по трем классам:
+- начавшиеся не позже: пересечение растет с датой конца партнера;
+- закончившиеся не раньше: пересечение растет с уменьшением даты начала;
+- лежащие строго внутри: пересечение равно длине партнера.
+В первых двух классах перебор идет от лучших к худшим и останавливается на limit
+подходящих, в третьем - на партнерах короче текущего порога.
+Периоды без одной из дат и объявления без дат получают пересечение -1
+(как в DateIntervalIndex.query) и только добирают свободные места
+"""
+
+import bisect
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+from scripts.date_index import to_day_number
+from scripts.models import Listing, ListingId, ListingType
+
+# Пары типов: ищущие и предлагающие
+MATCH_PAIRS = [
+    (ListingType.LOOKING_FOR, ListingType.RENTING_OUT),
+    (ListingType.LOOKING_FOR, ListingType.EXCHANGE),
+]
+
+# Длина пересечения, если период открыт или дат нет (как в DateIntervalIndex.query)
+UNKNOWN_OVERLAP = -1
+
+# Объявления без дат добираются из самых новых кандидатов, но не больше limit * FILL_SCAN_FACTOR
+FILL_SCAN_FACTOR = 10
+
+class Match(NamedTuple):
+    listing: Listing
+    # Дней пересечения периодов; UNKNOWN_OVERLAP, если длина не определена
+    overlap: int
+
+class _TopMatches:
+    """
+    Лучшие совпадения одного объявления: позиция партнера -> (пересечение, время публикации)
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.best: Dict[int, Tuple[int, float]] = {}
+
+    def add(self, overlap: int, timestamp: float, position: int):
+        item = (overlap, timestamp)
+        current = self.best.get(position)
+        if current is not None:
+            if item > current:
+                self.best[position] = item
+            return
+        if len(self.best) < self.limit:
+            self.best[position] = item
+            return
+        worst = min(self.best, key=self.best.get)
+        if item > self.best[worst]:
+            del self.best[worst]
+            self.best[position] = item
+
+    def is_full(self) -> bool:
+        return len(self.best) >= self.limit
+
+    def threshold(self) -> int:
+        """
+        Пересечение, которое нужно превзойти, чтобы попасть в список
+        """
+        return min(overlap for overlap, _ in self.best.values()) if self.is_full() else 0
+
+    def ranked(self) -> List[Tuple[int, int]]:
+        return [
+            (position, overlap)
+            for position, (overlap, _) in sorted(self.best.items(), key=lambda item: item[1], reverse=True)
+        ]
+
+def price_fits(seeker: Listing, offer: Listing, tolerance: float) -> bool:
+    """
+    Цена предложения укладывается в бюджет ищущего с допуском tolerance.
+    Если одна из цен неизвестна или это обмен, цена не проверяется
+    """
+    if offer.type == ListingType.EXCHANGE or not seeker.price_eur or not offer.price_eur:
+        return True
+    return offer.price_eur <= seeker.price_eur * (1 + tolerance)
+
+def get_intervals(listing: Listing) -> List[Tuple[float, float]]:
+    """
+    Периоды аренды в номерах дней; отсутствующая дата - бесконечность в свою сторону
+    """
+    intervals = []
+    for period in listing.rental_periods:
+        start, end = to_day_number(period.start), to_day_number(period.end)
+        start = -math.inf if start is None else start
+        end = math.inf if end is None else end
+        if start <= end and (start, end) != (-math.inf, math.inf):
+            intervals.append((start, end))
+    return intervals
+
+def intervals_overlap(first: List[Tuple[float, float]], second: List[Tuple[float, float]]) -> bool:
+    return any(
+        max(start1, start2) <= min(end1, end2)
+        for start1, end1 in first for start2, end2 in second
+    )
+
+class _CityMatcher:
+    """
+    Совпадения в одном городе для одной пары типов. Объявления задаются
+    позициями в общем списке, side 0 - ищущие, side 1 - предлагающие
+    """
+
+    def __init__(self, listings: List[Listing], groups: Tuple[List[int], List[int]],
+                 top: Dict[int, _TopMatches], limit: int, tolerance: float):
+        self.listings = listings
+        self.groups = groups
+        self.top = top
+        self.limit = limit
+        self.tolerance = tolerance
+        self.timestamps = {position: listings[position].date.timestamp() for group in groups for position in group}
+        self.intervals = {position: get_intervals(listings[position]) for group in groups for position in group}
+        # Периоды с обеими датами: (начало, конец, позиция)
+        self.closed = tuple(
+            [
+                (start, end, position)
+                for position in group for start, end in self.intervals[position]
+                if start != -math.inf and end != math.inf
+            ]
+            for group in groups
+        )
+
+    def fits(self, side: int, position: int, other: int) -> bool:
+        seeker, offer = (position, other) if side == 0 else (other, position)
+        return price_fits(self.listings[seeker], self.listings[offer], self.tolerance)
+
+    def add(self, position: int, overlap: int, other: int):
+        matches = self.top.get(position)
+        if matches is None:
+            matches = self.top[position] = _TopMatches(self.limit)
+        matches.add(overlap, self.timestamps[other], other)
+
+    def match_started_earlier(self, side: int):
+        """
+        Партнеры, начавшиеся не позже периода: лучшие - с самым поздним концом
+        """
+        others = sorted(self.closed[1 - side])
+        ends: List[Tuple[float, int]] = []
+        next_other = 0
+        for start, end, position in sorted(self.closed[side]):
+            while next_other < len(others) and others[next_other][0] <= start:
+                other_start, other_end, other = others[next_other]
+                bisect.insort(ends, (other_end, other))
+                next_other += 1
+            found = set()
+            for other_end, other in reversed(ends):
+                if other_end < start or len(found) >= self.limit:
+                    break
+                if self.fits(side, position, other):
+                    self.add(position, int(min(end, other_end) - start + 1), other)
+                    found.add(other)
+
+    def match_ending_later(self, side: int):
+        """
+        Партнеры, закончившиеся не раньше периода: лучшие - с самым ранним началом
+        """
+        others = sorted(self.closed[1 - side], key=lambda interval: interval[1], reverse=True)
+        starts: List[Tuple[float, int]] = []
+        next_other = 0
+        for start, end, position in sorted(self.closed[side], key=lambda interval: interval[1], reverse=True):
+            while next_other < len(others) and others[next_other][1] >= end:
+                other_start, other_end, other = others[next_other]
+                bisect.insort(starts, (other_start, other))
+                next_other += 1
+            found = set()
+            for other_start, other in starts:
+                if other_start > end or len(found) >= self.limit:
+                    break
+                if self.fits(side, position, other):
+                    self.add(position, int(end - max(start, other_start) + 1), other)
+                    found.add(other)
+
+    def match_inside(self, side: int):
+        """
+        Партнеры строго внутри периода: пересечение равно их длине,
+        поэтому проверяются только начавшиеся достаточно рано, чтобы превзойти порог
+        """
+        others = sorted(self.closed[1 - side])
+        other_starts = [other_start for other_start, _, _ in others]
+        for start, end, position in self.closed[side]:
+            index = bisect.bisect_right(other_starts, start)
+            while index < len(others):
+                other_start, other_end, other = others[index]
+                index += 1
+                matches = self.top.get(position)
+                threshold = matches.threshold() if matches else 0
+                if other_start + threshold > end:
+                    break
+                length = other_end - other_start + 1
+                if other_end < end and length > threshold and self.fits(side, position, other):
+                    self.add(position, int(length), other)
+
+    def fill_unknown(self, side: int):
+        """
+        Добирает свободные места партнерами, у которых длина пересечения неизвестна:
+        с открытыми периодами или без дат. Просматриваются самые новые кандидаты
+        """
+        others = sorted(self.groups[1 - side], key=self.timestamps.get, reverse=True)
+        for position in self.groups[side]:
+            matches = self.top.get(position)
+            if matches and matches.is_full():
+                continue
+            intervals = self.intervals[position]
+            for other in others[:self.limit * FILL_SCAN_FACTOR]:
+                other_intervals = self.intervals[other]
+                if intervals and other_intervals and not intervals_overlap(intervals, other_intervals):
+                    continue
+                if self.fits(side, position, other):
+                    self.add(position, UNKNOWN_OVERLAP, other)
+                    if self.top[position].is_full():
+                        break
+
+    def run(self):
+        for side in (0, 1):
+            if self.closed[0] and self.closed[1]:
+                self.match_started_earlier(side)
+                self.match_ending_later(side)
+                self.match_inside(side)
+            self.fill_unknown(side)
+
+def find_matches(listings: Iterable[Listing], limit: int, price_tolerance: float) -> Dict[ListingId, List[Match]]:
+    """
+    Возможные совпадения для всех объявлений: id объявления -> совпадения,
+    отсортированные по длине пересечения дат (затем новые выше).
+    Объявления без города не сопоставляются
+    """
+    listings = list(listings)
+    by_city: Dict[str, Dict[ListingType, List[int]]] = defaultdict(lambda: defaultdict(list))
+    for position, listing in enumerate(listings):
+        if listing.city_key and listing.type is not None:
+            by_city[listing.city_key][listing.type].append(position)
+
+    top: Dict[int, _TopMatches] = {}
+    for groups in by_city.values():
+        for seeker_type, offer_type in MATCH_PAIRS:
+            if groups.get(seeker_type) and groups.get(offer_type):
+                _CityMatcher(
+                    listings, (groups[seeker_type], groups[offer_type]), top, limit, price_tolerance
+                ).run()
+
+    return {
+        listings[position].id: [Match(listings[other], overlap) for other, overlap in matches.ranked()]
+        for position, matches in top.items()
+        if matches.best
+    }
@@ -0,0 +1,345 @@
+"""
+Модель объявления: одна запись на исходное сообщение со списком периодов аренды.
+
+Объявление создается один раз при сборе или обогащении: даты аренды сразу
+приводятся к date с определенным годом, цена - к числу, тип - к ListingType.
+В JSON даты хранятся в ISO формате (YYYY-MM-DD), пустые поля не сохраняются
+"""
+
+import calendar
+import hashlib
+import re
+from dataclasses import dataclass, field, replace
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from scripts.config import TELEGRAM_CHAT_NAME
+
+class ListingType(str, Enum):
+    RENTING_OUT = "renting_out"  # Сдает квартиру
+    LOOKING_FOR = "looking_for"  # Ищет квартиру
+    EXCHANGE = "exchange"        # Обмен квартирами
+    NOT_LISTING = "not_listing"  # Не объявление
+
+    def __str__(self):
+        return self.value
+
+ListingId = Union[int, str]
+
+@dataclass(slots=True)
+class RentalPeriod:
+    """
+    Период аренды; отсутствующая дата означает открытый с этой стороны период
+    """
+    start: Optional[date] = None
+    end: Optional[date] = None
+
+    def to_dict(self) -> Dict[str, Optional[str]]:
+        return {
+            'start': self.start.isoformat() if self.start else None,
+            'end': self.end.isoformat() if self.end else None
+        }
+
+@dataclass(slots=True)
+class Listing:
+    """
+    Объявление из чата. Поля обогащения пустые, пока сообщение не обработано
+    """
+    id: ListingId
+    date: datetime
+    text: str = ""
+    from_user: Optional[str] = None
+    media: bool = False
+    photo_paths: Optional[List[str]] = None
+    link: Optional[str] = None
+    type: Optional[ListingType] = None
+    city: Optional[str] = None
+    country: Optional[str] = None
+    # Канонические id из справочника (scripts/gazetteer.json), если название найдено
+    city_id: Optional[str] = None
+    country_id: Optional[str] = None
+    # Версия справочника, в которой город не найден: до ее смены город не проверяется заново
+    gazetteer_version: Optional[str] = None
+    price_eur: Optional[Union[int, float]] = None
+    rental_periods: List[RentalPeriod] = field(default_factory=list)
+    enriched_at: Optional[datetime] = None
+    # Время последнего редактирования сообщения и хэш его текста (по ним находятся правки)
+    edit_date: Optional[datetime] = None
+    text_hash: Optional[str] = None
+    # Время, когда сообщение не нашлось в чате (удалено автором или модератором)
+    deleted_at: Optional[datetime] = None
+    # Поля, о которых модель не знает, сохраняются без изменений
+    extra: Dict[str, Any] = field(default_factory=dict)
+    # Отметка для отображения, в JSON не сохраняется
+    is_new: bool = False
+
+    @property
+    def slug(self) -> str:
+        """
+        Идентификатор для имен файлов, URL и id элементов страницы (без двоеточия)
+        """
+        return get_listing_slug(self.id, TELEGRAM_CHAT_NAME)
+
+    @property
+    def city_key(self) -> Optional[str]:
+        """
+        Ключ города для фильтров и группировки: id из справочника или исходное название
+        """
+        return self.city_id or self.city
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Listing':
+        """
+        Создает объявление из JSON записи (в том числе старого формата с датами DD.MM)
+        """
+        known = set(cls.__dataclass_fields__) | {'rental_start', 'rental_end'}
+        post_date = datetime.fromisoformat(data['date'])
+        listing_type = data.get('type')
+        return cls(
+            id=data['id'],
+            date=post_date,
+            text=data.get('text') or "",
+            from_user=data.get('from_user'),
+            media=bool(data.get('media')),
+            photo_paths=data.get('photo_paths') or None,
+            link=data.get('link'),
+            type=parse_listing_type(listing_type) if listing_type is not None else None,
+            city=data.get('city'),
+            country=data.get('country'),
+            city_id=data.get('city_id'),
+            country_id=data.get('country_id'),
+            gazetteer_version=data.get('gazetteer_version'),
+            price_eur=parse_price(data.get('price_eur')),
+            rental_periods=[
+                resolve_period(period.get('start'), period.get('end'), post_date)
+                for period in get_rental_periods(data)
+            ],
+            enriched_at=datetime.fromisoformat(data['enriched_at']) if data.get('enriched_at') else None,
+            edit_date=datetime.fromisoformat(data['edit_date']) if data.get('edit_date') else None,
+            text_hash=data.get('text_hash'),
+            deleted_at=datetime.fromisoformat(data['deleted_at']) if data.get('deleted_at') else None,
+            extra={key: value for key, value in data.items() if key not in known}
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Компактное JSON представление: пустые поля опускаются
+        """
+        data: Dict[str, Any] = {
+            'id': self.id,
+            'date': self.date.isoformat(),
+            'text': self.text,
+            'from_user': self.from_user,
+            'media': self.media or None,
+            'photo_paths': self.photo_paths,
+            'link': self.link,
+            'type': self.type.value if self.type else None,
+            'city': self.city,
+            'country': self.country,
+            'city_id': self.city_id,
+            'country_id': self.country_id,
+            'gazetteer_version': self.gazetteer_version,
+            'price_eur': self.price_eur,
+            'rental_periods': [period.to_dict() for period in self.rental_periods],
+            'enriched_at': self.enriched_at.isoformat() if self.enriched_at else None,
+            'edit_date': self.edit_date.isoformat() if self.edit_date else None,
+            'text_hash': self.text_hash,
+            'deleted_at': self.deleted_at.isoformat() if self.deleted_at else None
+        }
+        data = {key: value for key, value in data.items() if value not in (None, [], "")}
+        data.update(self.extra)
+        return data
+
+    def copy(self) -> 'Listing':
+        """
+        Поверхностная копия объявления
+        """
+        return replace(self)
+
+    def is_expired(self, today: date) -> bool:
+        """
+        Объявление истекло, когда закончились все его периоды аренды.
+        Объявления без периодов или с открытым концом периода остаются актуальными
+        """
+        if not self.rental_periods or any(period.end is None for period in self.rental_periods):
+            return False
+        return all(period.end < today for period in self.rental_periods)
+
+def make_listing_id(chat_id: Union[int, str], message_id: int) -> str:
+    """
+    Id объявления вида chat_id:message_id (id сообщений уникальны только внутри чата)
+    """
+    return f"{chat_id}:{message_id}"
+
+def get_message_id(listing_id: ListingId) -> int:
+    """
+    Id сообщения в чате (часть id объявления после префикса чата)
+    """
+    return int(str(listing_id).rsplit(':', 1)[-1])
+
+def hash_text(text: str) -> str:
+    """
+    Короткий хэш текста сообщения для сравнения версий
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+def get_text_hash(listing: Dict[str, Any]) -> str:
+    """
+    Хэш текста записи; у записей, собранных до его появления, считается по тексту
+    """
+    return listing.get('text_hash') or hash_text(listing.get('text') or "")
+
+def get_listing_chat(listing_id: ListingId, legacy_chat_id: Optional[str] = None) -> Optional[str]:
+    """
+    Чат, из которого собрано объявление. Id без префикса относятся к legacy_chat_id
+    """
+    listing_id = str(listing_id)
+    if ':' in listing_id:
+        return listing_id.split(':', 1)[0]
+    return legacy_chat_id
+
+def get_listing_slug(listing_id: ListingId, legacy_chat_id: Optional[str] = None) -> str:
+    """
+    Id объявления без двоеточия для имен файлов и URL. У объявлений из legacy_chat_id
+    префикс чата опускается, чтобы адреса их страниц остались такими же,
+    как до поддержки нескольких чатов
+    """
+    listing_id = str(listing_id)
+    if legacy_chat_id and get_listing_chat(listing_id) == str(legacy_chat_id):
+        listing_id = listing_id.split(':', 1)[1]
+    return listing_id.replace(':', '_')
+
+def namespace_legacy_ids(listings: Iterable[Dict[str, Any]], legacy_chat_id: Optional[str]) -> int:
+    """
+    Добавляет префикс чата к id записей, собранных до поддержки нескольких чатов.
+    Меняет записи на месте и возвращает число измененных записей
+    """
+    if not legacy_chat_id:
+        return 0
+    changed = 0
+    for listing in listings:
+        if ':' not in str(listing['id']):
+            listing['id'] = make_listing_id(legacy_chat_id, listing['id'])
+            changed += 1
+    return changed
+
+def make_period(start: Optional[str], end: Optional[str]) -> Dict[str, Optional[str]]:
+    """
+    Создает период аренды
+    """
+    return {'start': start, 'end': end}
+
+def get_rental_periods(listing: Dict[str, Any]) -> List[Dict[str, Optional[str]]]:
+    """
+    Возвращает периоды аренды объявления.
+    Поддерживает старый формат, где период хранился в полях rental_start/rental_end
+    """
+    if 'rental_periods' in listing:
+        periods = listing['rental_periods'] or []
+    else:
+        periods = [make_period(listing.get('rental_start'), listing.get('rental_end'))]
+    return [period for period in periods if period.get('start') or period.get('end')]
+
+def merge_listing_variants(listings: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Объединяет записи с одинаковым id (по одной на каждый диапазон дат в старом
+    формате) в одну запись со списком периодов. Порядок первых вхождений сохраняется
+    """
+    merged: Dict[Any, Dict[str, Any]] = {}
+    for listing in listings:
+        periods = get_rental_periods(listing)
+        record = merged.get(listing['id'])
+        if record is None:
+            record = {
+                key: value for key, value in listing.items()
+                if key not in ('rental_start', 'rental_end')
+            }
+            record['rental_periods'] = []
+            merged[listing['id']] = record
+        for period in periods:
+            if period not in record['rental_periods']:
+                record['rental_periods'].append(period)
+    return list(merged.values())
+
+def parse_listing_type(value: Any) -> ListingType:
+    """
+    Приводит тип объявления к ListingType; неизвестные значения считаются не объявлением
+    """
+    try:
+        return ListingType(value)
+    except ValueError:
+        return ListingType.NOT_LISTING
+
+def parse_price(value: Any) -> Optional[Union[int, float]]:
+    """
+    Приводит цену к числу ("1 200 €" -> 1200). Нулевая или нераспознанная цена - None
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        match = re.search(r'\d+(?:[.,]\d+)?', value.replace(' ', '').replace('\xa0', ''))
+        if not match:
+            return None
+        value = match.group().replace(',', '.')
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        return None
+    if price <= 0:
+        return None
+    return int(price) if price.is_integer() else price
+
+def parse_date(value: Any, post_date: Optional[datetime] = None,
+               is_start: bool = True, after: Optional[date] = None) -> Optional[date]:
+    """
+    Приводит дату аренды к date.
+
+    Поддерживаются форматы YYYY-MM-DD, DD.MM.YYYY, DD.MM и MM. Для дат без года
+    год определяется по дате публикации: месяц раньше месяца публикации означает
+    следующий год. Конец периода без года не может быть раньше начала (after)
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+
+    value = str(value).strip()
+    try:
+        if '-' in value:
+            return date.fromisoformat(value)
+        parts = value.split('.')
+        if len(parts) == 3:
+            return datetime.strptime(value, "%d.%m.%Y").date()
+        if post_date is None:
+            return None
+        if len(parts) == 1:  # Формат MM - весь месяц
+            month = int(parts[0])
+            day = None
+        else:  # Формат DD.MM
+            day, month = int(parts[0]), int(parts[1])
+
+        year = post_date.year
+        if month < post_date.month:
+            year += 1
+        if after is not None and (year, month) < (after.year, after.month):
+            year = after.year if month >= after.month else after.year + 1
+        last_day = calendar.monthrange(year, month)[1]
+        if day is None:
+            day = 1 if is_start else last_day
+        result = date(year, month, min(day, last_day))
+        if after is not None and result < after:
+            result = date(year + 1, month, min(day, calendar.monthrange(year + 1, month)[1]))
+        return result
+    except (ValueError, TypeError):
+        return None
+
+def resolve_period(start: Any, end: Any, post_date: Optional[datetime]) -> RentalPeriod:
+    """
+    Создает период аренды с датами, для которых определен год
+    """
+    start_date = parse_date(start, post_date, is_start=True)
+    end_date = parse_date(end, post_date, is_start=False, after=start_date)
+    return RentalPeriod(start_date, end_date)
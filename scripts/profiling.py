@@ -0,0 +1,190 @@
+"""
+Трассировка этапов обновления сайта: спаны в формате Chrome Trace Event
+(открывается в chrome://tracing и Perfetto) и cProfile по этапам
+"""
+
+import asyncio
+import contextlib
+import cProfile
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class Tracer:
+    """
+    Сборщик спанов. Пока трассировка не включена, спаны ничего не записывают,
+    поэтому инструментированные функции можно вызывать из отдельных скриптов
+    без накладных расходов
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.profile = False
+        self.profile_dir: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._track_ids: Dict[int, int] = {}
+
+    def enable(self, profile: bool = False, profile_dir: Optional[str] = None):
+        """
+        Включает запись спанов и, если нужно, cProfile для каждого этапа
+        """
+        self.enabled = True
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.events = []
+        self._origin = time.perf_counter()
+
+    def _track_id(self) -> int:
+        # Каждая asyncio задача получает свою дорожку, иначе пересекающиеся
+        # во времени спаны конкурентных задач отображаются некорректно
+        try:
+            key = id(asyncio.current_task())
+        except RuntimeError:
+            key = threading.get_ident()
+        with self._lock:
+            return self._track_ids.setdefault(key, len(self._track_ids) + 1)
+
+    def _record(self, name: str, category: str, start: float, end: float, args: Dict[str, Any]):
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': round((start - self._origin) * 1e6, 1),
+            'dur': round((end - start) * 1e6, 1),
+            'pid': os.getpid(),
+            'tid': self._track_id(),
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = 'span', **args):
+        """
+        Контекстный менеджер, записывающий длительность блока
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, category, start, time.perf_counter(), args)
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """
+        Спан этапа конвейера; с включенным профилированием этап запускается под cProfile
+        """
+        profiler = None
+        if self.enabled and self.profile:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            with self.span(name, category='stage'):
+                yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                if self.profile_dir:
+                    os.makedirs(self.profile_dir, exist_ok=True)
+                    path = os.path.join(self.profile_dir, f"{name}.prof")
+                    profiler.dump_stats(path)
+                    logger.info(f"Saved cProfile stats for stage '{name}' to {path}")
+
+    async def iterate(self, iterable, name: str):
+        """
+        Оборачивает асинхронный итератор, записывая время ожидания каждого элемента
+        """
+        iterator = iterable.__aiter__()
+        while True:
+            with self.span(name):
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield item
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        Сводка по спанам: количество вызовов, суммарное, среднее и максимальное время
+        """
+        totals: Dict[tuple, Dict[str, Any]] = {}
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            key = (event['cat'], event['name'])
+            item = totals.setdefault(key, {
+                'category': event['cat'], 'name': event['name'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0
+            })
+            duration = event['dur'] / 1000
+            item['count'] += 1
+            item['total_ms'] += duration
+            item['max_ms'] = max(item['max_ms'], duration)
+        result = sorted(totals.values(), key=lambda item: (item['category'] != 'stage', -item['total_ms']))
+        for item in result:
+            item['mean_ms'] = item['total_ms'] / item['count']
+        return result
+
+    def format_summary(self) -> str:
+        """
+        Сводка в виде текстовой таблицы
+        """
+        lines = [f"{'span':<32} {'count':>7} {'total, s':>10} {'mean, ms':>10} {'max, ms':>10}"]
+        for item in self.summary():
+            name = item['name'] if item['category'] == 'stage' else f"  {item['name']}"
+            lines.append(
+                f"{name:<32} {item['count']:>7} {item['total_ms'] / 1000:>10.2f} "
+                f"{item['mean_ms']:>10.1f} {item['max_ms']:>10.1f}"
+            )
+        return '\n'.join(lines)
+
+    def write_trace(self, path: str):
+        """
+        Сохраняет спаны в формате Chrome Trace Event вместе со сводкой
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'traceEvents': events,
+                'displayTimeUnit': 'ms',
+                'otherData': {'summary': self.summary()}
+            }, f, ensure_ascii=False)
+
+# Общий трассировщик для всех скриптов
+tracer = Tracer()
+
+def traced(name: Optional[str] = None, category: str = 'span'):
+    """
+    Декоратор, записывающий спан на каждый вызов функции (обычной или асинхронной)
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(span_name, category):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
@@ -0,0 +1,267 @@
+"""
+Публикация сайта в git без неограниченного роста репозитория.
+
+Файлы сайта сравниваются с последней опубликованной версией по хэшу
+содержимого (как у git blob). Файлы, в которых изменилось только время
+генерации в подвале (<span class="timestamp">), считаются неизмененными
+и остаются в прежней версии вместе со сжатыми копиями, поэтому коммит
+содержит только новый контент.
+
+В режиме отдельной ветки коммит собирается низкоуровневыми командами git
+во временном индексе (рабочая копия и текущая ветка не меняются), а история
+ветки обрезается до заданной глубины: старые версии сайта становятся
+недостижимыми и удаляются сборкой мусора, размер репозитория ограничен
+"""
+
+import hashlib
+import logging
+import os
+import re
+import subprocess
+import tempfile
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from scripts.profiling import traced
+
+logger = logging.getLogger(__name__)
+
+# Время генерации в подвале страниц меняется при каждом запуске
+_TIMESTAMP_RE = re.compile(rb'(<span class="timestamp">)[^<]*(</span>)')
+SIDECAR_EXTENSIONS = ('.gz', '.br')
+FILE_MODE = '100644'
+CHUNK_SIZE = 1 << 20
+
+class PublishError(RuntimeError):
+    """
+    Команда git при публикации завершилась с ошибкой
+    """
+
+def git(args: List[str], cwd: str, input: Optional[str] = None, env: Optional[Dict[str, str]] = None) -> str:
+    """
+    Выполняет команду git и возвращает stdout
+    """
+    process = subprocess.run(
+        ['git'] + args,
+        cwd=cwd,
+        input=input,
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, **env) if env else None
+    )
+    if process.returncode != 0:
+        raise PublishError(f"git {' '.join(args[:2])} failed: {process.stderr.strip()}")
+    return process.stdout
+
+def file_blob_sha(path: str) -> str:
+    """
+    Хэш содержимого файла, как его считает git (файл читается блоками)
+    """
+    digest = hashlib.sha1(b'blob %d\0' % os.path.getsize(path))
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+def mask_volatile(data: bytes) -> bytes:
+    """
+    Содержимое страницы без времени генерации
+    """
+    return _TIMESTAMP_RE.sub(rb'\1\2', data)
+
+def resolve_ref(cwd: str, ref: str) -> Optional[str]:
+    """
+    Коммит, на который указывает ref (None, если ref нет)
+    """
+    try:
+        return git(['rev-parse', '--verify', '-q', f"{ref}^{{commit}}"], cwd).strip() or None
+    except PublishError:
+        return None
+
+def read_tree(cwd: str, rev: Optional[str], prefix: str = '') -> Dict[str, str]:
+    """
+    Файлы дерева коммита rev (внутри prefix): путь относительно prefix -> хэш blob
+    """
+    if rev is None:
+        return {}
+    args = ['ls-tree', '-r', '-z', rev]
+    if prefix:
+        args += ['--', prefix]
+    entries = {}
+    for line in git(args, cwd).split('\0'):
+        if not line:
+            continue
+        info, path = line.split('\t', 1)
+        _, kind, sha = info.split()
+        if kind == 'blob':
+            entries[path[len(prefix):].lstrip('/') if prefix else path] = sha
+    return entries
+
+def read_blobs(cwd: str, shas: Iterable[str]) -> Dict[str, bytes]:
+    """
+    Содержимое blob'ов одним вызовом git cat-file --batch
+    """
+    shas = list(dict.fromkeys(shas))
+    if not shas:
+        return {}
+    process = subprocess.run(
+        ['git', 'cat-file', '--batch'],
+        cwd=cwd,
+        input=''.join(f"{sha}\n" for sha in shas).encode(),
+        capture_output=True
+    )
+    if process.returncode != 0:
+        raise PublishError(f"git cat-file failed: {process.stderr.decode().strip()}")
+    blobs = {}
+    output = process.stdout
+    position = 0
+    for sha in shas:
+        header_end = output.index(b'\n', position)
+        header = output[position:header_end].split()
+        if header[-1] == b'missing':
+            position = header_end + 1
+            continue
+        size = int(header[2])
+        blobs[sha] = output[header_end + 1:header_end + 1 + size]
+        position = header_end + 1 + size + 1
+    return blobs
+
+def _strip_sidecar(path: str) -> str:
+    for extension in SIDECAR_EXTENSIONS:
+        if path.endswith(extension):
+            return path[:-len(extension)]
+    return path
+
+def diff_output(cwd: str, output_dir: str, published: Dict[str, str]) -> Tuple[Dict[str, str], List[str], List[str]]:
+    """
+    Сравнивает файлы output_dir с опубликованной версией (путь -> хэш blob).
+    Возвращает итоговое дерево (путь -> хэш), пути файлов с новым содержимым
+    и удаленные пути. Файлы, отличающиеся только временем генерации, остаются
+    в опубликованной версии вместе со своими сжатыми копиями
+    """
+    current = {}
+    for root, _, files in os.walk(output_dir):
+        for filename in files:
+            path = os.path.join(root, filename)
+            current[os.path.relpath(path, output_dir).replace(os.sep, '/')] = file_blob_sha(path)
+
+    changed = {rel_path for rel_path, sha in current.items() if published.get(rel_path) != sha}
+    # Страницы, у которых изменилось только время генерации
+    candidates = [
+        rel_path for rel_path in changed
+        if rel_path.endswith('.html') and rel_path in published
+    ]
+    old_pages = read_blobs(cwd, (published[rel_path] for rel_path in candidates))
+    unchanged_pages = {
+        rel_path for rel_path in candidates
+        if published[rel_path] in old_pages
+        and mask_volatile(old_pages[published[rel_path]]) == mask_volatile(
+            _read_file(os.path.join(output_dir, rel_path))
+        )
+    }
+
+    tree = {}
+    new_paths = []
+    for rel_path, sha in current.items():
+        base = _strip_sidecar(rel_path)
+        if base in unchanged_pages and rel_path in published:
+            tree[rel_path] = published[rel_path]
+        elif rel_path in changed:
+            tree[rel_path] = sha
+            new_paths.append(rel_path)
+        else:
+            tree[rel_path] = published[rel_path]
+    removed = sorted(set(published) - set(current))
+    return tree, sorted(new_paths), removed
+
+def write_tree(cwd: str, output_dir: str, tree: Dict[str, str], new_paths: List[str]) -> str:
+    """
+    Записывает новые файлы в базу объектов и создает дерево во временном индексе
+    """
+    if new_paths:
+        written = git(
+            ['hash-object', '-w', '--no-filters', '--stdin-paths'], cwd,
+            input=''.join(f"{os.path.join(output_dir, rel_path)}\n" for rel_path in new_paths)
+        ).split()
+        for rel_path, sha in zip(new_paths, written):
+            tree[rel_path] = sha
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = {'GIT_INDEX_FILE': os.path.join(tmp_dir, 'index')}
+        git(
+            ['update-index', '--add', '-z', '--index-info'], cwd,
+            input=''.join(f"{FILE_MODE} {sha}\t{rel_path}\0" for rel_path, sha in sorted(tree.items())),
+            env=env
+        )
+        return git(['write-tree'], cwd, env=env).strip()
+
+def squash_history(cwd: str, head: str, depth: int) -> str:
+    """
+    Оставляет в истории не больше depth последних коммитов: самый старый
+    из них пересоздается без родителя, остальные - поверх него
+    """
+    commits = git(['rev-list', '--first-parent', f"--max-count={depth + 1}", head], cwd).split()
+    if len(commits) <= depth:
+        return head
+    parent = None
+    for commit in reversed(commits[:depth]):
+        tree = git(['rev-parse', f"{commit}^{{tree}}"], cwd).strip()
+        message = git(['log', '-1', '--format=%B', commit], cwd)
+        date = git(['log', '-1', '--format=%aI', commit], cwd).strip()
+        args = ['commit-tree', tree, '-F', '-'] + (['-p', parent] if parent else [])
+        parent = git(args, cwd, input=message, env={'GIT_AUTHOR_DATE': date, 'GIT_COMMITTER_DATE': date}).strip()
+    return parent
+
+@traced()
+def publish_branch(output_dir: str, branch: str, depth: int, remote: Optional[str], message: str) -> bool:
+    """
+    Публикует содержимое output_dir в корень ветки branch отдельным коммитом,
+    обрезает историю ветки до depth коммитов и пушит ее в remote (если задан).
+    Возвращает True, если появился новый коммит
+    """
+    output_dir = os.path.abspath(output_dir)
+    cwd = os.path.dirname(output_dir)
+    ref = f"refs/heads/{branch}"
+    head = resolve_ref(cwd, ref)
+    if head is None and remote:
+        head = resolve_ref(cwd, f"refs/remotes/{remote}/{branch}")
+
+    published = read_tree(cwd, head)
+    tree, new_paths, removed = diff_output(cwd, output_dir, published)
+    tree_sha = write_tree(cwd, output_dir, tree, new_paths)
+    if head is not None and tree_sha == git(['rev-parse', f"{head}^{{tree}}"], cwd).strip():
+        logger.info(f"No content changes to publish on {branch}")
+        return False
+
+    args = ['commit-tree', tree_sha, '-m', message] + (['-p', head] if head else [])
+    commit = squash_history(cwd, git(args, cwd).strip(), depth)
+    git(['update-ref', ref, commit], cwd)
+    logger.info(f"Published {len(new_paths)} changed and {len(removed)} removed files to {branch} ({commit[:10]})")
+
+    if remote:
+        # История ветки переписывается при обрезке, поэтому пуш принудительный
+        git(['push', '--force', remote, f"{ref}:{ref}"], cwd)
+        logger.info(f"Pushed {branch} to {remote}")
+    return True
+
+def stage_changed_output(output_dir: str) -> Tuple[List[str], List[str]]:
+    """
+    Добавляет в индекс текущей ветки только файлы output_dir с новым содержимым
+    и удаленные файлы. Файлы, в которых изменилось только время генерации,
+    не добавляются. Возвращает добавленные и удаленные пути
+    """
+    output_dir = os.path.abspath(output_dir)
+    cwd = os.path.dirname(output_dir)
+    prefix = os.path.basename(output_dir)
+    published = read_tree(cwd, resolve_ref(cwd, 'HEAD'), prefix + '/')
+    _, new_paths, removed = diff_output(cwd, output_dir, published)
+    paths = [f"{prefix}/{rel_path}" for rel_path in new_paths + removed]
+    if paths:
+        git(
+            ['add', '-A', '--pathspec-from-file=-', '--pathspec-file-nul'], cwd,
+            input='\0'.join(paths), env={'GIT_LITERAL_PATHSPECS': '1'}
+        )
+    return new_paths, removed
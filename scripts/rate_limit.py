@@ -0,0 +1,59 @@
+"""
+Общий бюджет запросов к Telegram для задач, работающих через один клиент
+"""
+
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class RateBudget:
+    """
+    Token bucket, общий для всех конкурентных задач одного клиента.
+    Перед каждым запросом задача забирает токен; после FloodWait пауза
+    распространяется на все задачи, а не только на получившую ошибку.
+    rate <= 0 отключает ограничение
+    """
+
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.requests = 0
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """
+        Ждет, пока в бюджете появится свободный запрос
+        """
+        self.requests += 1
+        if self.rate <= 0 and self._blocked_until <= time.monotonic():
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                if self.rate <= 0:
+                    return
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """
+        Приостанавливает все запросы (например, после FloodWaitError)
+        """
+        logger.warning(f"Pausing all Telegram requests for {seconds} seconds")
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
@@ -0,0 +1,97 @@
+"""
+Кэш результатов рендеринга текста объявлений в HTML
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Callable, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+class RenderCache:
+    """
+    Двухуровневый кэш рендеринга: словарь в памяти на время запуска и JSON файл
+    между запусками. Ключ - хэш текста вместе с версией рендерера, поэтому при
+    обновлении markdown2 или правил форматирования записи пересчитываются.
+    Версия может быть функцией: тогда она вычисляется при первом обращении к кэшу.
+    Запись удаляется, только если ее не использовали дольше max_age_days, поэтому
+    частичные запуски (пайплайн, сервер разработки) не вытесняют остальные записи
+    """
+
+    def __init__(self, filepath: str, version: Union[str, Callable[[], str]], max_age_days: float = 30):
+        self.filepath = filepath
+        self._version = version
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._entries: Optional[Dict[str, str]] = None
+        # Время последнего использования записи (unix time)
+        self._used_at: Dict[str, float] = {}
+
+    @property
+    def version(self) -> str:
+        if callable(self._version):
+            self._version = self._version()
+        return self._version
+
+    def _load(self) -> Dict[str, str]:
+        if self._entries is None:
+            self._entries = {}
+            try:
+                if os.path.exists(self.filepath):
+                    with open(self.filepath, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    if data.get('version') == self.version:
+                        self._entries = data.get('entries', {})
+                        self._used_at = data.get('used_at', {})
+            except Exception as e:
+                logger.error(f"Error loading render cache {self.filepath}: {e}")
+        return self._entries
+
+    def key(self, text: str) -> str:
+        """
+        Ключ записи кэша для текста
+        """
+        return hashlib.sha256(f"{self.version}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_or_render(self, text: str, render: Callable[[str], str]) -> str:
+        """
+        Возвращает HTML из кэша или рендерит текст и запоминает результат
+        """
+        entries = self._load()
+        key = self.key(text)
+        self._used_at[key] = time.time()
+        html = entries.get(key)
+        if html is None:
+            self.misses += 1
+            html = render(text)
+            entries[key] = html
+        else:
+            self.hits += 1
+        return html
+
+    def save(self):
+        """
+        Сохраняет кэш на диск, удаляя записи, которые не использовались дольше max_age_days.
+        Записи из файлов старого формата (без времени использования) считаются использованными сейчас
+        """
+        if self._entries is None:
+            return
+        now = time.time()
+        expires = now - self.max_age_days * 86400
+        used_at = {key: self._used_at.get(key, now) for key in self._entries}
+        entries = {key: html for key, html in self._entries.items() if used_at[key] >= expires}
+        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+        tmp_path = f"{self.filepath}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': self.version,
+                'entries': entries,
+                'used_at': {key: round(used_at[key]) for key in entries}
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self.filepath)
+        logger.info(f"Render cache: {self.hits} hits, {self.misses} misses, {len(entries)} entries saved, "
+                    f"{len(self._entries) - len(entries)} expired")
@@ -0,0 +1,105 @@
+"""
+Состояние запусков update_site: блокировка от параллельных запусков и
+отпечатки входных данных этапов для пропуска этапов без изменений
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+class RunLockError(RuntimeError):
+    """
+    Другой запуск уже держит блокировку
+    """
+
+class RunLock:
+    """
+    Файловая блокировка (flock), не позволяющая двум запускам одновременно
+    изменять данные и docs/. Блокировка снимается ОС даже при падении процесса
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, 'a+')
+        try:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            self._file = None
+            raise RunLockError(f"Another update is already running (lock file {self.path})")
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(str(os.getpid()))
+        self._file.flush()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+def load_run_state(path: str) -> Dict[str, Any]:
+    """
+    Загружает состояние прошлых запусков
+    """
+    try:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading run state {path}: {e}")
+    return {}
+
+def save_run_state(path: str, state: Dict[str, Any]):
+    """
+    Сохраняет состояние запусков (атомарно, через временный файл)
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def fingerprint(*parts: Any) -> str:
+    """
+    Отпечаток произвольных JSON-сериализуемых значений
+    """
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+def file_fingerprint(path: str) -> Optional[str]:
+    """
+    Хэш содержимого файла (None, если файла нет)
+    """
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def tree_fingerprint(directories: Iterable[str]) -> str:
+    """
+    Отпечаток дерева файлов по путям, размерам и времени изменения (без чтения содержимого).
+    Кэш байткода Python не учитывается
+    """
+    digest = hashlib.sha256()
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+            for file in sorted(files):
+                path = os.path.join(root, file)
+                stat = os.stat(path)
+                digest.update(f"{os.path.relpath(path, directory)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
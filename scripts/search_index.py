@@ -0,0 +1,214 @@
+"""
+Статический полнотекстовый индекс объявлений для поиска на сайте.
+
+Индекс - инвертированный список термов по тексту, городу и стране, разбитый на
+шарды по первым двум символам терма: браузер загружает только шарды для
+введенных слов. Нормализация (нижний регистр, ё -> е, отсечение окончаний)
+повторяется в static/js/search.js и должна совпадать с ним.
+
+Индекс строится инкрементально: термы объявления пересчитываются только при
+изменении его текста, номера документов не меняются между запусками, а файлы
+шардов перезаписываются только при изменении содержимого
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Версия нормализации; увеличить при изменении tokenize/normalize_token (и search.js)
+TOKENIZER_VERSION = 1
+
+SHARD_PREFIX_LENGTH = 2
+MIN_TOKEN_LENGTH = 2
+# Вес термов города и страны относительно термов текста
+LOCATION_WEIGHT = 3
+# Доля пустых номеров документов, после которой нумерация строится заново
+MAX_HOLES_RATIO = 0.25
+
+WORD_RE = re.compile(r'[0-9a-zа-я]+')
+
+RU_ENDINGS = sorted([
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ой', 'ом', 'ем', 'ам', 'ям',
+    'ах', 'ях', 'ов', 'ев', 'ей', 'ую', 'юю', 'ию', 'ия', 'ье', 'ья',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й'
+], key=len, reverse=True)
+EN_ENDINGS = ['ing', 'ed', 's']
+
+STOP_WORDS = {
+    'на', 'по', 'до', 'за', 'от', 'из', 'не', 'но', 'то', 'же', 'ли', 'бы', 'во', 'со',
+    'the', 'and', 'for', 'to', 'in', 'on', 'of', 'at', 'is', 'it', 'or', 'an'
+}
+
+def normalize_token(token: str) -> str:
+    """
+    Приводит слово к форме для индекса: отсекает самое длинное подходящее окончание
+    """
+    if token.isdigit():
+        return token
+    if 'a' <= token[0] <= 'z':
+        for ending in EN_ENDINGS:
+            if token.endswith(ending) and not token.endswith('ss') and len(token) - len(ending) >= 3:
+                return token[:-len(ending)]
+        return token
+    for ending in RU_ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= 3:
+            return token[:-len(ending)]
+    return token
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    Разбивает текст на нормализованные термы (без стоп-слов и слишком коротких слов)
+    """
+    if not text:
+        return []
+    words = WORD_RE.findall(text.lower().replace('ё', 'е'))
+    return [
+        normalize_token(word) for word in words
+        if len(word) >= MIN_TOKEN_LENGTH and word not in STOP_WORDS
+    ]
+
+def shard_key(term: str) -> str:
+    """
+    Имя шарда для терма: коды первых символов в hex (имена файлов только из ASCII)
+    """
+    return ''.join(f"{ord(char):04x}" for char in term[:SHARD_PREFIX_LENGTH])
+
+def document_terms(text: Optional[str], city: Optional[str], country: Optional[str]) -> Dict[str, int]:
+    """
+    Веса термов документа: частота в тексте плюс повышенный вес города и страны
+    """
+    terms = Counter(tokenize(text))
+    for term in tokenize(city) + tokenize(country):
+        terms[term] += LOCATION_WEIGHT
+    return dict(terms)
+
+class SearchIndexBuilder:
+    """
+    Инкрементальный построитель индекса. Состояние (термы документов и
+    нумерация) хранится в state_file между запусками
+    """
+
+    def __init__(self, state_file: str):
+        self.state_file = state_file
+        self.tokenized = 0
+        state = self._load()
+        self.docs: List[Optional[str]] = state.get('docs', [])
+        self.terms: Dict[str, Dict[str, Any]] = state.get('terms', {})
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            if os.path.exists(self.state_file):
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get('version') == TOKENIZER_VERSION:
+                    return state
+        except Exception as e:
+            logger.error(f"Error loading search index state {self.state_file}: {e}")
+        return {}
+
+    def save(self):
+        """
+        Сохраняет состояние для следующего запуска (атомарно, через временный файл)
+        """
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': TOKENIZER_VERSION, 'docs': self.docs, 'terms': self.terms},
+                      f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.state_file)
+
+    def update(self, documents: Iterable[Dict[str, Any]]):
+        """
+        Обновляет индекс до переданного набора документов (slug, text, city, country).
+        Документы, которых нет в наборе, удаляются из индекса
+        """
+        current = {}
+        for document in documents:
+            content = '\0'.join(str(document.get(key) or '') for key in ('text', 'city', 'country'))
+            digest = hashlib.sha1(content.encode('utf-8')).hexdigest()
+            entry = self.terms.get(document['slug'])
+            if entry is None or entry['hash'] != digest:
+                entry = {
+                    'hash': digest,
+                    'terms': document_terms(document.get('text'), document.get('city'), document.get('country'))
+                }
+                self.tokenized += 1
+            current[document['slug']] = entry
+        self.terms = current
+
+        # Номера документов сохраняются между запусками, чтобы не менялись все шарды
+        self.docs = [slug if slug in current else None for slug in self.docs]
+        if self.docs and self.docs.count(None) > len(self.docs) * MAX_HOLES_RATIO:
+            self.docs = [slug for slug in self.docs if slug is not None]
+        known = set(self.docs)
+        self.docs.extend(sorted(slug for slug in current if slug not in known))
+
+    def build_shards(self) -> Dict[str, Dict[str, List[int]]]:
+        """
+        Шарды индекса: терм -> плоский список [номер документа, вес, ...]
+        """
+        shards: Dict[str, Dict[str, List[int]]] = {}
+        for number, slug in enumerate(self.docs):
+            if slug is None:
+                continue
+            for term, weight in self.terms[slug]['terms'].items():
+                postings = shards.setdefault(shard_key(term), {}).setdefault(term, [])
+                postings.extend((number, weight))
+        return shards
+
+    def write(self, output_dir: str) -> Dict[str, int]:
+        """
+        Записывает docs.json и шарды в output_dir; неизмененные файлы не трогаются,
+        шарды без термов удаляются. Возвращает статистику записи
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        lengths = [
+            sum(self.terms[slug]['terms'].values()) if slug is not None else 0
+            for slug in self.docs
+        ]
+        present = [length for slug, length in zip(self.docs, lengths) if slug is not None]
+        files = {
+            'docs.json': {
+                'version': TOKENIZER_VERSION,
+                'prefix': SHARD_PREFIX_LENGTH,
+                'docs': self.docs,
+                'lengths': lengths,
+                'count': len(present),
+                'avg_length': round(sum(present) / len(present), 2) if present else 0
+            }
+        }
+        for key, shard in self.build_shards().items():
+            files[f"{key}.json"] = {term: shard[term] for term in sorted(shard)}
+
+        written = 0
+        for filename, content in files.items():
+            data = json.dumps(content, ensure_ascii=False, separators=(',', ':'))
+            path = os.path.join(output_dir, filename)
+            if _read_text(path) != data:
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                written += 1
+
+        removed = 0
+        for filename in os.listdir(output_dir):
+            base = filename.split('.json')[0] + '.json'
+            if filename.endswith(('.json', '.json.gz', '.json.br')) and base not in files:
+                os.remove(os.path.join(output_dir, filename))
+                removed += 1
+
+        return {'documents': len(present), 'shards': len(files) - 1, 'written': written,
+                'removed': removed, 'tokenized': self.tokenized}
+
+def _read_text(path: str) -> Optional[str]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
@@ -0,0 +1,148 @@
+"""
+Генератор синтетического чата объявлений для бенчмарков: русские и английские
+тексты, диапазоны дат, цены, альбомы фотографий и повторные публикации
+"""
+
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pytz
+
+CITIES = [
+    ('Берлин', 'Германия', 'Berlin', 'Germany'),
+    ('Мюнхен', 'Германия', 'Munich', 'Germany'),
+    ('Париж', 'Франция', 'Paris', 'France'),
+    ('Лиссабон', 'Португалия', 'Lisbon', 'Portugal'),
+    ('Белград', 'Сербия', 'Belgrade', 'Serbia'),
+    ('Тбилиси', 'Грузия', 'Tbilisi', 'Georgia'),
+    ('Ереван', 'Армения', 'Yerevan', 'Armenia'),
+    ('Стамбул', 'Турция', 'Istanbul', 'Turkey'),
+    ('Барселона', 'Испания', 'Barcelona', 'Spain'),
+    ('Амстердам', 'Нидерланды', 'Amsterdam', 'Netherlands'),
+]
+
+MONTHS_RU = ['января', 'февраля', 'марта', 'апреля', 'мая', 'июня', 'июля',
+             'августа', 'сентября', 'октября', 'ноября', 'декабря']
+MONTHS_EN = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+             'August', 'September', 'October', 'November', 'December']
+
+TEMPLATES_RU = {
+    'renting_out': [
+        "Сдаю **{rooms}-комнатную квартиру** в городе {city}, {period}. Цена {price} € в месяц. #{tag} #сдаю",
+        "Сдается комната в {city} {period}, {price} евро. Рядом метро, есть стиральная машина.\nПишите в ЛС",
+    ],
+    'looking_for': [
+        "Ищу квартиру в {city} {period}, бюджет до {price} €. #{tag} #ищу",
+        "Ищем жилье для семьи с котом: {city}, {period}. Рассмотрим варианты до {price} евро",
+    ],
+    'exchange': [
+        "Меняю квартиру в {city} на любой город Европы {period}. #{tag} #обмен",
+    ],
+    'not_listing': [
+        "Подскажите, как в {city} получить ВНЖ? Спасибо!",
+        "Всем привет! Кто-нибудь знает хорошего стоматолога в {city}?",
+    ]
+}
+
+TEMPLATES_EN = {
+    'renting_out': [
+        "Renting out a **{rooms}-bedroom flat** in {city} {period}. {price} EUR per month. #{tag}",
+        "Room available in {city} {period}, {price}€, bills included.",
+    ],
+    'looking_for': [
+        "Looking for a flat in {city} {period}, budget up to {price} EUR. #{tag}",
+    ],
+    'exchange': [
+        "Swap my apartment in {city} for any place in Europe {period}.",
+    ],
+    'not_listing': [
+        "Does anyone know a good coworking in {city}?",
+    ]
+}
+
+TYPE_WEIGHTS = [('renting_out', 45), ('looking_for', 30), ('exchange', 10), ('not_listing', 15)]
+
+def _format_period_ru(start: datetime, end: datetime) -> str:
+    return f"с {start.day} {MONTHS_RU[start.month - 1]} по {end.day} {MONTHS_RU[end.month - 1]}"
+
+def _format_period_en(start: datetime, end: datetime) -> str:
+    return f"from {MONTHS_EN[start.month - 1]} {start.day} to {MONTHS_EN[end.month - 1]} {end.day}"
+
+def generate_message(rng: random.Random, message_id: int, post_date: datetime,
+                     photos_per_album: int = 10) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Генерирует одно сообщение чата и ответ, который должна вернуть модель при обогащении
+    """
+    listing_type = rng.choices([t for t, _ in TYPE_WEIGHTS], weights=[w for _, w in TYPE_WEIGHTS])[0]
+    city_ru, country_ru, city_en, country_en = rng.choice(CITIES)
+    english = rng.random() < 0.3
+
+    start = post_date + timedelta(days=rng.randint(0, 90))
+    end = start + timedelta(days=rng.randint(7, 120))
+    price = rng.choice([None, rng.randrange(300, 3000, 50)])
+    template = rng.choice((TEMPLATES_EN if english else TEMPLATES_RU)[listing_type])
+    text = template.format(
+        rooms=rng.randint(1, 4),
+        city=city_en if english else city_ru,
+        period=(_format_period_en if english else _format_period_ru)(start, end),
+        price=price or 'договорная',
+        tag=city_en.lower()
+    )
+
+    # Примерно у трети объявлений есть альбом фотографий
+    photo_paths = None
+    if listing_type != 'not_listing' and rng.random() < 0.35:
+        photo_paths = [
+            f"data/media/photo_{message_id}_{index + 1}.jpg"
+            for index in range(rng.randint(1, photos_per_album))
+        ]
+
+    message = {
+        'id': message_id,
+        'text': text,
+        'date': post_date.isoformat(),
+        'from_user': f"user{rng.randint(1, 5000)}",
+        'media': photo_paths is not None,
+        'photo_paths': photo_paths,
+        'link': f"https://t.me/c/1000000/{message_id}"
+    }
+    extracted = {
+        'city': city_ru,
+        'country': country_ru,
+        'rental_periods': [] if listing_type == 'not_listing' else [
+            {'start': start.strftime("%d.%m"), 'end': end.strftime("%d.%m")}
+        ],
+        'price_eur': price,
+        'type': listing_type
+    }
+    return message, extracted
+
+def generate_chat(count: int, seed: int = 0, days: int = 60, repost_rate: float = 0.1,
+                  now: Optional[datetime] = None, timezone: str = 'Europe/Berlin'
+                  ) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Генерирует count сообщений за последние days дней (от старых к новым).
+    Часть сообщений - повторные публикации ранее опубликованных объявлений
+    с новым id и датой
+    """
+    rng = random.Random(seed)
+    tz = pytz.timezone(timezone)
+    now = now or datetime.now(tz)
+    first = now - timedelta(days=days)
+    step = timedelta(days=days) / max(count, 1)
+    recent: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+
+    for index in range(count):
+        message_id = index + 1
+        post_date = first + step * index
+        if recent and rng.random() < repost_rate:
+            original, extracted = rng.choice(recent)
+            message = dict(original, id=message_id, date=post_date.isoformat(),
+                           link=f"https://t.me/c/1000000/{message_id}")
+        else:
+            message, extracted = generate_message(rng, message_id, post_date)
+            recent.append((message, extracted))
+            if len(recent) > 500:
+                recent.pop(0)
+        yield message, extracted
@@ -8,15 +8,39 @@ import sys
 import argparse
 import logging
 import asyncio
-import importlib.util
-from datetime import datetime
+import importlib
+from datetime import datetime, timedelta
 import pytz
 import subprocess
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 # Добавляем путь к корню проекта
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from scripts.config import TIMEZONE, OUTPUT_DIR
+from scripts.config import (
+    TIMEZONE,
+    OUTPUT_DIR,
+    STATIC_DIR,
+    LISTINGS_ENRICHED_FILE,
+    TRACES_DIR,
+    RUN_STATE_FILE,
+    RUN_LOCK_FILE,
+    CHECK_INTERVAL_HOURS,
+    PUBLISH_BRANCH,
+    PUBLISH_HISTORY_DEPTH,
+    PUBLISH_REMOTE
+)
+from scripts.run_state import (
+    RunLock,
+    RunLockError,
+    load_run_state,
+    save_run_state,
+    fingerprint,
+    file_fingerprint,
+    tree_fingerprint
+)
+from scripts.profiling import tracer, traced
+from scripts.publish import PublishError, publish_branch, stage_changed_output
+from scripts.models import Listing
 
 # Настройка логирования
 logging.basicConfig(
@@ -25,37 +49,54 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Размер очередей между этапами конвейера
+PIPELINE_QUEUE_SIZE = 32
+# Количество одновременных запросов к OpenAI в режиме конвейера
+ENRICH_WORKERS = 4
+
 def import_script(script_name):
     """
-    Импортирует скрипт по имени из текущей директории
+    Импортирует скрипт по имени из пакета scripts.
+    Модули кэшируются в sys.modules и не имеют побочных эффектов при импорте,
+    а тяжелые зависимости (telethon, openai, jinja2, markdown2) загружаются
+    только при запуске соответствующего этапа
     """
-    script_path = os.path.join(os.path.dirname(__file__), f"{script_name}.py")
-    spec = importlib.util.spec_from_file_location(script_name, script_path)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
-    return module
+    return importlib.import_module(f"scripts.{script_name}")
 
 def run_git_command(command: List[str]) -> Tuple[int, str, str]:
     """
     Запускает git команду и возвращает код возврата, stdout и stderr
     """
     try:
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        stdout, stderr = process.communicate()
+        with tracer.span(' '.join(command[:2]), 'git'):
+            process = subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
+            stdout, stderr = process.communicate()
         return process.returncode, stdout, stderr
     except Exception as e:
         logger.error(f"Error running git command {' '.join(command)}: {e}")
         return 1, "", str(e)
 
+@traced()
 def update_git_repo():
     """
-    Обновляет Git репозиторий: добавляет изменения, создает коммит и пушит
+    Обновляет Git репозиторий: добавляет изменения, создает коммит и пушит.
+    В коммит попадают только файлы сайта с новым содержимым; если задан
+    PUBLISH_BRANCH, сайт публикуется в отдельную ветку с ограниченной историей
     """
+    commit_message = f"Update site data and pages ({datetime.now(pytz.timezone(TIMEZONE)).strftime('%Y-%m-%d %H:%M')})"
+    if PUBLISH_BRANCH:
+        try:
+            publish_branch(OUTPUT_DIR, PUBLISH_BRANCH, PUBLISH_HISTORY_DEPTH, PUBLISH_REMOTE or None, commit_message)
+            return True
+        except PublishError as e:
+            logger.error(f"Error publishing to {PUBLISH_BRANCH}: {e}")
+            return False
+
     try:
         # Проверяем статус Git
         returncode, stdout, stderr = run_git_command(['git', 'status', '--porcelain'])
@@ -68,20 +109,16 @@ def update_git_repo():
             logger.info("No changes to commit")
             return True
 
-        # Добавляем файлы в индекс
-        paths_to_add = [
-            OUTPUT_DIR,                    # docs директория
-            # os.path.join(DATA_DIR, '*.json')  # JSON файлы с данными
-        ]
-        
-        for path in paths_to_add:
-            returncode, stdout, stderr = run_git_command(['git', 'add', path])
-            if returncode != 0:
-                logger.error(f"Failed to add {path} to git: {stderr}")
-                return False
+        # Добавляем в индекс файлы docs/, содержимое которых изменилось
+        # (страницы, где поменялось только время генерации, не добавляются)
+        with tracer.span('git add', 'git'):
+            changed, removed = stage_changed_output(OUTPUT_DIR)
+        if not changed and not removed:
+            logger.info("Only generation timestamps changed, nothing to commit")
+            return True
+        logger.info(f"Staged {len(changed)} changed and {len(removed)} removed site files")
 
         # Создаем коммит
-        commit_message = f"Update site data and pages ({datetime.now(pytz.timezone(TIMEZONE)).strftime('%Y-%m-%d %H:%M')})"
         returncode, stdout, stderr = run_git_command(['git', 'commit', '-m', commit_message])
         if returncode != 0:
             logger.error(f"Failed to commit changes: {stderr}")
@@ -100,33 +137,307 @@ def update_git_repo():
         logger.error(f"Error updating git repository: {e}")
         return False
 
-async def update_site(days: int):
+async def collect_stage(data_collector, raw_data, backlog, days, raw_queue, cursors, check):
+    """
+    Этап сбора: необработанные и новые сообщения передаются в очередь обогащения.
+    Чаты, курсор которых не изменился, пропускаются, как в data_collector.main;
+    объявления на сайте проверяются на правки и удаление, только если check.
+    Возвращает новые курсоры чатов (None, если сбор не выполнялся)
+    """
+    # Сначала отдаем сообщения, которые уже собраны, но еще не обогащены
+    for listing in backlog:
+        await raw_queue.put(listing)
+
+    if not data_collector.has_credentials():
+        return None
+
+    cursors = dict(cursors or {})
+    client = await data_collector.connect_client()
+    try:
+        budget = data_collector.create_budget()
+        records = {listing["id"]: listing for listing in raw_data["listings"]}
+        fetched_ids = set()
+
+        async def collect_chat(chat_id):
+            latest_id = await data_collector.get_latest_message_id(client, chat_id, budget)
+            if cursors.get(chat_id) is not None and latest_id == cursors[chat_id]:
+                logger.info(f"No new messages in chat {chat_id} since the last run, skipping")
+                return
+            since_date = data_collector.get_since_date(raw_data, days, chat_id)
+            logger.info(f"Collecting chat {chat_id} since: {since_date.strftime('%Y-%m-%d %H:%M:%S')}")
+            async for message in data_collector.iter_messages(client, chat_id, since_date, budget):
+                fetched_ids.add(message.id)
+                record = records.get(message.id)
+                if record is not None:
+                    # Отредактированное сообщение обогащается и рендерится заново
+                    if data_collector.update_message(record, message):
+                        await raw_queue.put(message)
+                    continue
+                record = records[message.id] = message.to_dict()
+                raw_data["listings"].append(record)
+                await raw_queue.put(message)
+            cursors[chat_id] = latest_id
+
+        # Все чаты собираются конкурентно одним клиентом с общим бюджетом запросов
+        await asyncio.gather(*(collect_chat(chat_id) for chat_id in data_collector.TELEGRAM_CHATS))
+
+        # Объявления на сайте вне окна сбора проверяются на правки и удаление пакетами
+        if check:
+            edited, _ = await data_collector.check_chats(client, raw_data, fetched_ids, budget)
+            for record in edited:
+                await raw_queue.put(Listing.from_dict(record))
+    finally:
+        await client.disconnect()
+    return cursors
+
+async def enrich_stage(enrich_data, raw_queue, render_queue, newly_enriched, failed_ids):
+    """
+    Этап обогащения: вызовы OpenAI выполняются в отдельных потоках.
+    ID объявлений, которые не удалось обогатить, добавляются в failed_ids
+    """
+    while True:
+        listing = await raw_queue.get()
+        if listing is None:
+            break
+        try:
+            enriched = await asyncio.to_thread(enrich_data.enrich_listing, listing)
+        except Exception as e:
+            logger.error(f"Error processing listing {listing.id}: {e}")
+            failed_ids.append(listing.id)
+            continue
+        newly_enriched.append(enriched)
+        await render_queue.put(enriched)
+
+async def render_stage(generate_site, env, render_queue, last_updated, last_data_update):
+    """
+    Этап рендеринга: страница объявления генерируется сразу после обогащения
+    """
+    rendered_count = 0
+    while True:
+        listing = await render_queue.get()
+        if listing is None:
+            break
+        try:
+            # Подготовка меняет отметку новизны и пути к фото, поэтому работаем с копией
+            prepared = generate_site.prepare_listing(listing.copy())
+            await asyncio.to_thread(generate_site.render_listing, env, prepared, last_updated, last_data_update)
+            rendered_count += 1
+        except Exception as e:
+            logger.error(f"Error rendering listing {listing.id}: {e}")
+    logger.info(f"Rendered {rendered_count} listing pages")
+
+def get_match_ids(generate_site, enriched_data):
+    """
+    Id совпадений каждого объявления в обогащенных данных: id объявления -> список id
+    """
+    _, _, listings = generate_site.load_listings(enriched_data)
+    matches = generate_site.find_listing_matches(listings)
+    return {listing_id: [match.listing.id for match in items] for listing_id, items in matches.items()}
+
+async def run_pipeline(days: int, cursors: dict = None, full_render: bool = False, check: bool = True):
+    """
+    Конвейерный режим: сообщения передаются от сбора к обогащению и рендерингу
+    через ограниченные очереди, данные хранятся в памяти и сохраняются один раз.
+    full_render - перегенерировать все страницы объявлений (изменились шаблоны, код или дата).
+    Возвращает новые курсоры чатов и признак того, что все объявления обогащены без ошибок
+    """
+    data_collector = import_script("data_collector")
+    enrich_data = import_script("enrich_data")
+    generate_site = import_script("generate_site")
+
+    raw_data = data_collector.load_existing_data()
+    enriched_data = enrich_data.load_json_file(LISTINGS_ENRICHED_FILE)
+    backlog = enrich_data.find_new_listings(raw_data, enriched_data)
+    logger.info(f"Found {len(backlog)} collected but not enriched listings")
+
+    env = generate_site.create_environment()
+    last_updated = generate_site.get_formatted_now()
+    # Совпадения до обновления: страницы, у которых они изменятся, перегенерируются в конце
+    previous_matches = get_match_ids(generate_site, enriched_data)
+    # Время обработки фиксируется заранее, чтобы страницы, отрисованные по ходу
+    # конвейера, показывали то же время обновления данных, что и итоговый файл
+    processed_at = datetime.now(pytz.timezone(TIMEZONE))
+    last_data_update = generate_site.format_last_data_update(processed_at.isoformat())
+
+    raw_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    render_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    newly_enriched = []
+    failed_ids = []
+
+    renderer = asyncio.create_task(render_stage(generate_site, env, render_queue, last_updated, last_data_update))
+    enrichers = [
+        asyncio.create_task(enrich_stage(enrich_data, raw_queue, render_queue, newly_enriched, failed_ids))
+        for _ in range(ENRICH_WORKERS)
+    ]
+    try:
+        cursors = await collect_stage(data_collector, raw_data, backlog, days, raw_queue, cursors, check)
+    finally:
+        # Останавливаем этапы по очереди, дожидаясь обработки уже переданных сообщений
+        for _ in enrichers:
+            await raw_queue.put(None)
+        await asyncio.gather(*enrichers)
+        await render_queue.put(None)
+        await renderer
+
+    # Сохраняем данные один раз в конце
+    data_collector.save_data(raw_data)
+    deleted = enrich_data.get_deleted_ids(raw_data)
+    final_enriched_data, archived_data = enrich_data.merge_enriched(
+        enriched_data, newly_enriched, deleted, processed_at
+    )
+    enrich_data.save_results(final_enriched_data, archived_data)
+    logger.info(f"Enriched {len(newly_enriched)} new listings")
+    enrich_data.log_tier_stats()
+
+    # Страницы категорий и совпадения зависят от всех объявлений, поэтому генерируются в конце
+    listings_by_type, last_data_update, all_listings = generate_site.load_listings(final_enriched_data)
+    last_data_update = generate_site.format_last_data_update(last_data_update)
+    generate_site.render_category_pages(env, listings_by_type, last_updated, last_data_update)
+
+    # Перегенерируем страницы, у которых изменился список совпадений (появились новые,
+    # пропали истекшие или удаленные) или обновилось одно из совпадений, и новые
+    # страницы с совпадениями (или все страницы, если изменились шаблоны, код или дата)
+    new_ids = {listing.id for listing in newly_enriched}
+    matches = generate_site.find_listing_matches(all_listings)
+    for listing in all_listings:
+        listing_matches = matches.get(listing.id, [])
+        match_ids = [match.listing.id for match in listing_matches]
+        if (
+            full_render
+            or match_ids != previous_matches.get(listing.id, [])
+            or any(match_id in new_ids for match_id in match_ids)
+            or listing.id in new_ids and listing_matches
+        ):
+            generate_site.render_listing(env, listing, last_updated, last_data_update, listing_matches)
+    # Страницы и фото истекших и удаленных объявлений снимаются с сайта
+    generate_site.prune_output(all_listings)
+    generate_site.finalize_site()
+    return cursors, not failed_ids
+
+def get_render_fingerprint(today: str) -> str:
     """
-    Запускает полный процесс обновления сайта
+    Отпечаток входов генерации, кроме данных: шаблоны и статика, код скриптов и дата.
+    Если он изменился, страницы всех объявлений нужно перегенерировать
     """
+    return fingerprint(
+        tree_fingerprint([STATIC_DIR, os.path.dirname(os.path.abspath(__file__))]),
+        today
+    )
+
+def is_check_due(last_check_at: Optional[str], now: datetime) -> bool:
+    """
+    Пора ли проверять объявления на сайте на правки и удаление: проверка запросами
+    по всем активным объявлениям выполняется не чаще раза в CHECK_INTERVAL_HOURS
+    """
+    if not last_check_at:
+        return True
+    return now - datetime.fromisoformat(last_check_at) >= timedelta(hours=CHECK_INTERVAL_HOURS)
+
+def get_generate_fingerprint(today: str) -> str:
+    """
+    Отпечаток входов генерации сайта: обогащенные данные, шаблоны и статика, код скриптов.
+    Дата входит в отпечаток, потому что от нее зависят отметки новых объявлений
+    """
+    return fingerprint(
+        file_fingerprint(LISTINGS_ENRICHED_FILE),
+        tree_fingerprint([STATIC_DIR, os.path.dirname(os.path.abspath(__file__))]),
+        today
+    )
+
+async def update_site(days: int, pipeline: bool = False, profile: bool = False, force: bool = False,
+                      trace: bool = False):
+    """
+    Запускает полный процесс обновления сайта.
+    Этапы, входные данные которых не изменились с прошлого запуска, пропускаются (если не force).
+    Файл трассировки сохраняется только с trace или profile, сводка по этапам выводится всегда
+    """
+    start_time = datetime.now(pytz.timezone(TIMEZONE))
+    today = start_time.date().isoformat()
+    state = load_run_state(RUN_STATE_FILE)
+    fingerprints = state.setdefault('fingerprints', {})
+    run_name = start_time.strftime('%Y%m%d-%H%M%S')
+    check = force or is_check_due(state.get('last_check_at'), start_time)
+    tracer.enable(profile=profile, profile_dir=os.path.join(TRACES_DIR, f"profile-{run_name}"))
+
     try:
-        start_time = datetime.now(pytz.timezone(TIMEZONE))
         logger.info(f"Starting site update process at {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
 
-        # 1. Сбор данных
-        logger.info("Step 1: Collecting data...")
-        data_collector = import_script("data_collector")
-        await data_collector.main()
+        if pipeline:
+            # 1-3. Сбор, обогащение и генерация сайта одним конвейером
+            logger.info("Steps 1-3: Collecting, enriching and rendering in pipeline mode...")
+            with tracer.stage("pipeline"):
+                render_key = get_render_fingerprint(today)
+                state['collector_cursors'], enriched_all = await run_pipeline(
+                    days,
+                    cursors=None if force else state.get('collector_cursors'),
+                    full_render=force or fingerprints.get('render') != render_key,
+                    check=check
+                )
+                if check and state['collector_cursors'] is not None:
+                    state['last_check_at'] = start_time.isoformat()
+                # Конвейер выполняет все три этапа, поэтому их отпечатки обновляются, как в обычном режиме
+                enrich_data = import_script("enrich_data")
+                if enriched_all:
+                    fingerprints['enrich'] = fingerprint(sorted(enrich_data.get_pending_ids(), key=str), today)
+                else:
+                    # Необогащенные объявления обрабатываются заново при следующем запуске
+                    fingerprints.pop('enrich', None)
+                fingerprints['generate'] = get_generate_fingerprint(today)
+                fingerprints['render'] = render_key
+            save_run_state(RUN_STATE_FILE, state)
+        else:
+            # 1. Сбор данных (чаты, курсор которых не изменился, пропускаются;
+            # объявления на сайте проверяются на правки не чаще раза в CHECK_INTERVAL_HOURS)
+            logger.info("Step 1: Collecting data...")
+            with tracer.stage("collect"):
+                data_collector = import_script("data_collector")
+                state['collector_cursors'] = await data_collector.main(
+                    days, cursors=None if force else state.get('collector_cursors'), check=check
+                )
+                if check and state['collector_cursors'] is not None:
+                    state['last_check_at'] = start_time.isoformat()
+            save_run_state(RUN_STATE_FILE, state)
 
-        # 2. Обогащение данных
-        logger.info("Step 2: Enriching data...")
-        enrich_data = import_script("enrich_data")
-        enrich_data.process_data()
+            # 2. Обогащение данных (пропускается, если нет новых объявлений и день тот же)
+            with tracer.stage("enrich"):
+                enrich_data = import_script("enrich_data")
+                enrich_key = fingerprint(sorted(enrich_data.get_pending_ids(), key=str), today)
+                if not force and fingerprints.get('enrich') == enrich_key:
+                    logger.info("Step 2: No new listings to enrich, skipping")
+                else:
+                    logger.info("Step 2: Enriching data...")
+                    if enrich_data.process_data():
+                        fingerprints['enrich'] = fingerprint(sorted(enrich_data.get_pending_ids(), key=str), today)
+                    else:
+                        # Необогащенные объявления обрабатываются заново при следующем запуске
+                        fingerprints.pop('enrich', None)
+            save_run_state(RUN_STATE_FILE, state)
 
-        # 3. Генерация сайта
-        logger.info("Step 3: Generating site...")
-        generate_site = import_script("generate_site")
-        generate_site.generate_site()
+            # 3. Генерация сайта (пропускается, если данные, шаблоны и код не изменились)
+            with tracer.stage("generate"):
+                generate_key = get_generate_fingerprint(today)
+                if not force and fingerprints.get('generate') == generate_key:
+                    logger.info("Step 3: Site inputs unchanged, skipping generation")
+                else:
+                    logger.info("Step 3: Generating site...")
+                    generate_site = import_script("generate_site")
+                    generate_site.generate_site()
+                    fingerprints['generate'] = generate_key
+                    fingerprints['render'] = get_render_fingerprint(today)
+            save_run_state(RUN_STATE_FILE, state)
 
-        # 4. Обновление Git репозитория
-        logger.info("Step 4: Updating git repository...")
-        if not update_git_repo():
-            logger.warning("Failed to update git repository")
+        # 4. Обновление Git репозитория (пропускается, если docs/ не изменилась)
+        with tracer.stage("git"):
+            docs_key = tree_fingerprint([OUTPUT_DIR])
+            if not force and fingerprints.get('publish') == docs_key:
+                logger.info("Step 4: Site output unchanged, skipping git update")
+            else:
+                logger.info("Step 4: Updating git repository...")
+                if update_git_repo():
+                    fingerprints['publish'] = docs_key
+                else:
+                    logger.warning("Failed to update git repository")
+        save_run_state(RUN_STATE_FILE, state)
 
         end_time = datetime.now(pytz.timezone(TIMEZONE))
         duration = end_time - start_time
@@ -136,6 +447,15 @@ async def update_site(days: int):
         logger.error(f"Error during site update: {e}")
         raise
 
+    finally:
+        # Сохраняем трассировку (открывается в chrome://tracing), если ее запросили,
+        # и выводим сводку по этапам
+        if trace or profile:
+            trace_file = os.path.join(TRACES_DIR, f"trace-{run_name}.json")
+            tracer.write_trace(trace_file)
+            logger.info(f"Trace saved to {trace_file}")
+        logger.info(f"Stage summary:\n{tracer.format_summary()}")
+
 def main():
     """
     Точка входа в скрипт
@@ -143,10 +463,24 @@ def main():
     parser = argparse.ArgumentParser(description='Обновление сайта с объявлениями')
     parser.add_argument('--days', type=int, default=90,
                       help='За сколько последних дней собирать данные (по умолчанию: 9)')
+    parser.add_argument('--pipeline', action='store_true',
+                      help='Запустить сбор, обогащение и генерацию конвейером через очереди в памяти')
+    parser.add_argument('--profile', action='store_true',
+                      help='Профилировать каждый этап через cProfile (файлы .prof в data/traces)')
+    parser.add_argument('--trace', action='store_true',
+                      help='Сохранить трассировку этапов (chrome://tracing) в data/traces')
+    parser.add_argument('--force', action='store_true',
+                      help='Выполнить все этапы, даже если их входные данные не изменились')
     args = parser.parse_args()
 
     try:
-        asyncio.run(update_site(args.days))
+        # Блокировка не дает перекрывающимся запускам (например, из cron) одновременно менять данные
+        with RunLock(RUN_LOCK_FILE):
+            asyncio.run(update_site(
+                args.days, pipeline=args.pipeline, profile=args.profile, force=args.force, trace=args.trace
+            ))
+    except RunLockError as e:
+        logger.warning(f"{e}, exiting")
     except KeyboardInterrupt:
         logger.info("Process interrupted by user")
     except Exception as e:
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Скрипт для загрузки локальных копий front-end зависимостей в static/vendor
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.config import VENDOR_DIR, VENDOR_CSS, VENDOR_JS, VENDOR_FONTS
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def download_vendor_assets(force: bool = False) -> bool:
+    """
+    Скачивает зависимости, которых еще нет в VENDOR_DIR
+    """
+    success = True
+    for rel_path, url in VENDOR_CSS + VENDOR_JS + VENDOR_FONTS:
+        path = os.path.join(VENDOR_DIR, rel_path)
+        if os.path.exists(path) and not force:
+            continue
+        try:
+            response = requests.get(url, timeout=30)
+            response.raise_for_status()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(response.content)
+            logger.info(f"Downloaded {url} -> {os.path.relpath(path, VENDOR_DIR)}")
+        except Exception as e:
+            logger.error(f"Error downloading {url}: {e}")
+            success = False
+    return success
+
+def main():
+    """
+    Точка входа в скрипт
+    """
+    parser = argparse.ArgumentParser(description='Загрузка front-end зависимостей в static/vendor')
+    parser.add_argument('--force', action='store_true', help='Перезаписать уже скачанные файлы')
+    args = parser.parse_args()
+
+    if not download_vendor_assets(force=args.force):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const cityInput = document.getElementById('city');
+    const dateRangeInput = document.getElementById('date-range');
+    const sortSelect = document.getElementById('sort');
+    const searchInput = document.getElementById('search');
+    const listings = document.getElementById('listings');
+
+    // Скрипт подключается на всех страницах, но нужен только на страницах со списком объявлений
+    if (!listings) return;
+
+    // Инициализация календаря
+    let datePicker = new Litepicker({
+        element: dateRangeInput,
+        format: 'DD.MM.YYYY',
+        lang: 'ru-RU',
+        numberOfMonths: 2,
+        numberOfColumns: 2,
+        singleMode: false,
+        autoApply: true,
+        showTooltip: true,
+        tooltipText: {
+            one: 'день',
+            few: 'дня',
+            many: 'дней',
+            other: 'дней'
+        },
+        setup: (picker) => {
+            picker.on('selected', (date1, date2) => {
+                filterListings();
+            });
+            picker.on('clear', () => {
+                filterListings();
+            });
+        }
+    });
+
+    // Индекс периодов аренды, построенный при генерации страницы
+    const dateIndex = JSON.parse(document.getElementById('date-index').textContent);
+    const millisecondsPerDay = 1000 * 60 * 60 * 24;
+
+    function toDayNumber(date) {
+        // Переводим дату календаря в номер дня от 01.01.1970, как в индексе
+        const jsDate = typeof date.toJSDate === 'function' ? date.toJSDate() : date;
+        return Math.floor(Date.UTC(jsDate.getFullYear(), jsDate.getMonth(), jsDate.getDate()) / millisecondsPerDay);
+    }
+
+    function monthKey(dayNumber) {
+        const date = new Date(dayNumber * millisecondsPerDay);
+        return date.getUTCFullYear() * 12 + date.getUTCMonth();
+    }
+
+    function queryDateIndex(start, end) {
+        // Возвращает карточки, пересекающиеся с периодом, и количество дней пересечения.
+        // Проверяются только интервалы из корзин выбранных месяцев и интервалы без дат
+        // (если даты не указаны, считаем что период бесконечный, пересечение равно -1)
+        const startDay = toDayNumber(start);
+        const endDay = toDayNumber(end);
+        const matches = new Map();
+        const seen = new Set();
+
+        const check = (position) => {
+            if (seen.has(position)) return;
+            seen.add(position);
+            const itemStart = dateIndex.starts[position];
+            const itemEnd = dateIndex.ends[position];
+            if ((itemStart !== null && itemStart > endDay) || (itemEnd !== null && itemEnd < startDay)) return;
+
+            let score = -1;
+            if (itemStart !== null && itemEnd !== null) {
+                score = Math.min(endDay, itemEnd) - Math.max(startDay, itemStart) + 1;
+            }
+            const key = dateIndex.keys[position];
+            if (!matches.has(key) || matches.get(key) < score) {
+                matches.set(key, score);
+            }
+        };
+
+        for (let month = monthKey(startDay); month <= monthKey(endDay); month++) {
+            (dateIndex.buckets[month] || []).forEach(check);
+        }
+        dateIndex.open.forEach(check);
+        return matches;
+    }
+
+    function getSelectedMatches() {
+        if (!datePicker.getStartDate() || !datePicker.getEndDate()) return null;
+        return queryDateIndex(datePicker.getStartDate(), datePicker.getEndDate());
+    }
+
+    // Добавляем обработчик для кнопки очистки дат
+    document.getElementById('clear-dates').addEventListener('click', function() {
+        datePicker.clearSelection();
+    });
+
+    // Полнотекстовый поиск по статическому индексу
+    const searchEngine = new SearchEngine('search/');
+    let searchMatches = null;  // slug -> релевантность; null, если запрос пустой
+    let searchTimer = null;
+    let searchRequest = 0;
+
+    async function runSearch() {
+        const request = ++searchRequest;
+        const query = searchInput.value.trim();
+        let matches = null;
+        if (SearchEngine.tokenize(query).length > 0) {
+            try {
+                const results = await searchEngine.search(query);
+                matches = new Map(results.map(result => [result.slug, result.score]));
+            } catch (e) {
+                console.error('Search failed', e);
+            }
+        }
+        // Ответ на устаревший запрос не применяем
+        if (request !== searchRequest) return;
+        searchMatches = matches;
+        filterListings();
+        if (sortSelect.value === 'relevance') sortListings();
+    }
+
+    searchInput.addEventListener('input', function() {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(runSearch, 200);
+    });
+
+    // Изменяем обработчик для select города
+    cityInput.addEventListener('change', filterListings);
+
+    function filterListings() {
+        const cityValue = cityInput.value;
+        
+        // Получаем объявления, подходящие под выбранные даты, из индекса
+        const dateMatches = getSelectedMatches();
+        
+        const cards = document.querySelectorAll('.listing');
+        let visibleCount = 0;
+        
+        cards.forEach(card => {
+            let showCard = true;
+            
+            // Фильтр по городу (по id из справочника городов)
+            if (cityValue) {
+                showCard = card.dataset.city === cityValue;
+            }
+            
+            // Фильтр по датам
+            if (showCard && dateMatches) {
+                showCard = dateMatches.has(parseInt(card.dataset.index));
+            }
+
+            // Фильтр по тексту
+            if (showCard && searchMatches) {
+                showCard = searchMatches.has(card.dataset.slug);
+            }
+            
+            card.style.display = showCard ? '' : 'none';
+            if (showCard) visibleCount++;
+        });
+
+        // Добавляем сообщение, если нет результатов
+        const noResultsMessage = document.getElementById('no-results-message');
+        if (visibleCount === 0) {
+            if (!noResultsMessage) {
+                const message = document.createElement('div');
+                message.id = 'no-results-message';
+                message.className = 'alert alert-info mt-3';
+                message.textContent = 'Нет объявлений, соответствующих выбранным фильтрам';
+                listings.parentNode.appendChild(message);
+            }
+        } else if (noResultsMessage) {
+            noResultsMessage.remove();
+        }
+    }
+
+    function extractPrice(priceElement) {
+        if (!priceElement) return Infinity;
+        const priceText = priceElement.textContent.trim();
+        const match = priceText.match(/(\d+(?:\s\d+)*)/);
+        if (!match) return Infinity;
+        return parseInt(match[1].replace(/\s/g, ''));
+    }
+
+    function sortListings() {
+        const cards = Array.from(document.querySelectorAll('.listing'));
+        const sortOrder = sortSelect.value;
+        const dateMatches = sortOrder === 'date-match' ? getSelectedMatches() : null;
+        
+        cards.sort((a, b) => {
+            if (sortOrder === 'date-desc' || sortOrder === 'date-asc') {
+                const dateA = new Date(a.dataset.date + 'Z');
+                const dateB = new Date(b.dataset.date + 'Z');
+                return sortOrder === 'date-desc' ? dateB - dateA : dateA - dateB;
+            }
+            else if (sortOrder === 'price-asc') {
+                const priceA = extractPrice(a.querySelector('.badge.bg-success'));
+                const priceB = extractPrice(b.querySelector('.badge.bg-success'));
+                return priceA - priceB;
+            }
+            else if (sortOrder === 'date-match' && dateMatches) {
+                const scoreA = dateMatches.get(parseInt(a.dataset.index)) || 0;
+                const scoreB = dateMatches.get(parseInt(b.dataset.index)) || 0;
+                return scoreB - scoreA;
+            }
+            else if (sortOrder === 'relevance' && searchMatches) {
+                const scoreA = searchMatches.get(a.dataset.slug) || 0;
+                const scoreB = searchMatches.get(b.dataset.slug) || 0;
+                return scoreB - scoreA;
+            }
+            return 0;
+        });
+        
+        cards.forEach(card => listings.appendChild(card));
+    }
+
+    // Инициализация всплывающих подсказок для текста
+    const textPreviews = document.querySelectorAll('.text-preview');
+    textPreviews.forEach(preview => {
+        const fullText = preview.textContent;
+        if (fullText.length > 150) {
+            preview.textContent = fullText.substring(0, 150) + '...';
+            preview.title = fullText;
+        }
+    });
+
+    cityInput.addEventListener('change', filterListings);
+    sortSelect.addEventListener('change', sortListings);
+});
@@ -0,0 +1,122 @@
+// Клиентский поиск по статическому индексу (см. scripts/search_index.py).
+// Нормализация слов должна совпадать с tokenize/normalize_token в Python.
+const SearchEngine = (function() {
+    const WORD_RE = /[0-9a-zа-я]+/g;
+    const RU_ENDINGS = [
+        'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+        'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ой', 'ом', 'ем', 'ам', 'ям',
+        'ах', 'ях', 'ов', 'ев', 'ей', 'ую', 'юю', 'ию', 'ия', 'ье', 'ья',
+        'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й'
+    ].sort((a, b) => b.length - a.length);
+    const EN_ENDINGS = ['ing', 'ed', 's'];
+    const STOP_WORDS = new Set([
+        'на', 'по', 'до', 'за', 'от', 'из', 'не', 'но', 'то', 'же', 'ли', 'бы', 'во', 'со',
+        'the', 'and', 'for', 'to', 'in', 'on', 'of', 'at', 'is', 'it', 'or', 'an'
+    ]);
+    const MIN_TOKEN_LENGTH = 2;
+    // Совпадение по префиксу весит меньше точного совпадения терма
+    const PREFIX_WEIGHT = 0.5;
+    // Параметры BM25
+    const K1 = 1.2;
+    const B = 0.75;
+
+    function normalizeToken(token) {
+        if (/^[0-9]+$/.test(token)) return token;
+        if (token[0] >= 'a' && token[0] <= 'z') {
+            for (const ending of EN_ENDINGS) {
+                if (token.endsWith(ending) && !token.endsWith('ss') && token.length - ending.length >= 3) {
+                    return token.slice(0, -ending.length);
+                }
+            }
+            return token;
+        }
+        for (const ending of RU_ENDINGS) {
+            if (token.endsWith(ending) && token.length - ending.length >= 3) {
+                return token.slice(0, -ending.length);
+            }
+        }
+        return token;
+    }
+
+    function tokenize(text) {
+        const words = text.toLowerCase().replace(/ё/g, 'е').match(WORD_RE) || [];
+        return words
+            .filter(word => word.length >= MIN_TOKEN_LENGTH && !STOP_WORDS.has(word))
+            .map(normalizeToken);
+    }
+
+    function shardKey(term, prefixLength) {
+        return Array.from(term.slice(0, prefixLength))
+            .map(char => char.codePointAt(0).toString(16).padStart(4, '0'))
+            .join('');
+    }
+
+    class SearchEngine {
+        constructor(baseUrl) {
+            this.baseUrl = baseUrl;
+            this.meta = null;
+            this.shards = new Map();
+        }
+
+        async loadMeta() {
+            if (!this.meta) {
+                const response = await fetch(this.baseUrl + 'docs.json');
+                this.meta = await response.json();
+            }
+            return this.meta;
+        }
+
+        loadShard(key) {
+            // Загруженные шарды (и отсутствующие) запоминаются на время жизни страницы
+            if (!this.shards.has(key)) {
+                this.shards.set(key, fetch(this.baseUrl + key + '.json')
+                    .then(response => response.ok ? response.json() : {})
+                    .catch(() => ({})));
+            }
+            return this.shards.get(key);
+        }
+
+        // Возвращает slug объявлений с релевантностью, отсортированные по убыванию.
+        // Документ должен содержать все слова запроса (целиком или как префикс терма)
+        async search(query) {
+            const terms = tokenize(query);
+            if (terms.length === 0) return [];
+            const meta = await this.loadMeta();
+            const shards = await Promise.all(terms.map(term => this.loadShard(shardKey(term, meta.prefix))));
+
+            let scores = null;
+            terms.forEach((term, i) => {
+                const termScores = new Map();
+                for (const [indexTerm, postings] of Object.entries(shards[i])) {
+                    if (!indexTerm.startsWith(term)) continue;
+                    const weight = indexTerm === term ? 1 : PREFIX_WEIGHT;
+                    const documentCount = postings.length / 2;
+                    const idf = Math.log(1 + (meta.count - documentCount + 0.5) / (documentCount + 0.5));
+                    for (let j = 0; j < postings.length; j += 2) {
+                        const doc = postings[j];
+                        const tf = postings[j + 1];
+                        const norm = 1 - B + B * meta.lengths[doc] / (meta.avg_length || 1);
+                        const score = weight * idf * tf * (K1 + 1) / (tf + K1 * norm);
+                        termScores.set(doc, Math.max(termScores.get(doc) || 0, score));
+                    }
+                }
+                if (scores === null) {
+                    scores = termScores;
+                } else {
+                    const merged = new Map();
+                    scores.forEach((score, doc) => {
+                        if (termScores.has(doc)) merged.set(doc, score + termScores.get(doc));
+                    });
+                    scores = merged;
+                }
+            });
+
+            return Array.from(scores.entries())
+                .map(([doc, score]) => ({ slug: meta.docs[doc], score }))
+                .sort((a, b) => b.score - a.score);
+        }
+    }
+
+    SearchEngine.tokenize = tokenize;
+    return SearchEngine;
+})();